@@ -4,16 +4,29 @@
 # https://github.com/bnomis/ab2cb
 # (c) Simon Blanchard
 
+import collections
+import contextlib
+import functools
+import io
+import itertools
 import json
+import mmap
 import os
 import os.path
 import re
 import sys
-import copy
 
+from .domains import elemhide_if_domains, elemhide_unless_domains, filter_domains
+# punycode was defined here before it moved to domains.py
+from .domains import punycode  # noqa: F401
 from .logger import error, init_logging
+from .rejection import RejectionLedger, rejection
+from .rules import BLOCK, FIRST_PARTY, IGNORE_PREVIOUS_RULES, MATCH_ALL, THIRD_PARTY, Rule, css_display_none, rule_from_json
+from .tokenizer import split_elemhide, split_options
+from .writer import RuleWriter
 
 # lifted from ABP/filterClasses.js
+# elemhideRegExp and optionsRegExp are the reference for tokenizer.py
 elemhideRegExp = re.compile(r'^([^\/\*\|\@"!]*?)#(\@)?(?:([\w\-]+|\*)((?:\([\w\-]+(?:[$^*]?=[^\(\)"]*)?\))*)|#([^{}]+))$')
 regexpRegExp = re.compile(r'^(@@)?\/.*\/(?:\$~?[\w\-]+(?:=[^,\s]+)?(?:,~?[\w\-]+(?:=[^,\s]+)?)*)?$')
 optionsRegExp = re.compile(r'\$(~?[\w\-]+(?:=[^,]+)?(?:,~?[\w\-]+(?:=[^,\s]+)?)*)$')
@@ -58,6 +71,59 @@ RegExpFilter_prototype_contentType = 0x7FFFFFFF
 RegExpFilter_prototype_contentType &= ~(RegExpFilter_typeMap['DOCUMENT'] | RegExpFilter_typeMap['ELEMHIDE'] | RegExpFilter_typeMap['POPUP'])
 
 
+# content type bits that map to a Safari resource-type, in output order
+resource_type_bits = [
+    (RegExpFilter_typeMap['DOCUMENT'] | RegExpFilter_typeMap['SUBDOCUMENT'], 'document'),
+    (RegExpFilter_typeMap['IMAGE'], 'image'),
+    (RegExpFilter_typeMap['STYLESHEET'], 'style-sheet'),
+    (RegExpFilter_typeMap['SCRIPT'], 'script'),
+    (RegExpFilter_typeMap['FONT'], 'font'),
+    (RegExpFilter_typeMap['XMLHTTPREQUEST'], 'raw'),
+    (RegExpFilter_typeMap['MEDIA'], 'media'),
+    (RegExpFilter_typeMap['POPUP'], 'popup'),
+]
+
+resource_type_mask = 0
+for bits, name in resource_type_bits:
+    resource_type_mask |= bits
+
+
+def make_resource_type_table():
+    # every combination of the mapped bits -> tuple of resource-type names
+    table = {}
+    bits = [1 << i for i in range(32) if resource_type_mask & (1 << i)]
+    for combination in range(1 << len(bits)):
+        contentType = 0
+        for i, bit in enumerate(bits):
+            if combination & (1 << i):
+                contentType |= bit
+        table[contentType] = tuple(name for mask, name in resource_type_bits if contentType & mask)
+    return table
+
+
+resource_type_table = make_resource_type_table()
+
+DOCUMENT = resource_type_table[RegExpFilter_typeMap['DOCUMENT']]
+
+
+# lines per cache lookup batch when converting without a pool
+cache_chunk_size = 500
+
+# lines looked up at a time before the unknown ones are converted
+lookup_chunk_size = 10000
+
+# bytes of a mapped input file split into lines at a time
+map_chunk_size = 1 << 20
+
+# the start of a line that is a header or comment, or that starts with
+# something str.strip removes, which may hide one: ascii whitespace, and
+# the first bytes of the utf-8 encoding of other whitespace
+line_start = re.compile(rb'\n[!\[ \t\r\x0b\x0c\x1c-\x1f\xc2\xe1-\xe3]')
+
+# the end of a line in text mode: \n, \r\n or a lone \r
+line_end = re.compile(rb'[\r\n]')
+
+
 # clean up a regex
 regex_cleaners = [
     (re.compile(r'\*+'), r"*"),    # remove multiple wildcards
@@ -71,8 +137,43 @@ regex_cleaners = [
 ]
 
 
+# single pass equivalent of regex_cleaners: escape special symbols and turn wildcards into .*
+url_filter_escapes = str.maketrans(dict([(c, '\\' + c) for c in '.+?^${}()|[]\\'] + [('*', '.*')]))
+multiple_wildcards = re.compile(r'\*\*+')
+
+
+def translate_url_filter(source):
+    # source is the filter with any leading | or || and one trailing ^ removed
+    if '**' in source:
+        source = multiple_wildcards.sub('*', source)
+    if '|' not in source:
+        # fast path for ||host^, ||host/path and plain substrings
+        return source.translate(url_filter_escapes)
+    if source[-2:] == '^|':
+        # remove anchors following separator placeholder
+        source = source[:-1]
+    head = ''
+    tail = ''
+    if source[:1] == '|':
+        # anchor at expression start
+        head = '^'
+        source = source[1:]
+    if source[-1:] == '|':
+        # anchor at expression end
+        tail = '$'
+        source = source[:-1]
+    return head + source.translate(url_filter_escapes) + tail
+
+
+def reference_url_filter(source):
+    # the original substitution chain, kept to check translate_url_filter against
+    for r in regex_cleaners:
+        source = r[0].sub(r[1], source)
+    return source
+
+
 def is_ascii(s):
-    return all(ord(c) < 128 for c in s)
+    return s.isascii()
 
 
 def writerr(options, line, exception=None, set_exit_status=True):
@@ -83,6 +184,14 @@ def writerr(options, line, exception=None, set_exit_status=True):
         error(line, exc_info=True)
 
 
+def report(options, line):
+    # progress messages must not end up inside json written to stdout
+    if options.output:
+        options.stdout.write(line + '\n')
+    else:
+        options.stderr.write(line + '\n')
+
+
 def writerr_file_access(options, line, exception=None):
     if not options.suppress_file_access_errors:
         writerr(options, line, exception=exception, set_exit_status=False)
@@ -121,33 +230,25 @@ def check_file_access(options, path):
 
 def elem_hide_from_text(text, domain, isException, tagName, attrRules, selector):
     #print("Hide: '%s' '%s' '%s' '%s' '%s' '%s'" % (text, domain, isException, tagName, attrRules, selector))
-    filter = {
-        'trigger': {
-            'url-filter': '.*'
-        },
-        'action': {
-            'type': 'css-display-none',
-            'selector': selector
-        }
-    }
+    filter = Rule(MATCH_ALL, css_display_none(selector))
     if domain:
         if isException:
-            filter['trigger']['unless-domain'] = domain.split(',')
+            filter.unless_domain = elemhide_unless_domains(domain)
         else:
-            filter['trigger']['if-domain'] = domain.lower().split(',')
+            filter.if_domain = elemhide_if_domains(domain)
 
     return [filter]
 
 
-def regex_filters(origText, regexpSource, contentType, matchCase, domains, firstParty, thirdParty, sitekeys, isException):
+def regex_filters(origText, regexpSource, contentType, matchCase, domains, firstParty, thirdParty, sitekeys, isException, translate=translate_url_filter):
     anchor = False
     requires_scheme = False
     length = len(regexpSource)
     if length == 0:
-        return None
+        return rejection('empty-filter')
     # already a regex
     if length >= 2 and regexpSource[0] == '/' and regexpSource[-1] == '/':
-        return None
+        return rejection('regex-filter')
     else:
         regex = regexpSource
         if regex[0:2] == '||':
@@ -158,11 +259,7 @@ def regex_filters(origText, regexpSource, contentType, matchCase, domains, first
             anchor = True
         if len(regex) > 0 and regex[-1] == '^':
             regex = regex[0:-1]
-        for r in regex_cleaners:
-            #print('In: %s' % regex)
-            regex = r[0].sub(r[1], regex)
-            #print('Out: %s' % regex)
-        #print('Before: %s  After: %s' % (regexpSource, regex))
+        regex = translate(regex)
 
     if regex[0:3] != '://' and requires_scheme:
         regex = '^[^:]+:(//)?([^/]+\\.)?' + regex
@@ -171,114 +268,140 @@ def regex_filters(origText, regexpSource, contentType, matchCase, domains, first
         regex = "^" + regex
 
     if len(regex) == 0:
-        print("Skipping \"%s\" due to empty post-processed regex url-filter" % origText)
-        return None
+        return rejection('empty-url-filter')
 
     if not is_ascii(regex):
-        return None
+        return rejection('non-ascii')
 
-    filter_obj = {
-        'trigger': {
-            'url-filter': regex
-        },
-        'action': {
-            'type': 'block'
-        }
-    }
+    filter_obj = Rule(regex, IGNORE_PREVIOUS_RULES if isException else BLOCK)
     if matchCase:
-        filter_obj['trigger']['url-filter-is-case-sensitive'] = True
+        filter_obj.case_sensitive = True
     if thirdParty:
-        filter_obj['trigger']['load-type'] = ['third-party']
+        filter_obj.load_type = THIRD_PARTY
     if firstParty:
-        filter_obj['trigger']['load-type'] = ['first-party']
+        filter_obj.load_type = FIRST_PARTY
     if domains:
-        ifd = []
-        unl = []
-        domain_list = filter(len, domains.lower().split('|'))
-        for d in domain_list:
-            # NOTE: `*` is not regex format. Per docs:
-            # "Add * in front to match domain and subdomains."
-            # https://developer.apple.com/documentation/safariservices/creating_a_content_blocker
-            if d[0] == '~':
-                encoded = punycode(d[1:])
-                if not encoded:
-                    return None
-                unl.append('*' + encoded)
-            else:
-                encoded = punycode(d)
-                if not encoded:
-                    return None
-                ifd.append('*' + encoded)
-        if ifd and unl:
-            # Invalid rule, needs a split
+        parsed = filter_domains(domains)
+        if not parsed:
             # print('Invalid: %s (Needs rule split due to mixed domain restrictions)' % origText)
-            return None
-        else:
-            if ifd:
-                filter_obj['trigger']['if-domain'] = ifd
-            if unl:
-                filter_obj['trigger']['unless-domain'] = unl
+            return parsed
+        filter_obj.if_domain, filter_obj.unless_domain = parsed
 
     if contentType:
         if contentType & RegExpFilter_typeMap['DOCUMENT'] and isException:
             # print('Invalid: %s ($document exceptions are not supported)' % origText)
-            return None
+            return rejection('document-exception')
 
-        rt = []
-        if contentType & RegExpFilter_typeMap['DOCUMENT'] or contentType & RegExpFilter_typeMap['SUBDOCUMENT']:
-            rt.append('document')
-        if contentType & RegExpFilter_typeMap['IMAGE']:
-            rt.append('image')
-        if contentType & RegExpFilter_typeMap['STYLESHEET']:
-            rt.append('style-sheet')
-        if contentType & RegExpFilter_typeMap['SCRIPT']:
-            rt.append('script')
-        if contentType & RegExpFilter_typeMap['FONT']:
-            rt.append('font')
-        if contentType & RegExpFilter_typeMap['XMLHTTPREQUEST']:
-            rt.append('raw')
-        if contentType & RegExpFilter_typeMap['MEDIA']:
-            rt.append('media')
-        if contentType & RegExpFilter_typeMap['POPUP']:
-            rt.append('popup')
+        rt = resource_type_table[contentType & resource_type_mask]
         if rt:
-            filter_obj['trigger']['resource-type'] = rt
+            filter_obj.resource_type = rt
 
         if len(rt) > 1 and 'document' in rt and not (firstParty or thirdParty):
             # Split the rule up into 2 to only block third-party documents
-            splitFilter = copy.deepcopy(filter_obj)
-            splitFilter['trigger']['resource-type'] = ['document']
-            splitFilter['trigger']['load-type'] = ['third-party']
-            filter_obj['trigger']['resource-type'] = rt[1:]
-            print("Split %s into 2 rules" % origText)
+            splitFilter = filter_obj.copy(resource_type=DOCUMENT, load_type=THIRD_PARTY, load_type_last=True)
+            filter_obj.resource_type = rt[1:]
             return [filter_obj, splitFilter]
 
     return [filter_obj]
 
 
-def blocking_filters(origText, regexpSource, contentType, matchCase, domains, firstParty, thirdParty, sitekeys, collapse):
+def blocking_filters(origText, regexpSource, contentType, matchCase, domains, firstParty, thirdParty, sitekeys, collapse, translate=translate_url_filter):
     #print("Blocking: '%s' '%s' '%s' '%s' '%s' '%s' '%s' '%s'" % (origText, regexpSource, contentType, matchCase, domains, thirdParty, sitekeys, collapse))
-    return regex_filters(origText, regexpSource, contentType, matchCase, domains, firstParty, thirdParty, sitekeys, False)
+    return regex_filters(origText, regexpSource, contentType, matchCase, domains, firstParty, thirdParty, sitekeys, False, translate)
 
 
-def whitelist_filters(origText, regexpSource, contentType, matchCase, domains, firstParty, thirdParty, sitekeys):
+def whitelist_filters(origText, regexpSource, contentType, matchCase, domains, firstParty, thirdParty, sitekeys, translate=translate_url_filter):
     #print("White: '%s' '%s' '%s' '%s' '%s' '%s' '%s'" % (origText, regexpSource, contentType, matchCase, domains, thirdParty, sitekeys))
-    filters = regex_filters(origText, regexpSource, contentType, matchCase, domains, firstParty, thirdParty, sitekeys, True)
-    if filters:
-        for f in filters:
-            f['action']['type'] = 'ignore-previous-rules'
-    return filters
+    return regex_filters(origText, regexpSource, contentType, matchCase, domains, firstParty, thirdParty, sitekeys, True, translate)
+
 
 # Rules that should default to third-party load type unless specified via $first-party/$~third-party
-DefaultThirdPartyRules = [
+DefaultThirdPartyRules = frozenset([
     "&adurl=",
     "&adgroupid=",
     "&AdType=",
     "/ad1.$domain=~ad1.de|~ad1.in|~vereinslinie.de",
-]
+])
+
+
+ParsedOptions = collections.namedtuple('ParsedOptions', 'contentType matchCase domains sitekeys thirdParty firstParty collapse')
+
+no_options = ParsedOptions(None, None, None, None, None, None, None)
+
+
+# a few hundred distinct option strings cover most lines of a real list
+@functools.lru_cache(maxsize=4096)
+def parse_options(option_text):
+    # returns ParsedOptions for the text after the $, or None if an option is not supported
+    contentType = None
+    matchCase = None
+    domains = None
+    sitekeys = None
+    thirdParty = None
+    firstParty = None
+    collapse = None
+
+    for option in option_text.upper().split(","):
+        value = None
+        separatorIndex = option.find("=")
+        if separatorIndex >= 0:
+            value = option[separatorIndex + 1:]
+            option = option[:separatorIndex]
+
+        option = option.replace('-', "_")
+        if option in RegExpFilter_typeMap and option not in UnsupportedContentTypes:
+            if contentType is None:
+                contentType = 0
+            contentType |= RegExpFilter_typeMap[option]
+
+        elif option[0] == "~" and option[1:] in RegExpFilter_typeMap:
+            if contentType is None:
+                contentType = RegExpFilter_prototype_contentType
+            contentType &= ~RegExpFilter_typeMap[option[1:]]
+
+        elif option == "MATCH_CASE":
+            matchCase = True
+
+        elif option == "~MATCH_CASE":
+            matchCase = False
+
+        elif option == "DOMAIN" and value:
+            domains = value
+
+        elif option == "THIRD_PARTY" or option == "~FIRST_PARTY":
+            thirdParty = True
+            firstParty = False
+
+        elif option == "~THIRD_PARTY" or option == "FIRST_PARTY":
+            thirdParty = False
+            firstParty = True
+
+        elif option == "COLLAPSE":
+            collapse = True
+
+        elif option == "~COLLAPSE":
+            collapse = False
+
+        elif option == "SITEKEY" and value:
+            sitekeys = value
+
+        else:
+            return None
+
+    return ParsedOptions(contentType, matchCase, domains, sitekeys, thirdParty, firstParty, collapse)
+
+
+@functools.lru_cache(maxsize=1024)
+def option_rejection(option_text):
+    # why parse_options refused option_text
+    for option in option_text.upper().split(","):
+        option = option.split("=", 1)[0].replace('-', "_")
+        if option in UnsupportedContentTypes:
+            return rejection('unsupported-type')
+    return rejection('unknown-option')
 
 
-def regex_from_text(text):
+def regex_from_text(text, translate=translate_url_filter):
     origText = text
     blocking = True
     # whitelist?
@@ -287,107 +410,107 @@ def regex_from_text(text):
         blocking = False
         text = text[2:]
 
-    # set up values for options if set
-    contentType = None
-    matchCase = None
-    domains = None
-    sitekeys = None
     thirdParty = text in DefaultThirdPartyRules
     firstParty = None
-    collapse = None
 
-    match = None
+    parsed = no_options
     dollar_pos = text.find('$')
     if dollar_pos >= 0:
-        match = optionsRegExp.search(text)
-
-    # read the options
-    if match:
-        options = match.group(1).upper().split(",")
-        text = text[:dollar_pos]
-        for option in options:
-            value = None
-            separatorIndex = option.find("=")
-            if separatorIndex >= 0:
-                try:
-                    value = option[separatorIndex + 1:]
-                except:
-                    print('bad value')
-                    pass
-                option = option[:separatorIndex]
-
-            option = option.replace('-', "_")
-            if option in RegExpFilter_typeMap and option not in UnsupportedContentTypes:
-                if contentType is None:
-                    contentType = 0
-                contentType |= RegExpFilter_typeMap[option]
-
-            elif option[0] == "~" and option[1:] in RegExpFilter_typeMap:
-                if contentType is None:
-                    contentType = RegExpFilter_prototype_contentType
-                contentType &= ~RegExpFilter_typeMap[option[1:]]
-
-            elif option == "MATCH_CASE":
-                matchCase = True
-
-            elif option == "~MATCH_CASE":
-                matchCase = False
-
-            elif option == "DOMAIN" and value:
-                domains = value
-
-            elif option == "THIRD_PARTY" or option == "~FIRST_PARTY":
-                thirdParty = True
-                firstParty = False
-
-            elif option == "~THIRD_PARTY" or option == "FIRST_PARTY":
-                thirdParty = False
-                firstParty = True
-
-            elif option == "COLLAPSE":
-                collapse = True
-
-            elif option == "~COLLAPSE":
-                collapse = False
-
-            elif option == "SITEKEY" and value:
-                sitekeys = value
-
-            else:
+        option_text = split_options(text)
+        if option_text:
+            parsed = parse_options(option_text)
+            if parsed is None:
                 # print('Invalid: %s' % origText)
-                return None
+                return option_rejection(option_text)
+            text = text[:dollar_pos]
+
+    contentType, matchCase, domains, sitekeys, optionThirdParty, optionFirstParty, collapse = parsed
+    if optionThirdParty is not None:
+        thirdParty = optionThirdParty
+        firstParty = optionFirstParty
 
     if blocking:
-        return blocking_filters(origText, text, contentType, matchCase, domains, firstParty, thirdParty, sitekeys, collapse)
-    return whitelist_filters(origText, text, contentType, matchCase, domains, firstParty, thirdParty, sitekeys)
+        return blocking_filters(origText, text, contentType, matchCase, domains, firstParty, thirdParty, sitekeys, collapse, translate)
+    return whitelist_filters(origText, text, contentType, matchCase, domains, firstParty, thirdParty, sitekeys, translate)
 
 
-def punycode(text):
-    if is_ascii(text):
-        return text
-    try:
-        # Attempt to encode Punycode
-        return str(text.encode('idna'))[2:-1]  # (Remove b'')
-    except:
-        return None
+def convert_text(text, no_css, translate=translate_url_filter):
+    # translate turns the url part of a filter into a url-filter
+    parts = None
+    hash_pos = text.find('#')
+    if hash_pos >= 0:
+        parts = split_elemhide(text)
+    if parts:
+        if no_css:
+            return rejection('no-css')
+        return elem_hide_from_text(text, *parts)
+    return regex_from_text(text, translate)
 
 
 def filter_from_text(text, options):
-    match = None
-    hash_pos = text.find('#')
-    if hash_pos >= 0:
-        match = elemhideRegExp.search(text)
-    if match:
-        if options.no_css:
-            return None
-        return elem_hide_from_text(text, match.group(1), match.group(2), match.group(3), match.group(4), match.group(5))
-    return regex_from_text(text)
+    # the rules of a line as dicts, or None if it was rejected
+    rules = convert_text(text, getattr(options, 'no_css', False))
+    if not rules:
+        return None
+    return [r.to_dict() for r in rules]
+
+
+def rule_fragment(rule, strip_whitespace):
+    # serialise a single rule exactly as json.dump lays it out inside the output array
+    if strip_whitespace:
+        return json.dumps(rule, separators=(',', ':'))
+    return json.dumps(rule, indent=4).replace('\n', '\n    ')
+
+
+def convert_line(line, no_css, strip_whitespace):
+    # returns (accepted line, [(is exception, json fragment), ...]) or the Rejection
+    line_rules = convert_text(line, no_css)
+    if not line_rules:
+        return line_rules
+    fragments = [(r.is_exception, r.to_json(strip_whitespace)) for r in line_rules]
+    return (accepted_line(line), fragments)
+
+
+def accepted_line(line):
+    # the line as written to --output-rules
+    if line in DefaultThirdPartyRules:
+        if "$" in line:
+            return line + ",third-party"
+        return line + "$third-party"
+    return line
+
+
+def convert_lines(lines, no_css, strip_whitespace, cache=None):
+    # convert a chunk of lines, used directly and by the process pool
+    if cache:
+        from .cache import open_cache
+        return open_cache(cache).convert_lines(lines, no_css, strip_whitespace)
+    results = []
+    for line in lines:
+        converted = convert_line(line, no_css, strip_whitespace)
+        results.append(converted if converted else (line, converted))
+    return results
+
+
+def iter_converted(lines, no_css, strip_whitespace):
+    # (accepted line, fragments) for every line, or (line, Rejection) if it produced no rules
+    for line in lines:
+        converted = convert_line(line, no_css, strip_whitespace)
+        yield converted if converted else (line, converted)
+
+
+def chunked(lines, size):
+    it = iter(lines)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
 
 
-def ab2cb_fp(options, fp):
-    rules = []
-    acceptedLines = []
-    for l in fp.readlines():
+def filter_lines(fp):
+    # read incrementally so only the current line is held in memory
+    for l in fp:
         l = l.strip()
         if not l:
             continue
@@ -395,39 +518,198 @@ def ab2cb_fp(options, fp):
             continue
         if l[0] == '!':
             continue
+        yield l
+
+
+def map_file(fp):
+    # a read only mmap of the open file, or None for empty files, pipes and devices
+    try:
+        return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        return None
+
+
+def mapped_chunks(mapped):
+    # the mapped file in pieces of about map_chunk_size that end at a newline
+    size = len(mapped)
+    start = 0
+    while start < size:
+        stop = start + map_chunk_size
+        if stop >= size:
+            end = size
+        else:
+            end = mapped.rfind(b'\n', start, stop)
+            if end < 0:
+                end = mapped.find(b'\n', stop)
+                if end < 0:
+                    end = size
+        yield mapped[start:end]
+        start = end + 1
+
+
+def filter_mapped(mapped):
+    # the lines filter_lines yields for the same file. lines starting with !
+    # or [ are cut from the raw bytes and never decoded, the rest of a chunk
+    # is decoded at once
+    for chunk in mapped_chunks(mapped):
+        # so that the first line starts after a newline too
+        chunk = b'\n' + chunk
+        pieces = []
+        start = 0
+        recheck = False
+        for m in line_start.finditer(chunk):
+            if chunk[m.end() - 1] not in b'![':
+                recheck = True
+            elif m.start() >= start:
+                pieces.append(chunk[start:m.start()])
+                end = line_end.search(chunk, m.end())
+                start = end.start() if end else len(chunk)
+        pieces.append(chunk[start:])
+        text = b''.join(pieces).decode('utf-8')
+        if b'\r' in chunk and chunk.count(b'\r') != chunk.count(b'\r\n'):
+            # a lone \r ends a line too
+            text = text.replace('\r', '\n')
+            recheck = True
+        lines = list(filter(None, map(str.strip, text.split('\n'))))
+        if recheck:
+            # a ! or [ after whitespace or a lone \r is only seen now
+            lines = [line for line in lines if line[0] != '[' and line[0] != '!']
+        yield from lines
 
-        line_rules = filter_from_text(l, options)
-        if line_rules:
-            rules.extend(line_rules)
-            if l in DefaultThirdPartyRules:
-                if "$" in l:
-                    acceptedLines.append(l + ",third-party")
-                else:
-                    acceptedLines.append(l + "$third-party")
-            else:
-                acceptedLines.append(l)
-    return (rules, acceptedLines)
+
+def ab2cb_fp(options, fp):
+    # lines -> parsed filters -> rules, yielding (accepted line, fragments) as they are produced
+    return ab2cb_lines(options, filter_lines(fp))
+
+
+def ab2cb_lines(options, lines):
+    profiler = options.profiler
+    if profiler is None:
+        return convert_stream(options, lines)
+    if not (options.previous or options.memory is not None or options.pool or options.cache):
+        return profiler.convert(lines, options.no_css, options.strip_whitespace)
+    return profiler.converted(convert_stream(options, profiler.read(lines)))
+
+
+def convert_stream(options, lines):
+    # the state of the previous run, then the serve memory, then convert_unknown
+    convert = functools.partial(convert_unknown, options)
+    if options.memory is not None:
+        convert = functools.partial(options.memory.convert, no_css=options.no_css, strip_whitespace=options.strip_whitespace, convert=convert)
+    if options.previous:
+        return options.previous.convert(lines, convert)
+    return convert(lines)
+
+
+def convert_unknown(options, lines):
+    # lines no earlier result is kept for: through the pool, the cache or the converter
+    if options.pool:
+        from .parallel import convert_parallel
+        return convert_parallel(options.pool, options.jobs, lines, options.no_css, options.strip_whitespace, options.cache)
+    if options.cache:
+        chunks = chunked(lines, cache_chunk_size)
+        return itertools.chain.from_iterable(convert_lines(c, options.no_css, options.strip_whitespace, options.cache) for c in chunks)
+    return iter_converted(lines, options.no_css, options.strip_whitespace)
+
+
+def convert_misses(lines, lookup, convert):
+    # (line, result) in input order. lookup(chunk) gives the results it
+    # knows for a chunk of lines by line, the other lines of the chunk go
+    # through convert together
+    for chunk in chunked(lines, lookup_chunk_size):
+        known = lookup(chunk)
+        misses = [line for line in chunk if line not in known]
+        converted = iter(convert(misses) if misses else ())
+        for line in chunk:
+            result = known.get(line)
+            if result is None:
+                result = next(converted)
+            yield line, result
 
 
 def ab2cb_file(options, path):
     if not check_file_access(options, path):
         return
 
-    rules = []
-    with open(path) as fp:
-        rules = ab2cb_fp(options, fp)
-    return rules
+    count = 0
+    with open(path, 'rb') as fp:
+        mapped = map_file(fp)
+        if mapped is None:
+            lines = filter_lines(io.TextIOWrapper(fp))
+        else:
+            lines = filter_mapped(mapped)
+        try:
+            for converted in ab2cb_lines(options, lines):
+                if converted[1]:
+                    count += 1
+                yield converted
+        finally:
+            if mapped is not None:
+                mapped.close()
+    report(options, "Generated %d rules for %s" % (count, path))
+
+
+def iter_fragments(options, results, rulesfp, ledger):
+    # the rule fragments of each result, saving the accepted and rejected lines on the way.
+    # lines are converted by workers, the cache or an earlier run, so they
+    # are reported here rather than as they are converted
+    for line, fragments in results:
+        if not fragments:
+            if fragments.reason == 'empty-url-filter':
+                report(options, 'Skipping "%s" due to empty post-processed regex url-filter' % line)
+            if ledger:
+                ledger.add(line, fragments.reason)
+            continue
+        if len(fragments) > 1:
+            # only $document filters without a load-type become two rules
+            report(options, 'Split %s into 2 rules' % line)
+        if rulesfp:
+            rulesfp.write(line + '\n')
+        for fragment in fragments:
+            yield fragment
 
 
-def write_rules(options, rulesAndLines):
-    if not rulesAndLines or not rulesAndLines[0]:
-        return
+def no_stage(name):
+    return contextlib.nullcontext()
+
 
-    rules = rulesAndLines[0]
-    lines = rulesAndLines[1]
+def write_rules(options, results):
+    if options.profiler:
+        with options.profiler.stage('write'):
+            return write_rules_to(options, results)
+    return write_rules_to(options, results)
+
+
+def open_ledger(options):
+    try:
+        return RejectionLedger(open(options.rejected, 'w'))
+    except Exception as e:
+        writerr_file_access(options, 'Cannot open output file: %s' % options.rejected)
+        error('write_rules: exception for %s: %s' % (options.rejected, e), exc_info=True)
+        return None
+
+
+def write_rules_to(options, results):
+    # no rules are written unless some line converts, the --rejected ledger always is
+    results = iter(results)
+    head = []
+    for result in results:
+        head.append(result)
+        if result[1]:
+            break
+    if not head or not head[-1][1]:
+        if options.rejected:
+            ledger = open_ledger(options)
+            if ledger:
+                for line, rejected in head:
+                    ledger.add(line, rejected.reason)
+                ledger.close()
+                report(options, ledger.summary())
+        return
+    results = itertools.chain(head, results)
 
     fp = options.stdout
-    if options.output:
+    if options.output and not options.max_rules_per_file:
         try:
             fp = open(options.output, 'w')
         except Exception as e:
@@ -435,60 +717,186 @@ def write_rules(options, rulesAndLines):
             error('write_rules: exception for %s: %s' % (options.output, e), exc_info=True)
             return
 
+    rulesfp = None
     if options.output_rules:
         try:
             rulesfp = open(options.output_rules, 'w')
-            rulesfp.write('\n'.join(lines) + '\n')
-            rulesfp.close()
         except Exception as e:
             writerr_file_access(options, 'Cannot open output file: %s' % options.output_rules)
             error('write_rules: exception for %s: %s' % (options.output_rules, e), exc_info=True)
             return
 
-    black = []
-    white = []
-    for r in rules:
-        if r['action']['type'] == 'ignore-previous-rules':
-            white.append(r)
-        else:
-            black.append(r)
-
-    out = black + white
+    profiler = options.profiler
+    stage = profiler.stage if profiler else no_stage
+    optimizer = None
+    rules = None
+    ledger = None
+    if options.rejected:
+        ledger = open_ledger(options)
+        if not ledger:
+            return
 
-    if options.strip_whitespace:
-        json.dump(out, fp, separators=(',', ':'))
+    fragments = iter_fragments(options, results, rulesfp, ledger)
+    simplifier = None
+    if options.simplify or options.simplified:
+        from .simplify import simplify_rules
+        simplified_fp = None
+        if options.simplified:
+            try:
+                simplified_fp = open(options.simplified, 'w')
+            except Exception as e:
+                writerr_file_access(options, 'Cannot open output file: %s' % options.simplified)
+                error('write_rules: exception for %s: %s' % (options.simplified, e), exc_info=True)
+                return
+        rules = [rule_from_json(f) for is_exception, f in fragments]
+        with stage('simplify'):
+            rules, simplifier = simplify_rules(rules, simplified_fp)
+        simplifier.close()
+        fragments = ((r.is_exception, r.to_json(options.strip_whitespace)) for r in rules)
+        if profiler:
+            fragments = profiler.timed(fragments, 'serialize')
+    folder = None
+    if options.fold_exceptions:
+        from .fold import fold_exceptions
+        if rules is None:
+            rules = [rule_from_json(f) for is_exception, f in fragments]
+        with stage('fold'):
+            rules, folder = fold_exceptions(rules)
+        fragments = ((r.is_exception, r.to_json(options.strip_whitespace)) for r in rules)
+        if profiler:
+            fragments = profiler.timed(fragments, 'serialize')
+    if options.optimize or options.batch_selectors > 1:
+        from .optimize import optimize_rules
+        if rules is None:
+            rules = [rule_from_json(f) for is_exception, f in fragments]
+        with stage('optimize'):
+            rules, optimizer = optimize_rules(rules, options.optimize, options.batch_selectors)
+        fragments = ((r.is_exception, r.to_json(options.strip_whitespace)) for r in rules)
+        if profiler:
+            fragments = profiler.timed(fragments, 'serialize')
+
+    if options.max_rules_per_file:
+        from .shard import write_shards
+        if rules is None:
+            rules = [rule_from_json(f) for is_exception, f in fragments]
+        writers = write_shards(options, rules)
+        for n, writer in enumerate(writers, 1):
+            if writer.total > options.max_rules_per_file:
+                writerr(options, 'Shard %d has %d rules: the exceptions it needs exceed --max-rules-per-file' % (n, writer.total), set_exit_status=False)
     else:
-        json.dump(out, fp, indent=4)
-
-    print("\nGenerated a total of %d rules (%d blocks, %d exceptions)\n\n" % (len(out), len(black), len(white)))
+        writer = RuleWriter(fp, options.strip_whitespace)
+        for is_exception, fragment in fragments:
+            writer.add(is_exception, fragment)
+        writer.close()
+        writers = [writer]
+        if options.output:
+            fp.close()
+    if rulesfp:
+        rulesfp.close()
+    if ledger:
+        ledger.close()
+
+    if simplifier:
+        report(options, simplifier.summary())
+    if folder:
+        report(options, folder.summary())
+    if optimizer:
+        report(options, optimizer.summary())
+    if ledger:
+        report(options, ledger.summary())
+    if options.max_rules_per_file:
+        report(options, "Wrote %d files of at most %d rules" % (len(writers), options.max_rules_per_file))
+    report(options, "\nGenerated a total of %d rules (%d blocks, %d exceptions)\n\n" % (sum(w.total for w in writers), sum(w.blocks for w in writers), sum(w.exceptions for w in writers)))
 
 
 def ab2cb(options):
-    rules = ([], [])
+    if options.cache_dir:
+        from .cache import cache_path
+        options.cache = cache_path(options.cache_dir)
+    if options.previous_dir:
+        from .incremental import PreviousRun
+        options.previous = PreviousRun(options.previous_dir, options.no_css, options.strip_whitespace)
+    if options.jobs != 1:
+        from .parallel import open_pool
+        options.pool = open_pool(options, options.start_method)
+    if options.profile:
+        from .profiler import Profiler
+        options.profiler = Profiler(options.profile_lines)
+    if options.cprofile:
+        import cProfile
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+    try:
+        convert_files(options)
+        if options.previous:
+            options.previous.save()
+            report(options, options.previous.summary())
+    finally:
+        if options.cprofile:
+            cprofile.disable()
+            cprofile.dump_stats(options.cprofile)
+        if options.previous:
+            options.previous.close()
+        if options.profiler:
+            options.profiler.save(options.profile)
+            options.profiler = None
+        if options.pool:
+            options.pool.close()
+            options.pool.join()
+            options.pool = None
+        if options.cache:
+            from .cache import open_cache
+            cache = open_cache(options.cache)
+            cache.prune(options.cache_size * 1024 * 1024)
+            cache.close()
+
+
+def convert_files(options):
     if options.files:
-        for f in options.files:
-            file_rules = ab2cb_file(options, f)
-            rules[0].extend(file_rules[0])
-            rules[1].extend(file_rules[1])
-            print("Generated %d rules for %s" % (len(file_rules[1]), f))
+        results = itertools.chain.from_iterable(ab2cb_file(options, f) for f in options.files)
     else:
-        rules = ab2cb_fp(options, options.stdin)
-    write_rules(options, rules)
+        results = ab2cb_fp(options, options.stdin)
+    if options.previous:
+        results = options.previous.complete(results)
+    write_rules(options, results)
+
+
+# ab2cb <command> ...: module under ab2cb/ with a main(argv, stdin, stdout, stderr).
+# an existing file named like a command is converted, as it always was
+commands = {
+    'cost': 'cost',
+    'diff-behavior': 'behavior',
+    'match': 'matcher',
+    'prune': 'prune',
+    'send': 'send',
+    'serve': 'serve',
+    'validate': 'validate',
+}
+
+
+exit_statuses = {
+    'extracted': 0,
+    'no-extract': 1,
+    'error': 2,
+    'not-set': -1
+}
 
 
 def main(argv, stdin=None, stdout=None, stderr=None):
     from .options import parse_opts
-    exit_statuses = {
-        'extracted': 0,
-        'no-extract': 1,
-        'error': 2,
-        'not-set': -1
-    }
+    if argv and argv[0] in commands and not os.path.exists(argv[0]):
+        import importlib
+        command = importlib.import_module('.' + commands[argv[0]], __package__)
+        return command.main(argv[1:], stdin=stdin, stdout=stdout, stderr=stderr)
 
     options = parse_opts(argv, stdin=stdin, stdout=stdout, stderr=stderr)
     if not options:
         return exit_statuses['error']
+    return convert(options)
+
 
+def convert(options):
+    # run a conversion for parsed options, returning the exit status
     init_logging(options)
 
     # do the convertion
@@ -497,8 +905,7 @@ def main(argv, stdin=None, stdout=None, stderr=None):
     except KeyboardInterrupt:
         writerr(options, '\nInterrupted')
     except Exception as e:
-        print("ab2cb exception: %s" % e)
-        writerr(options, 'ab2cb exception', exception=e)
+        writerr(options, 'ab2cb exception: %s' % e, exception=e)
         options.exit_status = 'error'
         raise e
 
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# persistent per-line conversion cache
+#
+# maps a hash of (converter version, output affecting options, filter line)
+# to the serialised result of convert_line, or the reason it was rejected. the store is a sqlite database in
+# WAL mode so several ab2cb processes (and the --jobs workers) can share it.
+
+import hashlib
+import json
+import os
+import os.path
+import sqlite3
+import threading
+import time
+
+from . import __version__
+from .ab2cb import convert_line
+from .rejection import rejection
+
+# bump when a change to the converter alters the output for an unchanged line
+cache_format = 2
+
+cache_file_name = 'ab2cb-cache.sqlite3'
+
+# rows used within this many seconds are not re-stamped on a hit
+touch_interval = 3600
+
+# sqlite host parameter limit is 999 on older builds
+query_batch = 500
+
+# one connection per (path, process, thread): connections must not cross
+# a fork, and sqlite3 connections are only used by the thread that made them
+connections = {}
+
+
+def cache_path(directory):
+    return os.path.join(directory, cache_file_name)
+
+
+def open_cache(path):
+    key = (path, os.getpid(), threading.get_ident())
+    cache = connections.get(key)
+    if cache is None:
+        cache = ConversionCache(path)
+        connections[key] = cache
+    return cache
+
+
+def encode(converted):
+    if not converted:
+        return '!' + converted.reason
+    return json.dumps(converted, separators=(',', ':'))
+
+
+def decode(value):
+    if value[0] == '!':
+        return rejection(value[1:])
+    line, fragments = json.loads(value)
+    return (line, [tuple(f) for f in fragments])
+
+
+class ConversionCache(object):
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS rules (key BLOB PRIMARY KEY, value TEXT NOT NULL, used INTEGER NOT NULL) WITHOUT ROWID')
+        self.db.execute('CREATE INDEX IF NOT EXISTS rules_used ON rules (used)')
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, line, prefix):
+        return hashlib.sha1((prefix + line).encode('utf-8')).digest()
+
+    def lookup(self, keys):
+        found = {}
+        for i in range(0, len(keys), query_batch):
+            batch = keys[i:i + query_batch]
+            query = 'SELECT key, value, used FROM rules WHERE key IN (%s)' % ','.join('?' * len(batch))
+            for key, value, used in self.db.execute(query, batch):
+                found[bytes(key)] = (value, used)
+        return found
+
+    def convert_lines(self, lines, no_css, strip_whitespace):
+        prefix = '%s:%d:%d:%d\n' % (__version__, cache_format, bool(no_css), bool(strip_whitespace))
+        keys = [self.key(line, prefix) for line in lines]
+        found = self.lookup(keys)
+        now = int(time.time())
+        stale = now - touch_interval
+        results = []
+        added = []
+        touched = []
+        for line, key in zip(lines, keys):
+            hit = found.get(key)
+            if hit is None:
+                converted = convert_line(line, no_css, strip_whitespace)
+                added.append((key, encode(converted), now))
+                self.misses += 1
+            else:
+                converted = decode(hit[0])
+                if hit[1] < stale:
+                    touched.append((now, key))
+                self.hits += 1
+            results.append(converted if converted else (line, converted))
+        if added or touched:
+            with self.db:
+                self.db.execute('BEGIN IMMEDIATE')
+                self.db.executemany('INSERT OR REPLACE INTO rules (key, value, used) VALUES (?, ?, ?)', added)
+                self.db.executemany('UPDATE rules SET used = ? WHERE key = ?', touched)
+        return results
+
+    def size(self):
+        page_size = self.db.execute('PRAGMA page_size').fetchone()[0]
+        page_count = self.db.execute('PRAGMA page_count').fetchone()[0]
+        free_count = self.db.execute('PRAGMA freelist_count').fetchone()[0]
+        return (page_count - free_count) * page_size
+
+    def prune(self, max_bytes):
+        # drop the least recently used rows until the store is back under budget
+        size = self.size()
+        if size <= max_bytes:
+            return 0
+        rows = self.db.execute('SELECT COUNT(*) FROM rules').fetchone()[0]
+        # aim a little below the limit so every run does not evict
+        drop = int(rows * (1.0 - (max_bytes * 0.8) / size)) + 1
+        with self.db:
+            self.db.execute('BEGIN IMMEDIATE')
+            cursor = self.db.execute('DELETE FROM rules WHERE key IN (SELECT key FROM rules ORDER BY used LIMIT ?)', (drop,))
+        return cursor.rowcount
+
+    def close(self):
+        self.db.close()
+        for key, cache in list(connections.items()):
+            if cache is self:
+                del connections[key]
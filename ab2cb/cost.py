@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+# estimate what a content blocker costs WebKit to compile
+#
+#   ab2cb cost [--top N] [-o FILE] Rules.json
+#
+# WebKit combines the url-filters of rules with the same trigger flags and
+# action into a prefix tree, turns it into an NFA and then into DFAs. this
+# models that on Linux: rules are grouped by action type, resource-type,
+# load-type, case sensitivity and kind of domain condition, and each group
+# is estimated as the nodes of its prefix tree of url-filter terms plus the
+# extra states each url-filter needs once determinized on its own. a
+# url-filter that does not start with ^ is searched for anywhere in the
+# url, as if it started with .*, which is what makes wildcards expensive.
+# url-filters of .* are matched without an automaton and cost nothing.
+#
+# the states of one url-filter are counted exactly: subset construction on
+# its NFA, over the character classes the url-filter distinguishes and
+# stopping at max_states, then minimization. states that accept are merged,
+# as matching stops there, and the dead state is not counted.
+
+from __future__ import print_function
+
+import bisect
+import collections
+import functools
+import json
+
+from .rules import MATCH_ALL
+from .urlfilter import UrlFilterError, parse
+
+# determinization stops at this many states
+max_states = 5000
+
+# end of the url, the only thing $ matches
+END = 128
+
+
+class NFA(object):
+    def __init__(self):
+        # per state: [(term, target), ...] and [target, ...]
+        self.edges = []
+        self.eps = []
+
+    def state(self):
+        self.edges.append([])
+        self.eps.append([])
+        return len(self.edges) - 1
+
+    def sequence(self, terms, state):
+        for term in terms:
+            state = self.term(term, state)
+        return state
+
+    def term(self, term, state):
+        kind = term[0]
+        if kind == 'group':
+            return self.sequence(term[1], state)
+        if kind == 'repeat':
+            inner, low, high = term[1:]
+            entry = self.state()
+            self.eps[state].append(entry)
+            exit = self.term(inner, entry)
+            end = self.state()
+            self.eps[exit].append(end)
+            if low == 0:
+                self.eps[state].append(end)
+            if high is None:
+                self.eps[exit].append(entry)
+            return end
+        target = self.state()
+        self.edges[state].append((term, target))
+        return target
+
+
+def build_nfa(url_filter):
+    # (nfa, start, final) of a parsed url-filter
+    nfa = NFA()
+    start = nfa.state()
+    state = start
+    if not url_filter.anchored_start:
+        state = nfa.state()
+        nfa.eps[start].append(state)
+        nfa.edges[state].append((('any',), state))
+    final = nfa.sequence(url_filter.terms, state)
+    if url_filter.anchored_end:
+        end = nfa.state()
+        nfa.edges[final].append((('end',), end))
+        final = end
+    return nfa, start, final
+
+
+def term_classes(term, boundaries, case_sensitive):
+    # the character classes matched by term, as indexes into boundaries
+    kind = term[0]
+    if kind == 'any':
+        return range(len(boundaries) - 1)
+    if kind == 'end':
+        return [len(boundaries) - 1]
+    if kind == 'char':
+        chars = [term[1]] if case_sensitive else set([term[1].lower(), term[1].upper()])
+        return [bisect.bisect_right(boundaries, ord(c)) - 1 for c in chars]
+    table = set_table(term, case_sensitive)
+    return [n for n in range(len(boundaries) - 1) if table[boundaries[n]]]
+
+
+@functools.lru_cache(maxsize=1024)
+def set_table(term, case_sensitive):
+    # for each ascii code, whether the ('set', negated, ranges) term matches it
+    negated, ranges = term[1], term[2]
+    table = []
+    for code in range(END):
+        c = chr(code)
+        inside = any(low <= c <= high for low, high in ranges)
+        if not inside and not case_sensitive and c.isalpha():
+            inside = any(low <= o <= high for low, high in ranges for o in (c.lower(), c.upper()))
+        table.append(inside != negated)
+    return table
+
+
+def class_boundaries(nfa, case_sensitive):
+    # starts of the intervals of ascii that every term treats alike, then END
+    points = set([0])
+    for edges in nfa.edges:
+        for term, target in edges:
+            if term[0] == 'char':
+                chars = [term[1]] if case_sensitive else [term[1].lower(), term[1].upper()]
+            elif term[0] == 'set':
+                chars = [c for r in term[2] for c in r]
+                if not case_sensitive:
+                    chars = [o for c in chars for o in (c.lower(), c.upper())]
+                points.update(ord(high) + 1 for low, high in term[2])
+            else:
+                continue
+            for c in chars:
+                points.add(ord(c))
+                points.add(ord(c) + 1)
+    return sorted(p for p in points if p < END) + [END]
+
+
+def closures(nfa):
+    # bitmask of the states each state reaches without reading anything
+    result = []
+    for state in range(len(nfa.eps)):
+        stack = [state]
+        seen = set(stack)
+        while stack:
+            for target in nfa.eps[stack.pop()]:
+                if target not in seen:
+                    seen.add(target)
+                    stack.append(target)
+        result.append(sum(1 << s for s in seen))
+    return result
+
+
+def count_dfa_states(nfa, start, final, case_sensitive):
+    # states of the minimal DFA, the accepting state included, the dead state
+    # not; max_states when subset construction gets that far. sets of NFA
+    # states are bitmasks, and character classes that the same edges match
+    # are merged first
+    boundaries = class_boundaries(nfa, case_sensitive)
+    reach = closures(nfa)
+    by_class = [[] for n in range(len(boundaries))]
+    for state, edges in enumerate(nfa.edges):
+        for term, target in edges:
+            for n in term_classes(term, boundaries, case_sensitive):
+                by_class[n].append((1 << state, reach[target]))
+    classes = list(set(tuple(moves) for moves in by_class if moves))
+
+    final = 1 << final
+    first = reach[start]
+    if first & final:
+        return 1
+    # matching stops at the first accepting state, so they are all one: 0
+    numbers = {first: 1}
+    pending = [first]
+    transitions = {}
+    while pending:
+        subset = pending.pop()
+        row = []
+        for moves in classes:
+            following = 0
+            for bit, targets in moves:
+                if subset & bit:
+                    following |= targets
+            if not following:
+                row.append(-1)
+            elif following & final:
+                row.append(0)
+            else:
+                number = numbers.get(following)
+                if number is None:
+                    if len(numbers) >= max_states:
+                        return max_states
+                    number = numbers[following] = len(numbers) + 1
+                    pending.append(following)
+                row.append(number)
+        transitions[numbers[subset]] = row
+    return minimal_states(transitions, 0 in (t for row in transitions.values() for t in row))
+
+
+def minimal_states(transitions, accepting):
+    # Hopcroft's partition refinement over {state: [target per class]}. the
+    # accepting state 0 and the dead state -1 only lead to themselves. the
+    # result counts the accepting state but not the dead one
+    classes = len(next(iter(transitions.values())))
+    inverse = [collections.defaultdict(list) for c in range(classes)]
+    for state, row in transitions.items():
+        for c, target in enumerate(row):
+            inverse[c][target].append(state)
+    for state in (0, -1):
+        for c in range(classes):
+            inverse[c][state].append(state)
+
+    blocks = [set([0]), set(transitions)]
+    blocks[1].add(-1)
+    block_of = dict.fromkeys(blocks[1], 1)
+    block_of[0] = 0
+    waiting = set([0])
+    while waiting:
+        splitter = list(blocks[waiting.pop()])
+        for moves in inverse:
+            touched = collections.defaultdict(list)
+            for target in splitter:
+                for source in moves.get(target, ()):
+                    touched[block_of[source]].append(source)
+            for number, inside in touched.items():
+                block = blocks[number]
+                if len(inside) == len(block):
+                    continue
+                inside = set(inside)
+                block -= inside
+                new = len(blocks)
+                blocks.append(inside)
+                for state in inside:
+                    block_of[state] = new
+                if number in waiting or len(inside) <= len(block):
+                    waiting.add(new)
+                else:
+                    waiting.add(number)
+    dead = block_of[-1]
+    return sum(1 for number in range(len(blocks)) if number != dead and (accepting or number != 0))
+
+
+def literal_states(url_filter):
+    # states of a url-filter of plain characters, without building anything
+    return len(url_filter.terms) + 1
+
+
+parse_cached = functools.lru_cache(maxsize=65536)(parse)
+
+
+@functools.lru_cache(maxsize=65536)
+def filter_cost(url_filter, case_sensitive=False):
+    # (terms, dfa states) of url_filter alone, None if it does not parse
+    if url_filter == MATCH_ALL:
+        return (0, 0)
+    try:
+        parsed = parse_cached(url_filter)
+    except (UrlFilterError, RecursionError):
+        return None
+    if not parsed.anchored_end and all(term[0] == 'char' for term in parsed.terms):
+        return (len(parsed.terms), literal_states(parsed))
+    nfa, start, final = build_nfa(parsed)
+    return (len(parsed.terms), count_dfa_states(nfa, start, final, case_sensitive))
+
+
+def group_key(rule):
+    if rule.if_domain:
+        domains = 'if-domain'
+    elif rule.unless_domain:
+        domains = 'unless-domain'
+    else:
+        domains = None
+    return (rule.action.type, rule.resource_type, rule.load_type, rule.case_sensitive, domains)
+
+
+def group_name(key):
+    action, resource_type, load_type, case_sensitive, domains = key
+    parts = [action]
+    if resource_type:
+        parts.append('resource-type=%s' % ','.join(resource_type))
+    if load_type:
+        parts.append('load-type=%s' % ','.join(load_type))
+    if case_sensitive:
+        parts.append('case-sensitive')
+    if domains:
+        parts.append(domains)
+    return ' '.join(parts)
+
+
+class Group(object):
+    def __init__(self, key):
+        self.key = key
+        self.rules = 0
+        self.trie = {}
+        self.nodes = 0
+        self.extra = 0
+        self.invalid = 0
+
+    def add(self, url_filter, cost):
+        self.rules += 1
+        if cost is None:
+            self.invalid += 1
+            return
+        terms, states = cost
+        if not terms:
+            return
+        parsed = parse_cached(url_filter)
+        node = self.trie.setdefault(parsed.anchored_start, {})
+        for term in parsed.terms:
+            child = node.get(term)
+            if child is None:
+                child = node[term] = {}
+                self.nodes += 1
+            node = child
+        self.extra += max(0, states - terms - 1)
+
+    @property
+    def states(self):
+        return self.nodes + len(self.trie) + self.extra
+
+
+def estimate(rules):
+    # (groups by estimated states, [(states, terms, rule index), ...] by states)
+    groups = collections.OrderedDict()
+    ranked = []
+    for index, rule in enumerate(rules):
+        cost = filter_cost(rule.url_filter, rule.case_sensitive)
+        key = group_key(rule)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = Group(key)
+        group.add(rule.url_filter, cost)
+        if cost is not None and cost[0]:
+            ranked.append((cost[1], cost[0], index))
+    ranked.sort(key=lambda r: (-r[0], -r[1], r[2]))
+    return sorted(groups.values(), key=lambda g: -g.states), ranked
+
+
+def main(argv, stdin=None, stdout=None, stderr=None):
+    from .options import parse_cost_opts
+    from .rulefile import RuleFileError, load_rules
+
+    options = parse_cost_opts(argv, stdin=stdin, stdout=stdout, stderr=stderr)
+    try:
+        rules = load_rules(options.rules)
+    except (IOError, OSError, RuleFileError, KeyError) as e:
+        options.stderr.write('%s: %s\n' % (options.rules, e))
+        return 2
+
+    groups, ranked = estimate(rules)
+    out = options.stdout
+    out.write('%d rules in %d groups, about %d DFA states\n' % (len(rules), len(groups), sum(g.states for g in groups)))
+    out.write('\n%10s %8s  %s\n' % ('states', 'rules', 'group'))
+    for g in groups:
+        out.write('%10d %8d  %s%s\n' % (g.states, g.rules, group_name(g.key), ' (%d invalid)' % g.invalid if g.invalid else ''))
+    out.write('\n%10s %8s  %s\n' % ('states', 'rule', 'url-filter'))
+    for states, terms, index in ranked[:options.top]:
+        out.write('%10s %8d  %s\n' % ('>=%d' % states if states >= max_states else states, index, rules[index].url_filter))
+
+    if options.output:
+        report = collections.OrderedDict([
+            ('rules', len(rules)),
+            ('states', sum(g.states for g in groups)),
+            ('groups', [collections.OrderedDict([
+                ('group', group_name(g.key)),
+                ('rules', g.rules),
+                ('states', g.states),
+                ('prefix-tree-nodes', g.nodes),
+                ('extra-states', g.extra),
+                ('invalid', g.invalid),
+            ]) for g in groups]),
+            ('expensive', [collections.OrderedDict([
+                ('rule', index),
+                ('states', states),
+                ('terms', terms),
+                ('url-filter', rules[index].url_filter),
+            ]) for states, terms, index in ranked[:options.top]]),
+        ])
+        with open(options.output, 'w') as fp:
+            json.dump(report, fp, indent=4)
+            fp.write('\n')
+    return 0
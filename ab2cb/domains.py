@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# parsed domain lists, memoised per raw value
+#
+# the same $domain= values and element hiding prefixes recur across
+# thousands of filters, so each raw value is split, lowercased, IDNA encoded
+# and sorted into if/unless lists once. the resulting tuples are interned so
+# equal lists are stored once however many rules use them.
+
+import functools
+
+from .rejection import rejection
+from .rules import intern_tuple
+
+# distinct raw values remembered; easylist has a few thousand
+cache_size = 16384
+
+
+@functools.lru_cache(maxsize=cache_size)
+def punycode(text):
+    if text.isascii():
+        return text
+    try:
+        # Attempt to encode Punycode
+        return text.encode('idna').decode('ascii')
+    except Exception:
+        return None
+
+
+@functools.lru_cache(maxsize=cache_size)
+def filter_domains(domains):
+    # $domain=a.com|~b.com -> (if-domain, unless-domain), either may be None.
+    # a Rejection when a name cannot be encoded or both kinds are mixed,
+    # which content blockers cannot express in one rule
+    ifd = []
+    unl = []
+    for d in domains.lower().split('|'):
+        if not d:
+            continue
+        # NOTE: `*` is not regex format. Per docs:
+        # "Add * in front to match domain and subdomains."
+        # https://developer.apple.com/documentation/safariservices/creating_a_content_blocker
+        if d[0] == '~':
+            encoded = punycode(d[1:])
+            if not encoded:
+                return rejection('bad-domain')
+            unl.append('*' + encoded)
+        else:
+            encoded = punycode(d)
+            if not encoded:
+                return rejection('bad-domain')
+            ifd.append('*' + encoded)
+    if ifd and unl:
+        # Invalid rule, needs a split
+        return rejection('mixed-domains')
+    return (intern_tuple(ifd) if ifd else None, intern_tuple(unl) if unl else None)
+
+
+@functools.lru_cache(maxsize=cache_size)
+def elemhide_if_domains(domain):
+    return intern_tuple(domain.lower().split(','))
+
+
+@functools.lru_cache(maxsize=cache_size)
+def elemhide_unless_domains(domain):
+    return intern_tuple(domain.split(','))
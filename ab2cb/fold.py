@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+# fold exceptions into the rules they override
+#
+# an ignore-previous-rules rule E undoes every earlier rule for the
+# requests it matches, and all exceptions come after the other rules. a
+# rule B that E matches every request of can be changed to skip E's
+# requests instead, which is exact when E matches every url B does and
+# every resource-type and load-type of B:
+#   E without domains        B is dropped
+#   E if-domain D            B gets unless-domain D, or is dropped if its
+#                            if-domain is within D
+#   E unless-domain U        B gets if-domain U, or if-domain only the
+#                            sites in both if B already has one
+# E matches every url B does when its url-filter is .* or B's, when it is
+# anchored at the start and B's starts with it (||ads.com^ for
+# ||ads.com/x/ and ||sub.ads.com^), and when it is not anchored and B's
+# contains it (/ads/ for /x/ads/y).
+#
+# E itself can be removed once every rule it may override has been changed
+# like that. when some other rule may be overridden by E, E is kept as it
+# is, and the rules it always overrides completely are still dropped, as
+# they never act. an exception that overrides nothing is dropped. whether
+# E may override a rule is decided conservatively, as for output shards:
+# an unanchored url-filter such as /banner. may match the path of any
+# host, so it may be overridden by an exception for one host.
+#
+# the rules E matches every url of contain E's literal text, so they are
+# looked up by the rarest k-gram of it, see matcher.rule_grams. whether any
+# other rule may be overridden is looked up by host for url-filters of the
+# form ||host/path, and stops at the first such rule.
+
+import collections
+
+from .cost import parse_cached
+from .matcher import rule_grams
+from .optimize import domain_index, intersect_domains, is_covered, reduce_domains
+from .rules import MATCH_ALL, intern_tuple
+from .shard import Trigger, host_anchor
+from .urlfilter import UrlFilterError
+
+# a rule dropped by folding
+DROP = 'drop'
+
+host_terms = parse_cached(host_anchor).terms
+
+DOT = ('char', '.')
+SLASH = ('char', '/')
+
+
+def host_parents(host):
+    # the hosts host is a subdomain of
+    dot = host.find('.')
+    while dot >= 0:
+        yield host[dot + 1:]
+        dot = host.find('.', dot + 1)
+
+
+def parsed(url_filter):
+    try:
+        return parse_cached(url_filter)
+    except (UrlFilterError, RecursionError):
+        return None
+
+
+def contains(terms, part):
+    # is part a run of terms?
+    length = len(part)
+    return any(terms[i:i + length] == part for i in range(len(terms) - length + 1))
+
+
+def subdomain_of(terms, part):
+    # do terms start with subdomain labels followed by part? both follow
+    # host_anchor, which takes the labels in front of part as well
+    for i in range(2, len(terms) - len(part) + 1):
+        previous = terms[i - 1]
+        if previous[0] != 'char' or previous == SLASH:
+            return False
+        if previous == DOT and terms[i:i + len(part)] == part:
+            return True
+    return False
+
+
+def url_covers(exception, rule):
+    # does the url-filter of exception match every url the rule's does?
+    if exception.url_filter == MATCH_ALL or exception.url_filter == rule.url_filter:
+        return True
+    e = parsed(exception.url_filter)
+    b = parsed(rule.url_filter)
+    if e is None or b is None or e.anchored_end:
+        return False
+    if not e.anchored_start:
+        return contains(b.terms, e.terms)
+    if not b.anchored_start:
+        return False
+    if b.terms[:len(e.terms)] == e.terms:
+        return True
+    anchor = len(host_terms)
+    if e.terms[:anchor] != host_terms or b.terms[:anchor] != host_terms:
+        return False
+    return subdomain_of(b.terms[anchor:], e.terms[anchor:])
+
+
+def covers(exception, rule):
+    # does exception match every url, resource-type and load-type of rule?
+    if exception.case_sensitive and not rule.case_sensitive and exception.url_filter != MATCH_ALL:
+        return False
+    if exception.resource_type and not (rule.resource_type and set(rule.resource_type) <= set(exception.resource_type)):
+        return False
+    if exception.load_type and exception.load_type != rule.load_type:
+        return False
+    return url_covers(exception, rule)
+
+
+def fold_into(exception, rule):
+    # rule changed to skip the requests of exception, DROP, or None if that
+    # cannot be said exactly
+    if not covers(exception, rule):
+        return None
+    if exception.if_domain:
+        if rule.if_domain:
+            index = domain_index(exception.if_domain)
+            return DROP if all(is_covered(d, index) for d in rule.if_domain) else None
+        return rule.copy(unless_domain=intern_tuple(reduce_domains((rule.unless_domain or ()) + exception.if_domain)))
+    if exception.unless_domain:
+        if rule.unless_domain:
+            return None
+        if rule.if_domain:
+            domains = intersect_domains(rule.if_domain, exception.unless_domain)
+            return rule.copy(if_domain=intern_tuple(domains)) if domains else DROP
+        return rule.copy(if_domain=exception.unless_domain)
+    return DROP
+
+
+class RuleIndex(object):
+    # the rules an exception may override, by url, and those it may fold
+    # into, by k-gram
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.triggers = [Trigger(r) for r in self.rules]
+        self.others = []
+        self.hosts = collections.defaultdict(list)
+        self.subdomains = collections.defaultdict(list)
+        self.grams = collections.defaultdict(list)
+        for i, trigger in enumerate(self.triggers):
+            if trigger.url and trigger.url[0] == 'host':
+                host = trigger.url[1]
+                self.hosts[host].append(i)
+                for parent in host_parents(host):
+                    self.subdomains[parent].append(i)
+            else:
+                self.others.append(i)
+            for gram in rule_grams(self.rules[i].url_filter):
+                self.grams[gram].append(i)
+
+    def candidates(self, trigger):
+        url = trigger.url
+        if not url or url[0] != 'host':
+            return range(len(self.rules))
+        host = url[1]
+        found = list(self.others)
+        found.extend(self.hosts.get(host, ()))
+        found.extend(self.subdomains.get(host, ()))
+        for parent in host_parents(host):
+            found.extend(self.hosts.get(parent, ()))
+        return found
+
+    def targets(self, exception):
+        # the rules exception may match every url of: those with its rarest k-gram
+        grams = rule_grams(exception.url_filter)
+        if not grams:
+            return range(len(self.rules))
+        return min((self.grams.get(g, ()) for g in grams), key=len)
+
+    def overrides_other(self, trigger, targets):
+        # may the exception with trigger override a rule not in targets?
+        for i in self.candidates(trigger):
+            if i not in targets and self.rules[i] is not None and trigger.may_overlap(self.triggers[i]):
+                return True
+        return False
+
+    def fold(self, exception):
+        # ([(rule index, changed rule or DROP), ...] made for exception,
+        # whether exception must be kept)
+        trigger = Trigger(exception)
+        changes = []
+        for i in self.targets(exception):
+            rule = self.rules[i]
+            if rule is None or not trigger.may_overlap(self.triggers[i]):
+                continue
+            folded = fold_into(exception, rule)
+            if folded is not None:
+                changes.append((i, folded))
+        keep = self.overrides_other(trigger, set(i for i, folded in changes))
+        if keep:
+            # the rules it always overrides never act
+            changes = [(i, folded) for i, folded in changes if folded is DROP]
+        for i, folded in changes:
+            if folded is DROP:
+                self.rules[i] = None
+            else:
+                self.rules[i] = folded
+                self.triggers[i] = Trigger(folded)
+        return changes, keep
+
+
+class ExceptionFolder(object):
+    def __init__(self):
+        self.exceptions = 0
+        self.folded = 0
+        self.unused = 0
+        self.dropped = 0
+        self.restricted = 0
+
+    def fold(self, rules):
+        index = RuleIndex(r for r in rules if not r.is_exception)
+        kept = []
+        for exception in rules:
+            if not exception.is_exception:
+                continue
+            self.exceptions += 1
+            changes, keep = index.fold(exception)
+            self.restricted += sum(1 for i, folded in changes if folded is not DROP)
+            if keep:
+                kept.append(exception)
+            elif not changes:
+                self.unused += 1
+            else:
+                self.folded += 1
+        self.dropped = sum(1 for r in index.rules if r is None)
+        return [r for r in index.rules if r is not None] + kept
+
+    def summary(self):
+        return 'Folded %d of %d exceptions into other rules (%d rules dropped, %d given domains), dropped %d exceptions that override nothing' % (
+            self.folded, self.exceptions, self.dropped, self.restricted, self.unused)
+
+
+def fold_exceptions(rules):
+    folder = ExceptionFolder()
+    return folder.fold(rules), folder
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# incremental re-conversion against the state saved by a previous run
+#
+# the state directory holds:
+#   state.json     converter version and the options the state was made with
+#   lines.sqlite3  every filter line of the previous run and what it was
+#                  converted to: the accepted line and its rule fragments,
+#                  each after b or e for block or exception and separated
+#                  by NUL, which json text cannot contain. for a rejected
+#                  line, no accepted line and the reason. rows are keyed by
+#                  a hash of the line
+#
+# rather than diffing the old input against the new one and mapping each
+# old line to the indices of its output rules, the state maps each line to
+# its rule fragments. the output is written in input order from the
+# fragments anyway, so a line found in the state (an unchanged line) reuses
+# them verbatim, a line not found (an added line) goes through the
+# converter, and a line of the state not seen again (a removed line) simply
+# contributes nothing. that is the same diff, without holding either input
+# or the old output in memory.
+#
+# lines are looked up in the previous state a chunk at a time, so it is
+# never read as a whole, and added lines go through --jobs and --cache as
+# usual. unlike the --cache database, which is shared, keyed by version and
+# options, and pruned by size, the state holds exactly the lines of the run
+# that saved it. it is updated in place in one transaction: added lines are
+# inserted as they go by, and lines that were not seen are deleted when it
+# is saved, but only after a run whose results were all written. a run that
+# stopped early, say because --output could not be opened, keeps the lines
+# it did not get to.
+
+import hashlib
+import json
+import os
+import os.path
+import sqlite3
+
+from . import __version__
+from .ab2cb import convert_misses
+from .cache import query_batch
+from .rejection import rejection
+
+state_file = 'lines.sqlite3'
+
+# files of older state formats, removed when the state is made again
+old_state_files = ['input.txt', 'rulemap.txt', 'rules.json']
+
+# bump when the layout of the state files changes
+state_format = 3
+
+
+def line_key(line):
+    return int.from_bytes(hashlib.blake2b(line.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+def encode(result):
+    # (accepted line, value) stored for a result
+    line, fragments = result
+    if not fragments:
+        return None, fragments.reason
+    return line, '\0'.join(('e' if is_exception else 'b') + fragment for is_exception, fragment in fragments)
+
+
+def decode(line, accepted, value):
+    if accepted is None:
+        return (line, rejection(value))
+    return (accepted, [(f[0] == 'e', f[1:]) for f in value.split('\0')])
+
+
+class PreviousRun(object):
+    def __init__(self, directory, no_css, strip_whitespace):
+        self.directory = directory
+        self.no_css = no_css
+        self.strip_whitespace = strip_whitespace
+        self.state = {
+            'version': __version__,
+            'format': state_format,
+            'no_css': bool(no_css),
+            'strip_whitespace': bool(strip_whitespace),
+        }
+        self.rows = []
+        self.finished = False
+        self.reused = 0
+        self.converted = 0
+        self.removed = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if not self.load():
+            # made by another converter version or with different options.
+            # state.json goes first so a partial state is never loaded
+            for name in ['state.json', state_file] + old_state_files:
+                if os.path.exists(self.path(name)):
+                    os.remove(self.path(name))
+        self.db = sqlite3.connect(self.path(state_file), isolation_level=None)
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS lines (key INTEGER PRIMARY KEY, line TEXT NOT NULL, accepted TEXT, value TEXT NOT NULL)')
+        self.db.execute('CREATE TEMP TABLE seen (key INTEGER PRIMARY KEY)')
+        self.db.execute('BEGIN IMMEDIATE')
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def load(self):
+        try:
+            with open(self.path('state.json')) as fp:
+                state = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return False
+        return state == self.state
+
+    def lookup(self, lines):
+        # {line: result} of the lines the previous run converted, marking
+        # all of them seen
+        self.write()
+        keys = {}
+        for line in lines:
+            keys[line_key(line)] = line
+        batch = list(keys)
+        found = {}
+        for i in range(0, len(batch), query_batch):
+            part = batch[i:i + query_batch]
+            query = 'SELECT key, line, accepted, value FROM lines WHERE key IN (%s)' % ','.join('?' * len(part))
+            for key, line, accepted, value in self.db.execute(query, part):
+                if keys[key] == line:
+                    found[line] = decode(line, accepted, value)
+        self.db.executemany('INSERT OR IGNORE INTO seen (key) VALUES (?)', ((key,) for key in batch))
+        self.reused += sum(1 for line in lines if line in found)
+        return found
+
+    def convert(self, lines, convert):
+        # the results of lines, those the previous run did not have from convert
+        def convert_new(misses):
+            self.converted += len(misses)
+            for line, result in zip(misses, convert(misses)):
+                self.rows.append((line_key(line), line) + encode(result))
+                yield result
+
+        for line, result in convert_misses(lines, self.lookup, convert_new):
+            yield result
+
+    def complete(self, results):
+        # results, noting when all of them have been taken
+        for result in results:
+            yield result
+        self.finished = True
+
+    def write(self):
+        if self.rows:
+            self.db.executemany('INSERT OR REPLACE INTO lines (key, line, accepted, value) VALUES (?, ?, ?, ?)', self.rows)
+            self.rows = []
+
+    def save(self):
+        self.write()
+        if self.finished:
+            self.removed = self.db.execute('DELETE FROM lines WHERE key NOT IN (SELECT key FROM temp.seen)').rowcount
+        self.db.execute('COMMIT')
+        self.close()
+        with open(self.path('state.json'), 'w') as fp:
+            json.dump(self.state, fp)
+
+    def close(self):
+        # without save, the state stays as the previous run saved it
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def summary(self):
+        return 'Reused %d lines, converted %d new lines, dropped %d removed lines' % (self.reused, self.converted, self.removed)
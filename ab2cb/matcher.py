@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+# evaluate content blocker rules against requests without Safari
+#
+#   ab2cb match [-o FILE] Rules.json [Urls ...]
+#
+# each line of Urls (stdin if not given) is "URL [PAGE [TYPE]]": the
+# requested url, the url or host of the page making the request (the url
+# itself if not given) and its resource-type (document if not given). the
+# decision for each request is written as "decision<TAB>URL<TAB>rules",
+# with the numbers of the rules responsible for it.
+#
+# rules follow WebKit's semantics: url-filter is searched for in the url,
+# case-insensitively unless url-filter-is-case-sensitive; if-domain and
+# unless-domain test the page host, exactly or with subdomains when the
+# entry starts with *; load-type compares the registrable domains of the
+# url and the page; resource-type must contain the request type. matching
+# rules apply in order and ignore-previous-rules drops every action matched
+# before it.
+#
+# rules with the same trigger and action type are tested once. triggers are indexed by one
+# k-gram of the literal text their url-filter requires, the rarest one
+# among all triggers. a url only looks up the k-grams it contains, so it is
+# tested against a handful of candidates. triggers without a literal k-gram
+# are indexed by their if-domain entries instead, and only the remaining
+# few are tested against every request. css-display-none rules only act on
+# document requests.
+
+from __future__ import print_function
+
+import bisect
+import collections
+import re
+import time
+
+from .urlfilter import UrlFilterError, parse
+
+# characters per indexed token
+gram_length = 4
+
+# second level labels under which country code domains are registered, a
+# small stand-in for the public suffix list
+second_level = frozenset(['ac', 'co', 'com', 'edu', 'gov', 'net', 'org', 'ne', 'or'])
+
+Request = collections.namedtuple('Request', 'url page resource_type')
+
+# decision is the first of decisions with an applied action, allow when an
+# exception cancelled every action, or none. rules are the indexes of the
+# rules responsible for the decision, exception the index of the last
+# ignore-previous-rules rule that matched
+Match = collections.namedtuple('Match', 'decision rules exception')
+
+NO_MATCH = Match('none', (), None)
+
+decisions = [
+    ('block', 'block'),
+    ('hide', 'css-display-none'),
+    ('block-cookies', 'block-cookies'),
+    ('make-https', 'make-https'),
+]
+
+
+def url_host(url):
+    start = url.find('://')
+    start = 0 if start < 0 else start + 3
+    end = len(url)
+    for c in '/?#':
+        i = url.find(c, start, end)
+        if i >= 0:
+            end = i
+    host = url[start:end]
+    host = host[host.rfind('@') + 1:]
+    if host.startswith('['):
+        return host[:host.find(']') + 1].lower()
+    return host.split(':', 1)[0].lower()
+
+
+def base_domain(host):
+    labels = host.split('.')
+    if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in second_level:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+
+def parent_domains(host):
+    # host and every domain above it
+    yield host
+    i = host.find('.')
+    while i >= 0:
+        host = host[i + 1:]
+        yield host
+        i = host.find('.')
+
+
+def domain_matches(host, entries):
+    for entry in entries:
+        if entry[0] == '*':
+            entry = entry[1:]
+            if host == entry or host.endswith('.' + entry):
+                return True
+        elif host == entry:
+            return True
+    return False
+
+
+def literal_runs(terms):
+    # the runs of literal characters a url must contain, lowercased
+    runs = []
+    run = []
+    for term in terms:
+        if term[0] == 'char':
+            run.append(term[1])
+            continue
+        if run:
+            runs.append(''.join(run).lower())
+            run = []
+    if run:
+        runs.append(''.join(run).lower())
+    return runs
+
+
+def rule_grams(url_filter):
+    try:
+        runs = literal_runs(parse(url_filter).terms)
+    except (UrlFilterError, RecursionError):
+        return set()
+    return set(run[i:i + gram_length] for run in runs for i in range(len(run) - gram_length + 1))
+
+
+class Trigger(object):
+    # the conditions shared by rules with the same action type, tested once
+    # for all of them. the url-filter is compiled the first time it is needed
+    __slots__ = ('url_filter', 'flags', 'regex', 'if_domain', 'unless_domain', 'load_type', 'resource_type', 'action_type', 'rules')
+
+    def __init__(self, rule):
+        self.url_filter = rule.url_filter
+        self.flags = 0 if rule.case_sensitive else re.IGNORECASE
+        self.regex = None
+        self.if_domain = rule.if_domain
+        self.unless_domain = rule.unless_domain
+        self.load_type = rule.load_type[0] if rule.load_type and len(rule.load_type) == 1 else None
+        self.resource_type = frozenset(rule.resource_type) if rule.resource_type else None
+        self.action_type = rule.action.type
+        # indexes of the rules, ascending
+        self.rules = []
+
+    def matches(self, url, page_host, resource_type, third_party):
+        if self.resource_type is not None and resource_type not in self.resource_type:
+            return False
+        if self.load_type is not None and (self.load_type == 'third-party') != third_party:
+            return False
+        if self.if_domain and not domain_matches(page_host, self.if_domain):
+            return False
+        if self.unless_domain and domain_matches(page_host, self.unless_domain):
+            return False
+        regex = self.regex
+        if regex is None:
+            try:
+                regex = self.regex = re.compile(self.url_filter, self.flags)
+            except re.error:
+                regex = self.regex = False
+        return regex is not False and regex.search(url) is not None
+
+
+class TriggerIndex(object):
+    # triggers by rarest k-gram, by if-domain entry, or tested on every url
+    def __init__(self):
+        self.grams = {}
+        self.domains = {}
+        self.generic = []
+
+    def add(self, n, trigger, grams, frequency):
+        if grams:
+            gram = min(grams, key=lambda g: (frequency[g], g))
+            self.grams.setdefault(gram, []).append(n)
+        elif trigger.if_domain:
+            for entry in trigger.if_domain:
+                self.domains.setdefault(entry.lstrip('*'), []).append(n)
+        else:
+            self.generic.append(n)
+
+    def collect(self, found, lower_url, page_host):
+        found.update(self.generic)
+        grams = self.grams
+        if grams:
+            for i in range(len(lower_url) - gram_length + 1):
+                triggers = grams.get(lower_url[i:i + gram_length])
+                if triggers:
+                    found.update(triggers)
+        domains = self.domains
+        if domains:
+            for domain in parent_domains(page_host):
+                triggers = domains.get(domain)
+                if triggers:
+                    found.update(triggers)
+
+
+class Matcher(object):
+    def __init__(self, rules):
+        self.triggers = []
+        self.rule_count = len(rules)
+        # css-display-none triggers apart, they are only looked up for documents
+        self.network = TriggerIndex()
+        self.css = TriggerIndex()
+
+        keys = {}
+        for index, rule in enumerate(rules):
+            key = (rule.url_filter, rule.case_sensitive, rule.load_type, rule.if_domain, rule.unless_domain, rule.resource_type, rule.action.type)
+            n = keys.get(key)
+            if n is None:
+                n = keys[key] = len(self.triggers)
+                self.triggers.append(Trigger(rule))
+            self.triggers[n].rules.append(index)
+
+        gram_sets = [rule_grams(t.url_filter) for t in self.triggers]
+        frequency = collections.Counter()
+        for grams in gram_sets:
+            frequency.update(grams)
+        for n, (trigger, grams) in enumerate(zip(self.triggers, gram_sets)):
+            index = self.css if trigger.action_type == 'css-display-none' else self.network
+            index.add(n, trigger, grams, frequency)
+
+    def summary(self):
+        indexes = [self.network, self.css]
+        return 'Indexed %d rules with %d triggers: %d by %d tokens, %d by domain, %d tested on every url' % (
+            self.rule_count, len(self.triggers),
+            sum(len(v) for i in indexes for v in i.grams.values()), sum(len(i.grams) for i in indexes),
+            sum(len(set(n for v in i.domains.values() for n in v)) for i in indexes), sum(len(i.generic) for i in indexes))
+
+    def candidates(self, url, page_host, document=True):
+        # numbers of the triggers that may match
+        found = set()
+        lower = url.lower()
+        self.network.collect(found, lower, page_host)
+        if document:
+            self.css.collect(found, lower, page_host)
+        return found
+
+    def matching(self, request):
+        # the triggers that match request
+        url = request.url
+        page_host = url_host(request.page) if '://' in request.page else request.page.lower()
+        third_party = base_domain(url_host(url)) != base_domain(page_host)
+        resource_type = request.resource_type
+        document = resource_type == 'document'
+        triggers = self.triggers
+        matched = []
+        for n in self.candidates(url, page_host, document):
+            trigger = triggers[n]
+            if trigger.matches(url, page_host, resource_type, third_party):
+                matched.append(trigger)
+        return matched
+
+    def applied(self, matched):
+        # the last exception among the matched triggers and, for every other
+        # trigger, the rules after it: [(trigger, rules), ...]
+        exception = None
+        for trigger in matched:
+            if trigger.action_type == 'ignore-previous-rules' and (exception is None or trigger.rules[-1] > exception):
+                exception = trigger.rules[-1]
+        applied = []
+        for trigger in matched:
+            if trigger.action_type == 'ignore-previous-rules':
+                continue
+            rules = trigger.rules
+            if exception is not None:
+                rules = rules[bisect.bisect_right(rules, exception):]
+            if rules:
+                applied.append((trigger, rules))
+        return exception, applied
+
+    def decide(self, exception, applied):
+        # the Match for the result of applied
+        if not applied:
+            return NO_MATCH if exception is None else Match('allow', (), exception)
+        for decision, action_type in decisions:
+            groups = [rules for trigger, rules in applied if trigger.action_type == action_type]
+            if groups:
+                break
+        if len(groups) == 1:
+            return Match(decision, tuple(groups[0]), exception)
+        rules = [i for g in groups for i in g]
+        rules.sort()
+        return Match(decision, tuple(rules), exception)
+
+    def match(self, request):
+        matched = self.matching(request)
+        if not matched:
+            return NO_MATCH
+        exception, applied = self.applied(matched)
+        return self.decide(exception, applied)
+
+
+def parse_request(line):
+    # "URL [PAGE [TYPE]]" -> Request, None for blank lines and # comments
+    fields = line.split()
+    if not fields or fields[0].startswith('#'):
+        return None
+    url = fields[0]
+    page = fields[1] if len(fields) > 1 else url
+    resource_type = fields[2] if len(fields) > 2 else 'document'
+    return Request(url, page, resource_type)
+
+
+def iter_requests(fp):
+    for line in fp:
+        request = parse_request(line)
+        if request:
+            yield request
+
+
+def main(argv, stdin=None, stdout=None, stderr=None):
+    import itertools
+
+    from .options import parse_match_opts
+    from .rulefile import RuleFileError, load_rules
+
+    options = parse_match_opts(argv, stdin=stdin, stdout=stdout, stderr=stderr)
+    try:
+        rules = load_rules(options.rules)
+    except (IOError, OSError, RuleFileError, KeyError) as e:
+        options.stderr.write('%s: %s\n' % (options.rules, e))
+        return 2
+
+    start = time.perf_counter()
+    matcher = Matcher(rules)
+    options.stderr.write('%s in %.2fs\n' % (matcher.summary(), time.perf_counter() - start))
+
+    if options.urls:
+        files = [open(path) for path in options.urls]
+    else:
+        files = [options.stdin]
+    out = open(options.output, 'w') if options.output else options.stdout
+    counts = collections.Counter()
+    start = time.perf_counter()
+    try:
+        for request in itertools.chain.from_iterable(iter_requests(fp) for fp in files):
+            m = matcher.match(request)
+            counts[m.decision] += 1
+            if not options.quiet:
+                shown = [m.exception] if m.decision == 'allow' else m.rules
+                out.write('%s\t%s\t%s\n' % (m.decision, request.url, ','.join(map(str, shown))))
+    finally:
+        if options.output:
+            out.close()
+        for fp in files:
+            if fp is not options.stdin:
+                fp.close()
+    seconds = time.perf_counter() - start
+    total = sum(counts.values())
+    options.stderr.write('Matched %d urls in %.2fs (%d urls/sec): %s\n' % (
+        total, seconds, total / seconds if seconds else 0,
+        ', '.join('%d %s' % (count, decision) for decision, count in counts.most_common())))
+    return 0
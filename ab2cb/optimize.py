@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+# rule deduplication and merging
+#
+# exact duplicates are dropped, and rules that differ in a single trigger
+# field are merged when one rule with the combined field matches exactly the
+# requests that any of them matched:
+#   resource-type  union, a rule without resource-type takes in the others
+#   load-type      union, first-party together with third-party is no load-type
+#   if-domain      union, a rule without domains takes in the others
+#   unless-domain  only the domains that every rule excepts
+#
+# element hiding rules with the same trigger can also be batched into one
+# rule whose selector is the comma-joined list of their selectors.
+#
+# block rules all come before ignore-previous-rules in the output, so moving
+# a rule to the position of the first rule it merges with never changes
+# which exceptions apply to it.
+
+import collections
+
+from .ab2cb import resource_type_bits
+from .rules import css_display_none, intern_tuple
+
+resource_type_order = dict((name, i) for i, (bits, name) in enumerate(resource_type_bits))
+
+# merging along one field can make rules equal along another
+max_rounds = 4
+
+# longest joined selector list of a batched element hiding rule
+max_selector_length = 16384
+
+
+def domain_index(domains):
+    # lower cased entries, and the hosts whose subdomains they also match
+    entries = set()
+    stars = set()
+    for d in domains:
+        d = d.lower()
+        entries.add(d)
+        if d[:1] == '*':
+            stars.add(d[1:])
+    return entries, stars
+
+
+def is_covered(domain, index, strictly=False):
+    # is every host matched by domain also matched by an entry of the index?
+    entries, stars = index
+    domain = domain.lower()
+    if not strictly and domain in entries:
+        return True
+    host = domain[1:] if domain[:1] == '*' else domain
+    if host != domain and not strictly and host in stars:
+        return True
+    if host == domain and host in stars:
+        return True
+    dot = host.find('.')
+    while dot >= 0:
+        if host[dot + 1:] in stars:
+            return True
+        dot = host.find('.', dot + 1)
+    return False
+
+
+def reduce_domains(domains):
+    # drop repeated entries and entries already matched by another one
+    unique = list(collections.OrderedDict.fromkeys(domains))
+    index = domain_index(unique)
+    return [d for d in unique if not is_covered(d, index, strictly=True)]
+
+
+def intersect_domains(a, b):
+    # the hosts matched by both lists: every entry of one list that an entry
+    # of the other list matches
+    index_a = domain_index(a)
+    index_b = domain_index(b)
+    both = [y for y in b if is_covered(y, index_a)] + [x for x in a if is_covered(x, index_b)]
+    return reduce_domains(both)
+
+
+def merge_resource_type(rules):
+    if any(r.resource_type is None for r in rules):
+        return None
+    names = set()
+    for r in rules:
+        names.update(r.resource_type)
+    return intern_tuple(sorted(names, key=lambda n: resource_type_order.get(n, len(resource_type_order))))
+
+
+def merge_load_type(rules):
+    if any(r.load_type is None for r in rules):
+        return None
+    names = set()
+    for r in rules:
+        names.update(r.load_type)
+    if len(names) > 1:
+        return None
+    return rules[0].load_type
+
+
+def merge_if_domain(rules):
+    if any(r.if_domain is None for r in rules):
+        return None
+    domains = []
+    for r in rules:
+        domains.extend(r.if_domain)
+    return intern_tuple(reduce_domains(domains))
+
+
+def merge_unless_domain(rules):
+    if any(r.unless_domain is None for r in rules):
+        return None
+    domains = reduce_domains(rules[0].unless_domain)
+    for r in rules[1:]:
+        domains = intersect_domains(domains, r.unless_domain)
+        if not domains:
+            return None
+    return intern_tuple(domains)
+
+
+# (field, key index, merge function, fields that must be unset for the merge to be exact)
+merges = [
+    ('resource_type', 5, merge_resource_type, ()),
+    ('load_type', 2, merge_load_type, ()),
+    ('if_domain', 3, merge_if_domain, ('unless_domain',)),
+    ('unless_domain', 4, merge_unless_domain, ('if_domain',)),
+]
+
+
+def batchable(selector):
+    # leave alone selectors that could make a whole batch invalid: one bad
+    # selector in a list hides nothing
+    if ':-abp-' in selector or ':-moz-' in selector:
+        return False
+    depth = 0
+    quote = None
+    for c in selector:
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in '"\'':
+            quote = c
+        elif c in '([':
+            depth += 1
+        elif c in ')]':
+            depth -= 1
+            if depth < 0:
+                return False
+    return depth == 0 and quote is None and '\\' not in selector
+
+
+class RuleOptimizer(object):
+    def __init__(self, merge=True, batch_selectors=0):
+        self.merge_rules = merge
+        self.batch_size = batch_selectors
+        self.duplicates = 0
+        self.merged = collections.OrderedDict((m[0], 0) for m in merges)
+        self.batched = 0
+        self.batches = 0
+
+    def dedupe(self, rules):
+        seen = set()
+        result = []
+        for r in rules:
+            key = r.key()
+            if key in seen:
+                self.duplicates += 1
+                continue
+            seen.add(key)
+            result.append(r)
+        return result
+
+    def merge(self, rules, field, index, merge_function, unset):
+        groups = collections.OrderedDict()
+        for i, r in enumerate(rules):
+            if any(getattr(r, name) is not None for name in unset):
+                key = (i,)
+            else:
+                key = r.key()
+                key = key[:index] + key[index + 1:]
+            groups.setdefault(key, []).append(r)
+
+        result = []
+        for group in groups.values():
+            if len(group) == 1:
+                result.append(group[0])
+                continue
+            result.append(group[0].copy(**{field: merge_function(group)}))
+            self.merged[field] += len(group) - 1
+        return result
+
+    def batch(self, rules):
+        # join the selectors of element hiding rules with the same trigger
+        groups = collections.OrderedDict()
+        for i, r in enumerate(rules):
+            if r.action.type == 'css-display-none' and batchable(r.action.selector):
+                key = r.key()[:-1]
+            else:
+                key = (i,)
+            groups.setdefault(key, []).append(r)
+
+        result = []
+        for group in groups.values():
+            if len(group) == 1:
+                result.append(group[0])
+                continue
+            selectors = list(collections.OrderedDict.fromkeys(r.action.selector for r in group))
+            batches = []
+            for selector in selectors:
+                if batches and len(batches[-1][0]) < self.batch_size and batches[-1][1] + len(selector) + 2 <= max_selector_length:
+                    batches[-1][0].append(selector)
+                    batches[-1][1] += len(selector) + 2
+                else:
+                    batches.append([[selector], len(selector)])
+            for batch, length in batches:
+                result.append(group[0].copy(action=css_display_none(', '.join(batch))))
+            self.batched += len(group)
+            self.batches += len(batches)
+        return result
+
+    def optimize(self, rules):
+        if self.merge_rules:
+            rules = self.dedupe(rules)
+            for i in range(max_rounds):
+                before = len(rules)
+                for field, index, merge_function, unset in merges:
+                    rules = self.merge(rules, field, index, merge_function, unset)
+                rules = self.dedupe(rules)
+                if len(rules) == before:
+                    break
+        if self.batch_size > 1:
+            rules = self.batch(rules)
+        return rules
+
+    @property
+    def eliminated(self):
+        return self.duplicates + sum(self.merged.values()) + self.batched - self.batches
+
+    def summary(self):
+        lines = []
+        if self.merge_rules:
+            merged = ', '.join('%d by %s' % (count, field.replace('_', '-')) for field, count in self.merged.items())
+            lines.append('Optimised away %d rules: %d duplicates, merged %s' % (self.duplicates + sum(self.merged.values()), self.duplicates, merged))
+        if self.batch_size > 1:
+            lines.append('Batched %d element hiding rules into %d' % (self.batched, self.batches))
+        return '\n'.join(lines)
+
+
+def optimize_rules(rules, merge=True, batch_selectors=0):
+    optimizer = RuleOptimizer(merge, batch_selectors)
+    return optimizer.optimize(rules), optimizer
@@ -57,6 +57,13 @@ def parse_opts(argv, stdin=None, stdout=None, stderr=None):
         help='Save rules that were included in the output to FILE'
     )
 
+    parser.add_argument(
+        '--rejected',
+        dest='rejected',
+        metavar='FILE',
+        help='Save every filter line that produced no rules to FILE with the reason, followed by a count of each reason.'
+    )
+
     parser.add_argument(
         '--strip-whitespace',
         dest='strip_whitespace',
@@ -73,6 +80,119 @@ def parse_opts(argv, stdin=None, stdout=None, stderr=None):
         help='Do not generate any CSS rules'
     )
 
+    parser.add_argument(
+        '--simplify',
+        dest='simplify',
+        action='store_true',
+        default=False,
+        help='Rewrite url-filters into equivalent patterns that are cheaper to compile.'
+    )
+
+    parser.add_argument(
+        '--simplified',
+        dest='simplified',
+        metavar='FILE',
+        help='Save every url-filter rewritten by --simplify to FILE with the characters and estimated DFA states saved. Implies --simplify.'
+    )
+
+    parser.add_argument(
+        '--fold-exceptions',
+        dest='fold_exceptions',
+        action='store_true',
+        default=False,
+        help='Replace exceptions by domains on, or removal of, the rules they override where that is exact.'
+    )
+
+    parser.add_argument(
+        '--optimize',
+        dest='optimize',
+        action='store_true',
+        default=False,
+        help='Drop duplicate rules and merge rules that differ only in resource-type, load-type or domains.'
+    )
+
+    parser.add_argument(
+        '--batch-selectors',
+        dest='batch_selectors',
+        metavar='N',
+        type=int,
+        default=0,
+        help='Join the selectors of up to N element hiding rules with the same domains into one rule.'
+    )
+
+    parser.add_argument(
+        '--max-rules-per-file',
+        dest='max_rules_per_file',
+        metavar='N',
+        type=int,
+        default=0,
+        help='Split the output into files of at most N rules, named after --output, and write a manifest of the files.'
+    )
+
+    parser.add_argument(
+        '--shard-by',
+        dest='shard_by',
+        choices=['sequential', 'category', 'specificity'],
+        default='sequential',
+        help='How rules are split with --max-rules-per-file: in output order (default), network and css rules apart, or generic and domain specific rules apart.'
+    )
+
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        dest='jobs',
+        metavar='N',
+        type=int,
+        default=1,
+        help='Convert using N worker processes. 0 means one per CPU.'
+    )
+
+    parser.add_argument(
+        '--cache',
+        dest='cache_dir',
+        metavar='DIR',
+        help='Keep a per-line conversion cache in DIR, shared between runs.'
+    )
+
+    parser.add_argument(
+        '--cache-size',
+        dest='cache_size',
+        metavar='MB',
+        type=int,
+        default=256,
+        help='Evict least recently used cache entries above MB megabytes (default 256).'
+    )
+
+    parser.add_argument(
+        '--previous',
+        dest='previous_dir',
+        metavar='DIR',
+        help='Reuse the conversion state saved in DIR by the previous run and only convert lines that changed. The new state is saved back to DIR.'
+    )
+
+    parser.add_argument(
+        '--profile',
+        dest='profile',
+        metavar='FILE',
+        help='Save the time spent in each conversion stage, rule counts and the slowest lines to FILE as json.'
+    )
+
+    parser.add_argument(
+        '--profile-lines',
+        dest='profile_lines',
+        metavar='N',
+        type=int,
+        default=20,
+        help='Number of slowest lines listed by --profile (default 20).'
+    )
+
+    parser.add_argument(
+        '--cprofile',
+        dest='cprofile',
+        metavar='FILE',
+        help='Save cProfile statistics of the whole run to FILE, for pstats.'
+    )
+
     parser.add_argument(
         'files',
         metavar='File',
@@ -82,14 +202,351 @@ def parse_opts(argv, stdin=None, stdout=None, stderr=None):
 
     # print('argv = %s' % argv)
     options = parser.parse_args(argv)
+    if options.max_rules_per_file and not options.output:
+        parser.error('--max-rules-per-file needs --output')
 
     # set up i/o options
     options.stdin = stdin or sys.stdin
     options.stdout = stdout or sys.stdout
     options.stderr = stderr or sys.stderr
 
+    options.pool = None
+    options.start_method = None
+    options.cache = None
+    options.previous = None
+    options.memory = None
+    options.profiler = None
+    options.suppress_file_access_errors = False
     options.did_extract = False
     options.exit_status = 'not-set'
 
     return options
 
+
+def parse_validate_opts(argv, stdin=None, stdout=None, stderr=None):
+    parser = argparse.ArgumentParser(
+        prog='%s validate' % program_name,
+        usage='%(prog)s [options] File ...',
+        description='check content blocker json files against the schema and the regular expressions WebKit accepts'
+    )
+
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        dest='jobs',
+        metavar='N',
+        type=int,
+        default=1,
+        help='Check url-filters using N worker processes. 0 means one per CPU.'
+    )
+
+    parser.add_argument(
+        '--max-errors',
+        dest='max_errors',
+        metavar='N',
+        type=int,
+        default=100,
+        help='Report at most N errors per file (default 100).'
+    )
+
+    parser.add_argument(
+        'files',
+        metavar='File',
+        nargs='+',
+        help='Content blocker json files to check.'
+    )
+
+    options = parser.parse_args(argv)
+
+    options.stdin = stdin or sys.stdin
+    options.stdout = stdout or sys.stdout
+    options.stderr = stderr or sys.stderr
+
+    return options
+
+
+def parse_match_opts(argv, stdin=None, stdout=None, stderr=None):
+    parser = argparse.ArgumentParser(
+        prog='%s match' % program_name,
+        usage='%(prog)s [options] Rules [Urls ...]',
+        description='evaluate requests against content blocker json. each line of Urls is "URL [PAGE [TYPE]]".'
+    )
+
+    parser.add_argument(
+        '-o',
+        '--output',
+        metavar='FILE',
+        help='Save the decision for each request to FILE. If not given, output to stdout.'
+    )
+
+    parser.add_argument(
+        '-q',
+        '--quiet',
+        dest='quiet',
+        action='store_true',
+        default=False,
+        help='Only report the count of each decision and the urls per second.'
+    )
+
+    parser.add_argument(
+        'rules',
+        metavar='Rules',
+        help='Content blocker json file.'
+    )
+
+    parser.add_argument(
+        'urls',
+        metavar='Urls',
+        nargs='*',
+        help='Files of requests to evaluate. If not given read from stdin.'
+    )
+
+    options = parser.parse_args(argv)
+
+    options.stdin = stdin or sys.stdin
+    options.stdout = stdout or sys.stdout
+    options.stderr = stderr or sys.stderr
+
+    return options
+
+
+def parse_prune_opts(argv, stdin=None, stdout=None, stderr=None):
+    parser = argparse.ArgumentParser(
+        prog='%s prune' % program_name,
+        usage='%(prog)s --max-rules N [options] Rules [Logs ...]',
+        description='keep the rules hit most often by the requests in Logs, within a rule budget. each line of Logs is "URL [PAGE [TYPE]]".'
+    )
+
+    parser.add_argument(
+        '--max-rules',
+        dest='max_rules',
+        metavar='N',
+        type=int,
+        required=True,
+        help='Keep at most N rules, exceptions included.'
+    )
+
+    parser.add_argument(
+        '-o',
+        '--output',
+        metavar='FILE',
+        help='Save the kept rules to FILE. If not given, output to stdout.'
+    )
+
+    parser.add_argument(
+        '--report',
+        dest='report',
+        metavar='FILE',
+        help='Save the hits, the coverage lost and the most hit dropped rules to FILE as json.'
+    )
+
+    parser.add_argument(
+        '--strip-whitespace',
+        dest='strip_whitespace',
+        action='store_true',
+        default=False,
+        help='Strip all whitespace from the generated file.'
+    )
+
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        dest='jobs',
+        metavar='N',
+        type=int,
+        default=1,
+        help='Replay using N worker processes. 0 means one per CPU.'
+    )
+
+    parser.add_argument(
+        'rules',
+        metavar='Rules',
+        help='Content blocker json file.'
+    )
+
+    parser.add_argument(
+        'logs',
+        metavar='Logs',
+        nargs='*',
+        help='Request logs to replay. If not given read from stdin.'
+    )
+
+    options = parser.parse_args(argv)
+
+    options.stdin = stdin or sys.stdin
+    options.stdout = stdout or sys.stdout
+    options.stderr = stderr or sys.stderr
+
+    return options
+
+
+def parse_diff_behavior_opts(argv, stdin=None, stdout=None, stderr=None):
+    parser = argparse.ArgumentParser(
+        prog='%s diff-behavior' % program_name,
+        usage='%(prog)s [options] A B [--urls Urls ...]',
+        description='list the requests two content blockers decide differently. each line of Urls is "URL [PAGE [TYPE]]".'
+    )
+
+    parser.add_argument(
+        '--urls',
+        dest='urls',
+        metavar='Urls',
+        nargs='+',
+        default=[],
+        help='Files of requests to compare. If not given read from stdin.'
+    )
+
+    parser.add_argument(
+        '-o',
+        '--output',
+        metavar='FILE',
+        help='Save the requests that differ to FILE. If not given, output to stdout.'
+    )
+
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        dest='jobs',
+        metavar='N',
+        type=int,
+        default=1,
+        help='Compare using N worker processes. 0 means one per CPU. One process compares a few thousand requests a second, so use -j 0 for large request files.'
+    )
+
+    parser.add_argument(
+        'a',
+        metavar='A',
+        help='Reference content blocker json file.'
+    )
+
+    parser.add_argument(
+        'b',
+        metavar='B',
+        help='Content blocker json file compared to A.'
+    )
+
+    options = parser.parse_args(argv)
+
+    options.stdin = stdin or sys.stdin
+    options.stdout = stdout or sys.stdout
+    options.stderr = stderr or sys.stderr
+
+    return options
+
+
+def parse_cost_opts(argv, stdin=None, stdout=None, stderr=None):
+    parser = argparse.ArgumentParser(
+        prog='%s cost' % program_name,
+        usage='%(prog)s [options] Rules',
+        description='estimate the DFA states WebKit needs for a content blocker and list the most expensive rules'
+    )
+
+    parser.add_argument(
+        '--top',
+        dest='top',
+        metavar='N',
+        type=int,
+        default=20,
+        help='Number of most expensive rules listed (default 20).'
+    )
+
+    parser.add_argument(
+        '-o',
+        '--output',
+        metavar='FILE',
+        help='Save the estimates to FILE as json.'
+    )
+
+    parser.add_argument(
+        'rules',
+        metavar='Rules',
+        help='Content blocker json file.'
+    )
+
+    options = parser.parse_args(argv)
+
+    options.stdin = stdin or sys.stdin
+    options.stdout = stdout or sys.stdout
+    options.stderr = stderr or sys.stderr
+
+    return options
+
+
+def parse_serve_opts(argv, stdin=None, stdout=None, stderr=None):
+    parser = argparse.ArgumentParser(
+        prog='%s serve' % program_name,
+        usage='%(prog)s [options]',
+        description='convert jobs sent over a unix socket, keeping caches warm between them'
+    )
+
+    parser.add_argument(
+        '--socket',
+        dest='socket',
+        metavar='PATH',
+        help='Listen on PATH (default ab2cb.sock in $XDG_RUNTIME_DIR, or in a private ab2cb-UID directory in the temporary directory).'
+    )
+
+    parser.add_argument(
+        '--poll',
+        dest='poll',
+        metavar='SECONDS',
+        type=float,
+        default=1.0,
+        help='Check the input files of watched jobs every SECONDS (default 1).'
+    )
+
+    options = parser.parse_args(argv)
+
+    options.stdin = stdin or sys.stdin
+    options.stdout = stdout or sys.stdout
+    options.stderr = stderr or sys.stderr
+
+    return options
+
+
+def parse_send_opts(argv, stdin=None, stdout=None, stderr=None):
+    parser = argparse.ArgumentParser(
+        prog='%s send' % program_name,
+        usage='%(prog)s [options] [--] [ab2cb options] [File ...]',
+        description='run a conversion on a running ab2cb serve'
+    )
+
+    parser.add_argument(
+        '--socket',
+        dest='socket',
+        metavar='PATH',
+        help='Server socket (default ab2cb.sock in $XDG_RUNTIME_DIR, or in a private ab2cb-UID directory in the temporary directory).'
+    )
+
+    parser.add_argument(
+        '--watch',
+        dest='watch',
+        action='store_true',
+        default=False,
+        help='Also convert again whenever an input file changes. Needs --output.'
+    )
+
+    parser.add_argument(
+        '--stdin',
+        dest='send_stdin',
+        action='store_true',
+        default=False,
+        help='Send stdin to be converted when no File is given.'
+    )
+
+    parser.add_argument(
+        'args',
+        metavar='ab2cb options',
+        nargs=argparse.REMAINDER,
+        help='Arguments of the conversion, as for ab2cb.'
+    )
+
+    options = parser.parse_args(argv)
+    if options.args[:1] == ['--']:
+        options.args = options.args[1:]
+
+    options.stdin = stdin or sys.stdin
+    options.stdout = stdout or sys.stdout
+    options.stderr = stderr or sys.stderr
+
+    return options
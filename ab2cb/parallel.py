@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# process pool conversion
+#
+# lines are handed to the workers in chunks and come back as
+# (accepted line, [(is exception, json fragment), ...]) so that the only
+# thing pickled on the way back is plain strings
+
+import collections
+import multiprocessing
+import os
+
+from .ab2cb import chunked, convert_lines
+
+# lines per task: large enough to amortise the pickling round trip
+chunk_size = 2000
+
+
+def open_pool(options, start_method=None):
+    # start_method as for multiprocessing.get_context, None for the default
+    jobs = options.jobs
+    if jobs < 1:
+        jobs = os.cpu_count() or 1
+    options.jobs = jobs
+    if jobs == 1:
+        return None
+    return multiprocessing.get_context(start_method).Pool(jobs)
+
+
+def convert_parallel(pool, jobs, lines, no_css, strip_whitespace, cache=None):
+    # keep a bounded window of chunks in flight and yield results in input order
+    pending = collections.deque()
+    for chunk in chunked(lines, chunk_size):
+        pending.append(pool.apply_async(convert_lines, (chunk, no_css, strip_whitespace, cache)))
+        if len(pending) >= jobs * 2:
+            for result in pending.popleft().get():
+                yield result
+    while pending:
+        for result in pending.popleft().get():
+            yield result
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# per stage timings for --profile
+#
+# exactly one stage is charged at any time: entering a stage pauses the one
+# it was entered from, so every stage's time is its own. the stages are
+#   read       reading and filtering input lines
+#   parse      turning a line into rules, less the url-filter translation
+#   translate  translate_url_filter
+#   convert    waiting for lines converted elsewhere (--jobs, --cache, --previous)
+#   simplify   --simplify
+#   fold       --fold-exceptions
+#   optimize   --optimize and --batch-selectors
+#   serialize  rules to json
+#   write      writing the output
+# lines are only timed one by one when they are converted in this process.
+# nothing here runs unless --profile is given.
+
+import collections
+import contextlib
+import heapq
+import json
+import time
+
+from . import ab2cb as converter
+
+kinds = ['lines', 'rejected', 'block', 'exception', 'element_hiding', 'split']
+
+
+class Profiler(object):
+    def __init__(self, slowest=20):
+        self.wall = collections.OrderedDict()
+        self.cpu = collections.OrderedDict()
+        self.counts = collections.OrderedDict((k, 0) for k in kinds)
+        self.slowest_count = slowest
+        self.slowest = []
+        self.rejected = collections.Counter()
+        self.per_line = False
+        self.current = 'other'
+        self.last = (time.perf_counter(), time.process_time())
+        self.started = self.last
+        # handed to convert_text in place of translate_url_filter
+        self.translate = self.timed_function(converter.translate_url_filter, 'translate')
+
+    def switch(self, name):
+        # charge the time since the last switch to the current stage
+        now = (time.perf_counter(), time.process_time())
+        current = self.current
+        self.wall[current] = self.wall.get(current, 0.0) + now[0] - self.last[0]
+        self.cpu[current] = self.cpu.get(current, 0.0) + now[1] - self.last[1]
+        self.current = name
+        self.last = now
+        return current
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        previous = self.switch(name)
+        try:
+            yield
+        finally:
+            self.switch(previous)
+
+    def timed_function(self, function, name):
+        def timed(*args):
+            previous = self.switch(name)
+            try:
+                return function(*args)
+            finally:
+                self.switch(previous)
+        return timed
+
+    def timed(self, items, name):
+        # charge pulling each item to name
+        it = iter(items)
+        while True:
+            previous = self.switch(name)
+            item = next(it, None)
+            self.switch(previous)
+            if item is None:
+                return
+            yield item
+
+    def read(self, lines):
+        for line in self.timed(lines, 'read'):
+            self.counts['lines'] += 1
+            yield line
+
+    def converted(self, results):
+        for result in self.timed(results, 'convert'):
+            self.count(result[1])
+            yield result
+
+    def count(self, fragments):
+        if not fragments:
+            self.rejected[fragments.reason] += 1
+            return
+        if len(fragments) > 1:
+            self.counts['split'] += 1
+        for is_exception, fragment in fragments:
+            if is_exception:
+                self.counts['exception'] += 1
+            elif '"css-display-none"' in fragment:
+                self.counts['element_hiding'] += 1
+            else:
+                self.counts['block'] += 1
+
+    def record(self, line, seconds):
+        entry = (seconds, self.counts['lines'], line)
+        if len(self.slowest) < self.slowest_count:
+            heapq.heappush(self.slowest, entry)
+        elif self.slowest_count:
+            heapq.heappushpop(self.slowest, entry)
+
+    def convert(self, lines, no_css, strip_whitespace):
+        # convert_line, timed line by line
+        self.per_line = True
+        for line in self.read(lines):
+            outer = self.switch('parse')
+            start = self.last[0]
+            rules = converter.convert_text(line, no_css, self.translate)
+            if not rules:
+                self.switch(outer)
+                self.count(rules)
+                self.record(line, self.last[0] - start)
+                yield (line, rules)
+                continue
+            self.switch('serialize')
+            fragments = [(r.is_exception, r.to_json(strip_whitespace)) for r in rules]
+            self.switch(outer)
+            self.count(fragments)
+            self.record(line, self.last[0] - start)
+            yield (converter.accepted_line(line), fragments)
+
+    def close(self):
+        self.switch('other')
+
+    def report(self):
+        wall = self.last[0] - self.started[0]
+        cpu = self.last[1] - self.started[1]
+        self.counts['rejected'] = sum(self.rejected.values())
+        stages = collections.OrderedDict()
+        for name in self.wall:
+            stages[name] = collections.OrderedDict([('wall_seconds', self.wall[name]), ('cpu_seconds', self.cpu[name])])
+        return collections.OrderedDict([
+            ('wall_seconds', wall),
+            ('cpu_seconds', cpu),
+            ('lines_per_second', self.counts['lines'] / wall if wall else None),
+            ('stages', stages),
+            ('counts', self.counts),
+            ('rejected', collections.OrderedDict(sorted(self.rejected.items()))),
+            ('per_line_timing', self.per_line),
+            ('slowest', [collections.OrderedDict([('seconds', s), ('line', l)]) for s, n, l in sorted(self.slowest, reverse=True)]),
+        ])
+
+    def save(self, path):
+        self.close()
+        with open(path, 'w') as fp:
+            json.dump(self.report(), fp, indent=4)
+            fp.write('\n')
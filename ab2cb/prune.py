@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+# cut a content blocker down to a rule budget using request logs
+#
+#   ab2cb prune --max-rules N [-o FILE] [--report FILE] Rules.json [Logs ...]
+#
+# each line of Logs (stdin if not given) is a request as for ab2cb match.
+# identical requests are counted once and replayed with their count,
+# through the Matcher index, on a process pool with -j. a rule is hit by a
+# request when its action applies to it.
+#
+# block rules are then kept by descending hits, zero hit rules last in
+# their original order, until the budget is used. every exception that may
+# override a kept rule is kept along with it, decided conservatively as for
+# output shards, so no kept block rule ever loses its exceptions. the kept
+# rules are written in their original order, and the requests whose
+# decision changes are replayed again to report the coverage lost.
+
+from __future__ import print_function
+
+import bisect
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import time
+
+from .matcher import Matcher, iter_requests
+from .rulefile import load_rules
+from .shard import Trigger
+
+# unique requests per task
+chunk_size = 2000
+
+# dropped rules listed in the report
+report_rules = 100
+
+# the matcher of this process, see init_replay
+replay_matcher = None
+
+
+def init_replay(path, keep=None):
+    global replay_matcher
+    rules = load_rules(path)
+    if keep is not None:
+        rules = [rules[i] for i in keep]
+    replay_matcher = Matcher(rules)
+
+
+def replay_hits(chunk):
+    # (hits per (trigger, first applied rule), exception hits, decision per request)
+    matcher = replay_matcher
+    hits = collections.Counter()
+    exceptions = collections.Counter()
+    decisions = []
+    for request, count in chunk:
+        exception, applied = matcher.applied(matcher.matching(request))
+        if exception is not None:
+            exceptions[exception] += count
+        for trigger, rules in applied:
+            hits[(trigger.rules[0], rules[0])] += count
+        decisions.append(matcher.decide(exception, applied).decision)
+    return hits, exceptions, decisions
+
+
+def replay_decisions(chunk):
+    matcher = replay_matcher
+    return [matcher.match(request).decision for request, count in chunk]
+
+
+def rule_hits(matcher, slice_hits, exception_hits):
+    # expand the hits per trigger slice into hits per rule
+    hits = collections.Counter(exception_hits)
+    triggers = dict((t.rules[0], t) for t in matcher.triggers)
+    for (first, start), count in slice_hits.items():
+        rules = triggers[first].rules
+        for index in rules[bisect.bisect_left(rules, start):]:
+            hits[index] += count
+    return hits
+
+
+def select_rules(rules, hits, max_rules):
+    # indexes of the rules to keep, ascending
+    groups = collections.OrderedDict()
+    for index, rule in enumerate(rules):
+        if rule.is_exception:
+            trigger = Trigger(rule)
+            groups.setdefault(trigger.key(), (trigger, []))[1].append(index)
+    remaining = list(groups.values())
+
+    blocks = [i for i, r in enumerate(rules) if not r.is_exception]
+    blocks.sort(key=lambda i: (-hits[i], i))
+    keep = []
+    for index in blocks:
+        if len(keep) >= max_rules:
+            break
+        trigger = Trigger(rules[index])
+        needed = [group for group in remaining if group[0].may_overlap(trigger)]
+        added = 1 + sum(len(group[1]) for group in needed)
+        if len(keep) + added > max_rules:
+            continue
+        keep.append(index)
+        for group in needed:
+            keep.extend(group[1])
+        if needed:
+            needed = set(id(group) for group in needed)
+            remaining = [group for group in remaining if id(group) not in needed]
+    keep.sort()
+    return keep
+
+
+def replay(pool, function, requests):
+    chunks = [requests[i:i + chunk_size] for i in range(0, len(requests), chunk_size)]
+    if pool:
+        return pool.imap(function, chunks)
+    return map(function, chunks)
+
+
+def open_replay_pool(options, path, keep=None):
+    # a pool whose workers each load the rules, or None to replay here
+    jobs = options.jobs if options.jobs > 0 else os.cpu_count() or 1
+    if jobs == 1:
+        init_replay(path, keep)
+        return None
+    return multiprocessing.Pool(jobs, init_replay, (path, keep))
+
+
+def main(argv, stdin=None, stdout=None, stderr=None):
+    from .options import parse_prune_opts
+    from .rulefile import RuleFileError
+    from .writer import RuleWriter
+
+    options = parse_prune_opts(argv, stdin=stdin, stdout=stdout, stderr=stderr)
+    try:
+        rules = load_rules(options.rules)
+    except (IOError, OSError, RuleFileError, KeyError) as e:
+        options.stderr.write('%s: %s\n' % (options.rules, e))
+        return 2
+
+    start = time.perf_counter()
+    files = [open(path) for path in options.logs] if options.logs else [options.stdin]
+    try:
+        counts = collections.Counter(itertools.chain.from_iterable(iter_requests(fp) for fp in files))
+    finally:
+        for fp in files:
+            if fp is not options.stdin:
+                fp.close()
+    requests = list(counts.items())
+    total = sum(counts.values())
+
+    pool = open_replay_pool(options, options.rules)
+    slice_hits = collections.Counter()
+    exception_hits = collections.Counter()
+    before = []
+    try:
+        for hits, exceptions, decisions in replay(pool, replay_hits, requests):
+            slice_hits.update(hits)
+            exception_hits.update(exceptions)
+            before.extend(decisions)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    seconds = time.perf_counter() - start
+    decided = collections.Counter()
+    for (request, count), decision in zip(requests, before):
+        decided[decision] += count
+    options.stderr.write('Replayed %d requests (%d unique) in %.2fs (%d requests/sec)\n' % (
+        total, len(requests), seconds, total / seconds if seconds else 0))
+
+    matcher = Matcher(rules) if pool else replay_matcher
+    hits = rule_hits(matcher, slice_hits, exception_hits)
+    keep = select_rules(rules, hits, options.max_rules)
+
+    out = open(options.output, 'w') if options.output else options.stdout
+    writer = RuleWriter(out, options.strip_whitespace)
+    for index in keep:
+        # written in input order, exceptions included
+        writer.add(False, rules[index].to_json(options.strip_whitespace))
+    writer.close()
+    if options.output:
+        out.close()
+    exceptions = sum(1 for i in keep if rules[i].is_exception)
+    options.stderr.write('Kept %d of %d rules (%d blocks, %d exceptions)\n' % (
+        len(keep), len(rules), len(keep) - exceptions, exceptions))
+
+    changed = collections.Counter()
+    if len(keep) < len(rules):
+        pool = open_replay_pool(options, options.rules, keep)
+        try:
+            after = itertools.chain.from_iterable(replay(pool, replay_decisions, requests))
+            for (request, count), old, new in zip(requests, before, after):
+                if old != new:
+                    changed[(old, new)] += count
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+    lost = sum(changed.values())
+    options.stderr.write('Lost coverage: %d of %d requests change decision (%.2f%%)%s\n' % (
+        lost, total, 100.0 * lost / total if total else 0,
+        ''.join(', %d %s -> %s' % (count, old, new) for (old, new), count in changed.most_common())))
+
+    if options.report:
+        kept = set(keep)
+        dropped = sorted((i for i in hits if i not in kept), key=lambda i: (-hits[i], i))
+        report = collections.OrderedDict([
+            ('rules', len(rules)),
+            ('kept', len(keep)),
+            ('kept-exceptions', exceptions),
+            ('max-rules', options.max_rules),
+            ('requests', total),
+            ('unique-requests', len(requests)),
+            ('decisions', dict(decided)),
+            ('lost-requests', lost),
+            ('lost-percent', round(100.0 * lost / total, 3) if total else 0),
+            ('changed', [collections.OrderedDict([('from', old), ('to', new), ('requests', count)]) for (old, new), count in changed.most_common()]),
+            ('dropped-hits', sum(hits[i] for i in dropped)),
+            ('dropped', [collections.OrderedDict([('rule', i), ('hits', hits[i])]) for i in dropped[:report_rules]]),
+        ])
+        with open(options.report, 'w') as fp:
+            json.dump(report, fp, indent=4)
+            fp.write('\n')
+    return 0
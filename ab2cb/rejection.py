@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# why a filter line produced no rules
+#
+# every place the converter drops a line returns one of the shared,
+# false-valued Rejection objects below instead of None, so existing
+# "if not rules" checks keep working and recording the reason costs
+# nothing. the reason codes are
+#   no-css              element hiding filter and --no-css was given
+#   unknown-option      an option the converter does not know
+#   unsupported-type    a content type content blockers cannot express
+#   empty-filter        nothing left of the filter once options are removed
+#   regex-filter        /regular expression/ filters
+#   empty-url-filter    the url-filter came out empty
+#   non-ascii           the url-filter is not ascii
+#   bad-domain          a $domain= name that cannot be IDNA encoded
+#   mixed-domains       $domain= with both included and excluded domains
+#   document-exception  @@...$document exceptions
+
+import collections
+
+reasons = [
+    'no-css',
+    'unknown-option',
+    'unsupported-type',
+    'empty-filter',
+    'regex-filter',
+    'empty-url-filter',
+    'non-ascii',
+    'bad-domain',
+    'mixed-domains',
+    'document-exception',
+]
+
+
+class Rejection(object):
+    __slots__ = ('reason',)
+
+    def __init__(self, reason):
+        self.reason = reason
+
+    def __bool__(self):
+        return False
+
+    def __len__(self):
+        return 0
+
+    def __iter__(self):
+        return iter(())
+
+    def __repr__(self):
+        return 'Rejection(%r)' % self.reason
+
+    def __reduce__(self):
+        # unpickle to the shared instance
+        return (rejection, (self.reason,))
+
+
+rejections = dict((r, Rejection(r)) for r in reasons)
+
+
+def rejection(reason):
+    return rejections[reason]
+
+
+class RejectionLedger(object):
+    # writes "reason<TAB>line" for every rejected line and, when closed, a
+    # histogram of the reasons as ! comment lines
+    def __init__(self, fp):
+        self.fp = fp
+        self.counts = collections.Counter()
+
+    def add(self, line, reason):
+        self.counts[reason] += 1
+        self.fp.write('%s\t%s\n' % (reason, line))
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def histogram(self):
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+
+    def close(self):
+        self.fp.write('! rejected %d lines\n' % self.total)
+        for reason, count in self.histogram():
+            self.fp.write('! %d %s\n' % (count, reason))
+        self.fp.close()
+
+    def summary(self):
+        return 'Rejected %d lines: %s' % (self.total, ', '.join('%d %s' % (count, reason) for reason, count in self.histogram()))
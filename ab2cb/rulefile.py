@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# reading content blocker json files
+#
+# the files can hold hundreds of thousands of rules, so the array is decoded
+# one element at a time from a bounded buffer instead of with json.load.
+
+import json
+
+from .rules import rule_from_dict
+
+read_size = 1 << 16
+
+
+class RuleFileError(ValueError):
+    pass
+
+
+def iter_json_array(fp):
+    # yield each element of the json array in fp
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill(buf, pos):
+        chunk = fp.read(read_size)
+        return buf[pos:] + chunk, 0, not chunk
+
+    def skip_space(buf, pos, eof):
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf) or eof:
+                return buf, pos, eof
+            buf, pos, eof = fill(buf, pos)
+
+    buf, pos, eof = skip_space(buf, pos, eof)
+    if pos >= len(buf) or buf[pos] != '[':
+        raise RuleFileError('expected a json array')
+    pos += 1
+    first = True
+    while True:
+        buf, pos, eof = skip_space(buf, pos, eof)
+        if pos >= len(buf):
+            raise RuleFileError('unterminated json array')
+        if buf[pos] == ']':
+            return
+        if not first:
+            if buf[pos] != ',':
+                raise RuleFileError('expected , between array elements')
+            buf, pos, eof = skip_space(buf, pos + 1, eof)
+        first = False
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except ValueError as e:
+                if eof:
+                    raise RuleFileError('invalid json: %s' % e)
+                buf, pos, eof = fill(buf, pos)
+                continue
+            if end == len(buf) and not eof:
+                # a number or literal may continue in the next chunk
+                buf, pos, eof = fill(buf, pos)
+                continue
+            break
+        yield obj
+        pos = end
+
+
+def iter_rule_dicts(path):
+    with open(path) as fp:
+        for rule in iter_json_array(fp):
+            yield rule
+
+
+def load_rules(path):
+    # the rules of a content blocker file as Rule objects, in order
+    return [rule_from_dict(r) for r in iter_rule_dicts(path)]
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# compact in-memory content blocker rules
+#
+# rules are slotted objects whose trigger fields are strings, booleans or
+# tuples. actions and the common trigger tuples are shared, and domain
+# tuples are interned, so equal rules share their parts. rules are only
+# turned into the Content Blocker json schema when they are written.
+
+import itertools
+import json
+from json.encoder import encode_basestring_ascii
+
+
+class Action(object):
+    __slots__ = ('type', 'selector')
+
+    def __init__(self, type, selector=None):
+        self.type = type
+        self.selector = selector
+
+    def __eq__(self, other):
+        return self.type == other.type and self.selector == other.selector
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.type, self.selector))
+
+    def __repr__(self):
+        return 'Action(%r, %r)' % (self.type, self.selector)
+
+    def items(self):
+        if self.selector is None:
+            return [('type', self.type)]
+        return [('type', self.type), ('selector', self.selector)]
+
+
+BLOCK = Action('block')
+IGNORE_PREVIOUS_RULES = Action('ignore-previous-rules')
+
+THIRD_PARTY = ('third-party',)
+FIRST_PARTY = ('first-party',)
+
+MATCH_ALL = '.*'
+
+# interned tuples kept; easylist has a few thousand distinct domain lists.
+# when full, the oldest 1/interned_evicted_part of them are dropped, so a
+# long running process such as ab2cb serve does not keep every tuple of
+# every conversion. a dropped tuple is only shared less, rules using it
+# are unaffected
+interned_size = 65536
+interned_evicted_part = 4
+
+interned = {}
+
+
+def intern_tuple(values):
+    values = tuple(values)
+    found = interned.get(values)
+    if found is not None:
+        return found
+    if len(interned) >= interned_size:
+        for old in list(itertools.islice(interned, max(1, interned_size // interned_evicted_part))):
+            interned.pop(old, None)
+    return interned.setdefault(values, values)
+
+
+def css_display_none(selector):
+    return Action('css-display-none', selector)
+
+
+def action_from_dict(action):
+    if action == {'type': 'block'}:
+        return BLOCK
+    if action == {'type': 'ignore-previous-rules'}:
+        return IGNORE_PREVIOUS_RULES
+    return Action(action['type'], action.get('selector'))
+
+
+def trigger_tuple(values):
+    if values is None:
+        return None
+    values = tuple(values)
+    if values == THIRD_PARTY:
+        return THIRD_PARTY
+    if values == FIRST_PARTY:
+        return FIRST_PARTY
+    return intern_tuple(values)
+
+
+class Rule(object):
+    __slots__ = ('url_filter', 'case_sensitive', 'load_type', 'if_domain', 'unless_domain', 'resource_type', 'action', 'load_type_last')
+
+    def __init__(self, url_filter, action, case_sensitive=False, load_type=None, if_domain=None, unless_domain=None, resource_type=None, load_type_last=False):
+        self.url_filter = url_filter
+        self.action = action
+        self.case_sensitive = case_sensitive
+        self.load_type = load_type
+        self.if_domain = if_domain
+        self.unless_domain = unless_domain
+        self.resource_type = resource_type
+        # the third-party document half of a split rule has always listed
+        # load-type after resource-type
+        self.load_type_last = load_type_last
+
+    def key(self):
+        return (self.url_filter, self.case_sensitive, self.load_type, self.if_domain, self.unless_domain, self.resource_type, self.action)
+
+    def __eq__(self, other):
+        return self.key() == other.key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return 'Rule(%r)' % (self.to_dict(),)
+
+    @property
+    def is_exception(self):
+        return self.action.type == 'ignore-previous-rules'
+
+    def copy(self, **changes):
+        rule = Rule(self.url_filter, self.action, self.case_sensitive, self.load_type, self.if_domain, self.unless_domain, self.resource_type, self.load_type_last)
+        for name, value in changes.items():
+            setattr(rule, name, value)
+        return rule
+
+    def trigger_items(self):
+        items = [('url-filter', self.url_filter)]
+        if self.case_sensitive:
+            items.append(('url-filter-is-case-sensitive', True))
+        if self.load_type and not self.load_type_last:
+            items.append(('load-type', self.load_type))
+        if self.if_domain:
+            items.append(('if-domain', self.if_domain))
+        if self.unless_domain:
+            items.append(('unless-domain', self.unless_domain))
+        if self.resource_type:
+            items.append(('resource-type', self.resource_type))
+        if self.load_type and self.load_type_last:
+            items.append(('load-type', self.load_type))
+        return items
+
+    def to_dict(self):
+        trigger = {}
+        for name, value in self.trigger_items():
+            trigger[name] = list(value) if isinstance(value, tuple) else value
+        return {'trigger': trigger, 'action': dict(self.action.items())}
+
+    def to_json(self, strip_whitespace):
+        # same bytes as json.dumps(self.to_dict()) laid out inside the output array
+        if strip_whitespace:
+            return '{"trigger":{%s},"action":{%s}}' % (compact_items(self.trigger_items()), compact_items(self.action.items()))
+        return '{\n        "trigger": {\n%s\n        },\n        "action": {\n%s\n        }\n    }' % (indented_items(self.trigger_items()), indented_items(self.action.items()))
+
+
+def encode_value(value, indent):
+    if value is True:
+        return 'true'
+    if isinstance(value, tuple):
+        if not value:
+            return '[]'
+        if indent is None:
+            return '[' + ','.join(encode_basestring_ascii(v) for v in value) + ']'
+        inner = ',\n' + indent + '    '
+        return '[\n' + indent + '    ' + inner.join(encode_basestring_ascii(v) for v in value) + '\n' + indent + ']'
+    return encode_basestring_ascii(value)
+
+
+def compact_items(items):
+    return ','.join('%s:%s' % (encode_basestring_ascii(name), encode_value(value, None)) for name, value in items)
+
+
+def indented_items(items):
+    indent = '            '
+    return ',\n'.join('%s%s: %s' % (indent, encode_basestring_ascii(name), encode_value(value, indent)) for name, value in items)
+
+
+def rule_from_dict(rule):
+    trigger = rule['trigger']
+    names = list(trigger)
+    load_type_last = 'load-type' in trigger and 'resource-type' in trigger and names.index('load-type') > names.index('resource-type')
+    return Rule(
+        trigger['url-filter'],
+        action_from_dict(rule['action']),
+        trigger.get('url-filter-is-case-sensitive', False),
+        trigger_tuple(trigger.get('load-type')),
+        trigger_tuple(trigger.get('if-domain')),
+        trigger_tuple(trigger.get('unless-domain')),
+        trigger_tuple(trigger.get('resource-type')),
+        load_type_last)
+
+
+def rule_from_json(fragment):
+    return rule_from_dict(json.loads(fragment))
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# hand a conversion to a running ab2cb serve
+#
+#   ab2cb send [--socket PATH] [--watch] [--stdin] [--] [ab2cb options] [File ...]
+#
+# prints what the conversion printed and exits with its status, as if
+# ab2cb had been run here with the same arguments.
+
+from __future__ import print_function
+
+import json
+import os
+import os.path
+import socket
+import stat
+import tempfile
+
+
+def default_socket():
+    # in the user's runtime directory, or else in a directory of the user's
+    # own, so nobody else can take the name and receive the jobs
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime and os.path.isdir(runtime):
+        return os.path.join(runtime, 'ab2cb.sock')
+    directory = os.path.join(tempfile.gettempdir(), 'ab2cb-%d' % os.getuid())
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise OSError('%s is not a private directory' % directory)
+    return os.path.join(directory, 'ab2cb.sock')
+
+
+def request(path, job):
+    # send one job to the server at path and return its answer
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendall(json.dumps(job).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as fp:
+            line = fp.readline()
+    finally:
+        sock.close()
+    if not line:
+        raise IOError('no answer from server')
+    return json.loads(line.decode('utf-8'))
+
+
+def main(argv, stdin=None, stdout=None, stderr=None):
+    from .options import parse_send_opts
+
+    options = parse_send_opts(argv, stdin=stdin, stdout=stdout, stderr=stderr)
+    job = {'argv': options.args, 'cwd': os.getcwd()}
+    if options.send_stdin:
+        job['stdin'] = options.stdin.read()
+    if options.watch:
+        job['watch'] = True
+    path = options.socket
+    try:
+        path = path or default_socket()
+        answer = request(path, job)
+    except (IOError, OSError, ValueError) as e:
+        options.stderr.write('%s: %s\n' % (path, e))
+        return 2
+    options.stdout.write(answer['stdout'])
+    options.stderr.write(answer['stderr'])
+    return answer['exit']
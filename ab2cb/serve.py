@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+# a resident converter listening on a unix socket
+#
+#   ab2cb serve [--socket PATH] [--poll SECONDS]
+#
+# a job is one line of json sent over the socket, see ab2cb send:
+#   {"argv": [...], "cwd": "/dir", "stdin": "text", "watch": false}
+# argv are the arguments of a conversion as given to ab2cb, relative paths
+# in them are taken from cwd, and stdin is read instead of the server's.
+# the answer is one line of json:
+#   {"exit": status, "stdout": "text", "stderr": "text", "seconds": 0.1}
+# and {"status": true} is answered with counters of the server instead.
+#
+# every connection is served by its own thread, so a slow job does not hold
+# up the others. the converted lines are kept in memory, per output
+# affecting options, together with the caches of the converter itself, so
+# lines already seen by an earlier job are not converted again. the others
+# go through --jobs and --cache as they would without the server.
+#
+# with "watch", the job is also run again whenever one of its input files
+# changes, checked every --poll seconds. unless the job gives --previous,
+# the server keeps its state in a directory of its own so that only the
+# changed lines are converted again. watched jobs need --output.
+
+from __future__ import print_function
+
+import collections
+import io
+import itertools
+import json
+import os
+import os.path
+import shutil
+import signal
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+from . import ab2cb as converter
+from .send import default_socket, request
+
+# converted lines kept in memory
+memory_lines = 2000000
+
+# when full, the oldest 1/evicted_part of them are dropped
+evicted_part = 4
+
+# options of a conversion naming files or directories
+path_options = ['debug_log', 'output', 'output_rules', 'rejected', 'simplified', 'cache_dir', 'previous_dir', 'profile']
+
+# options whose state is shared by the whole process
+unsupported_options = [('cprofile', '--cprofile'), ('debug', '--debug')]
+
+
+class MemoryCache(object):
+    # conversion results by (no_css, strip_whitespace, line), shared by all jobs
+    def __init__(self, size=memory_lines):
+        self.size = size
+        self.lines = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def convert(self, lines, no_css, strip_whitespace, convert):
+        # the results of lines, those not kept yet from convert
+        prefix = (bool(no_css), bool(strip_whitespace))
+
+        def lookup(chunk):
+            known = {}
+            with self.lock:
+                for line in chunk:
+                    result = self.lines.get(prefix + (line,))
+                    if result is not None:
+                        known[line] = result
+                self.hits += len(known)
+            return known
+
+        def convert_and_keep(misses):
+            for line, result in zip(misses, convert(misses)):
+                self.keep(prefix + (line,), result)
+                yield result
+
+        for line, result in converter.convert_misses(lines, lookup, convert_and_keep):
+            yield result
+
+    def keep(self, key, result):
+        # a converted line, counted as a miss
+        with self.lock:
+            self.misses += 1
+            if len(self.lines) >= self.size:
+                # the oldest part goes, so the rest stays warm
+                for old in list(itertools.islice(self.lines, max(1, self.size // evicted_part))):
+                    del self.lines[old]
+            self.lines[key] = result
+
+
+class Job(object):
+    def __init__(self, argv, cwd, stdin=''):
+        self.argv = list(argv)
+        self.cwd = cwd
+        self.stdin = stdin
+        self.lock = threading.Lock()
+        self.state_dir = None
+        self.mtimes = None
+
+    def options(self, stdout, stderr):
+        # the parsed options, or an error message
+        from .options import parse_opts
+        try:
+            options = parse_opts(self.argv, stdin=io.StringIO(self.stdin), stdout=stdout, stderr=stderr)
+        except SystemExit:
+            return 'invalid arguments: %s' % ' '.join(self.argv)
+        for name, flag in unsupported_options:
+            if getattr(options, name):
+                return '%s is not supported by ab2cb serve' % flag
+        for name in path_options:
+            path = getattr(options, name)
+            if path and not os.path.isabs(path):
+                setattr(options, name, os.path.join(self.cwd, path))
+        options.files = [os.path.join(self.cwd, path) for path in options.files]
+        if self.state_dir and not options.previous_dir:
+            options.previous_dir = self.state_dir
+        return options
+
+    def run(self, memory):
+        # {exit, stdout, stderr, seconds} of one conversion
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        start = time.perf_counter()
+        with self.lock:
+            options = self.options(stdout, stderr)
+            if isinstance(options, str):
+                stderr.write(options + '\n')
+                status = converter.exit_statuses['error']
+            else:
+                options.memory = memory
+                # forking a pool from a threaded process can copy a held lock
+                options.start_method = 'forkserver'
+                try:
+                    status = converter.convert(options)
+                except Exception:
+                    # convert wrote it to the job's stderr
+                    status = converter.exit_statuses['error']
+        return collections.OrderedDict([
+            ('exit', status),
+            ('stdout', stdout.getvalue()),
+            ('stderr', stderr.getvalue()),
+            ('seconds', round(time.perf_counter() - start, 3)),
+        ])
+
+    def input_mtimes(self):
+        options = self.options(io.StringIO(), io.StringIO())
+        if isinstance(options, str):
+            return None
+        mtimes = []
+        for path in options.files:
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, poll=1.0, log=None):
+        socketserver.UnixStreamServer.__init__(self, path, Handler)
+        self.path = path
+        self.poll = poll
+        self.log = log or sys.stderr
+        self.memory = MemoryCache()
+        self.watched = []
+        self.watched_lock = threading.Lock()
+        self.jobs = 0
+        self.state_root = None
+        self.stopping = threading.Event()
+        self.watcher = threading.Thread(target=self.watch_loop)
+        self.watcher.daemon = True
+        self.watcher.start()
+
+    def run(self, job):
+        self.jobs += 1
+        return job.run(self.memory)
+
+    def watch(self, job):
+        if self.state_root is None:
+            self.state_root = tempfile.mkdtemp(prefix='ab2cb-serve-')
+        with self.watched_lock:
+            job.state_dir = os.path.join(self.state_root, str(len(self.watched) + 1))
+            job.mtimes = job.input_mtimes()
+            self.watched.append(job)
+
+    def watch_loop(self):
+        while not self.stopping.wait(self.poll):
+            with self.watched_lock:
+                jobs = list(self.watched)
+            for job in jobs:
+                mtimes = job.input_mtimes()
+                if mtimes == job.mtimes:
+                    continue
+                job.mtimes = mtimes
+                result = self.run(job)
+                self.log.write('ab2cb serve: %s: exit %d in %.2fs\n' % (' '.join(job.argv), result['exit'], result['seconds']))
+                if result['stderr']:
+                    self.log.write(result['stderr'])
+                self.log.flush()
+
+    def status(self):
+        return collections.OrderedDict([
+            ('jobs', self.jobs),
+            ('watched', [job.argv for job in self.watched]),
+            ('cached-lines', len(self.memory.lines)),
+            ('cache-hits', self.memory.hits),
+            ('cache-misses', self.memory.misses),
+        ])
+
+    def server_close(self):
+        self.stopping.set()
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        if self.state_root:
+            shutil.rmtree(self.state_root, ignore_errors=True)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            request = json.loads(line.decode('utf-8'))
+            if request.get('status'):
+                answer = self.server.status()
+            else:
+                job = Job(request['argv'], request.get('cwd') or os.getcwd(), request.get('stdin') or '')
+                if request.get('watch'):
+                    options = job.options(io.StringIO(), io.StringIO())
+                    if not isinstance(options, str) and not options.output:
+                        options = 'watched jobs need --output'
+                    if isinstance(options, str):
+                        answer = {'exit': converter.exit_statuses['error'], 'stdout': '', 'stderr': options + '\n'}
+                        self.send(answer)
+                        return
+                    self.server.watch(job)
+                answer = self.server.run(job)
+        except (ValueError, KeyError, TypeError) as e:
+            answer = {'exit': converter.exit_statuses['error'], 'stdout': '', 'stderr': 'bad request: %s\n' % e}
+        self.send(answer)
+
+    def send(self, answer):
+        self.wfile.write(json.dumps(answer).encode('utf-8') + b'\n')
+
+
+def stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main(argv, stdin=None, stdout=None, stderr=None):
+    from .options import parse_serve_opts
+
+    options = parse_serve_opts(argv, stdin=stdin, stdout=stdout, stderr=stderr)
+    path = options.socket
+    try:
+        path = path or default_socket()
+        if os.path.exists(path):
+            try:
+                request(path, {'status': True})
+                options.stderr.write('%s: a server is already listening\n' % path)
+                return 2
+            except (IOError, OSError, ValueError):
+                # left behind by a server that did not stop cleanly
+                os.unlink(path)
+        server = Server(path, options.poll, options.stderr)
+    except (IOError, OSError) as e:
+        options.stderr.write('%s: %s\n' % (path, e))
+        return 2
+    options.stderr.write('ab2cb serve: listening on %s\n' % path)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
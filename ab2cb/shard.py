@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+# split the output into several content blockers of bounded size
+#
+# ignore-previous-rules only overrides rules of the same content blocker, so
+# every exception is copied into each shard holding a block rule it may
+# override. whether an exception may override a rule is decided
+# conservatively from the trigger fields: only provably disjoint triggers
+# keep an exception out of a shard.
+#
+# strategies:
+#   sequential   fill shards in output order
+#   category     network rules and css rules go to separate shards
+#   specificity  generic rules and rules limited to some domains go to
+#                separate shards
+
+import collections
+import json
+import os.path
+
+from .optimize import domain_index, intersect_domains, is_covered
+from .writer import RuleWriter
+
+strategies = ['sequential', 'category', 'specificity']
+
+# url-filter prefix produced for ||host filters
+host_anchor = '^[^:]+:(//)?([^/]+\\.)?'
+
+regex_special = '.*+?^$()[]{}|'
+
+
+def literal_prefix(regex):
+    # the text every match of regex starts with
+    literal = []
+    i = 0
+    length = len(regex)
+    while i < length:
+        c = regex[i]
+        if c == '\\' and i + 1 < length:
+            i += 1
+            c = regex[i]
+        elif c in regex_special:
+            break
+        literal.append(c)
+        i += 1
+    if i < length and regex[i] in '*+?{':
+        # the last character is optional or repeated
+        literal = literal[:-1]
+    return ''.join(literal).lower()
+
+
+def url_prefix(url_filter):
+    # ('start', text the url starts with) or ('host', complete host, path start) or None
+    if url_filter.startswith(host_anchor):
+        literal = literal_prefix(url_filter[len(host_anchor):])
+        slash = literal.find('/')
+        if slash < 0:
+            # the host may continue, and then anything can follow
+            return None
+        return ('host', literal[:slash], literal[slash:])
+    if url_filter.startswith('^'):
+        return ('start', literal_prefix(url_filter[1:]))
+    return None
+
+
+def prefixes_disjoint(a, b):
+    return not (a.startswith(b) or b.startswith(a))
+
+
+def urls_disjoint(a, b):
+    if a is None or b is None or a[0] != b[0]:
+        return False
+    if a[0] == 'start':
+        return prefixes_disjoint(a[1], b[1])
+    host_a, host_b = a[1], b[1]
+    if host_a == host_b:
+        return prefixes_disjoint(a[2], b[2])
+    return not (host_a.endswith('.' + host_b) or host_b.endswith('.' + host_a))
+
+
+def domains_disjoint(a, b):
+    # (if-domain, unless-domain) pairs that no site satisfies both of
+    if a[0] and b[0]:
+        return not intersect_domains(a[0], b[0])
+    if a[0] and b[1]:
+        index = domain_index(b[1])
+        return all(is_covered(d, index) for d in a[0])
+    if a[1] and b[0]:
+        return domains_disjoint(b, a)
+    return False
+
+
+class Trigger(object):
+    # the parts of a trigger that decide whether two rules can ever both match
+    __slots__ = ('load_type', 'resource_type', 'domains', 'url')
+
+    def __init__(self, rule):
+        self.load_type = rule.load_type
+        self.resource_type = rule.resource_type
+        self.domains = (rule.if_domain, rule.unless_domain)
+        self.url = url_prefix(rule.url_filter)
+
+    def key(self):
+        return (self.load_type, self.resource_type, self.domains, self.url)
+
+    def may_overlap(self, other):
+        if self.load_type and other.load_type and self.load_type != other.load_type:
+            return False
+        if self.resource_type and other.resource_type and not set(self.resource_type) & set(other.resource_type):
+            return False
+        if domains_disjoint(self.domains, other.domains):
+            return False
+        return not urls_disjoint(self.url, other.url)
+
+
+def category(rule):
+    return 'css' if rule.action.type == 'css-display-none' else 'network'
+
+
+def specificity(rule):
+    return 'specific' if rule.if_domain else 'generic'
+
+
+def sequential(rule):
+    return 'all'
+
+
+class Shard(object):
+    def __init__(self, kind):
+        self.kind = kind
+        self.blocks = []
+        self.needed = set()
+
+
+def plan_shards(rules, max_rules, strategy='sequential'):
+    # returns (shards, exceptions per group, exceptions that override nothing)
+    blocks = [r for r in rules if not r.is_exception]
+    groups = collections.OrderedDict()
+    for r in rules:
+        if r.is_exception:
+            trigger = Trigger(r)
+            groups.setdefault(trigger.key(), (trigger, []))[1].append(r)
+    group_size = dict((key, len(group[1])) for key, group in groups.items())
+
+    if strategy == 'category':
+        kind = category
+    elif strategy == 'specificity':
+        kind = specificity
+    else:
+        kind = sequential
+    ordered = collections.OrderedDict()
+    for r in blocks:
+        ordered.setdefault(kind(r), []).append(r)
+
+    shards = []
+    used = set()
+    for name, kind_blocks in ordered.items():
+        shard = None
+        remaining = []
+        count = 0
+        for r in kind_blocks:
+            trigger = Trigger(r)
+            new = [(key, group) for key, group in remaining if group[0].may_overlap(trigger)]
+            added = sum(group_size[key] for key, group in new)
+            if shard is None or count + 1 + added > max_rules:
+                # a new shard, into which every exception group may be copied again
+                shard = Shard(name)
+                shards.append(shard)
+                remaining = list(groups.items())
+                count = 0
+                new = [(key, group) for key, group in remaining if group[0].may_overlap(trigger)]
+                added = sum(group_size[key] for key, group in new)
+            shard.blocks.append(r)
+            if new:
+                keys = set(key for key, group in new)
+                shard.needed.update(keys)
+                used.update(keys)
+                remaining = [(key, group) for key, group in remaining if key not in keys]
+            count += 1 + added
+
+    unused = sum(size for key, size in group_size.items() if key not in used)
+    exceptions = [(key, group[1]) for key, group in groups.items()]
+    return shards, exceptions, unused
+
+
+def shard_path(output, n):
+    root, ext = os.path.splitext(output)
+    return '%s-%d%s' % (root, n, ext or '.json')
+
+
+def manifest_path(output):
+    return os.path.splitext(output)[0] + '-manifest.json'
+
+
+def write_shards(options, rules):
+    # returns the RuleWriter of every shard written
+    shards, exceptions, unused = plan_shards(rules, options.max_rules_per_file, options.shard_by)
+    writers = []
+    entries = []
+    for n, shard in enumerate(shards, 1):
+        path = shard_path(options.output, n)
+        with open(path, 'w') as fp:
+            writer = RuleWriter(fp, options.strip_whitespace)
+            for r in shard.blocks:
+                writer.add(False, r.to_json(options.strip_whitespace))
+            for key, group in exceptions:
+                if key in shard.needed:
+                    for r in group:
+                        writer.add(True, r.to_json(options.strip_whitespace))
+            writer.close()
+        writers.append(writer)
+        entries.append(collections.OrderedDict([
+            ('file', os.path.basename(path)),
+            ('kind', shard.kind),
+            ('rules', writer.total),
+            ('blocks', writer.blocks),
+            ('exceptions', writer.exceptions),
+        ]))
+
+    manifest = collections.OrderedDict([
+        ('max-rules-per-file', options.max_rules_per_file),
+        ('strategy', options.shard_by),
+        ('unused-exceptions', unused),
+        ('shards', entries),
+    ])
+    with open(manifest_path(options.output), 'w') as fp:
+        json.dump(manifest, fp, indent=4)
+        fp.write('\n')
+    return writers
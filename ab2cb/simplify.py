@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# rewrite url-filters into equivalent ones that are cheaper to compile
+#
+# a url-filter is searched for anywhere in the url, so it matches the same
+# urls after these rewrites:
+#   X.*.*Y   X.*Y     runs of the same repeated term are one repeat
+#   (ab)c    abc      groups without a quantifier are only parentheses
+#   (a)*     a*       a group of one term needs none either
+#   .*X  X.* X        optional terms at an unanchored end match nothing
+#   a+X  Xa+ aX Xa    and a repeated term at one only needs to match once
+#   ^.*X X.*$ X       ^ and $ next to .* anchor nothing
+# a url-filter that ends up empty matches every url, as .* does. scheme
+# and subdomain prefixes repeated across rules are left alone: they match
+# differently from anything shorter, and WebKit shares them in its prefix
+# tree anyway (see ab2cb cost).
+#
+# rewrites are cached by url-filter, so a pattern repeated across rules
+# is only simplified once.
+
+import functools
+
+from .cost import filter_cost
+from .rules import MATCH_ALL
+from .urlfilter import UrlFilter, UrlFilterError, parse
+
+special_chars = frozenset('.+*?^$()[]{}|\\')
+set_special_chars = frozenset('[]\\^-')
+quantifier_chars = {(0, None): '*', (1, None): '+', (0, 1): '?'}
+
+
+def format_char(c, special):
+    return '\\' + c if c in special else c
+
+
+def format_term(term):
+    kind = term[0]
+    if kind == 'char':
+        return format_char(term[1], special_chars)
+    if kind == 'any':
+        return '.'
+    if kind == 'set':
+        ranges = ''.join(
+            format_char(low, set_special_chars) + ('-' + format_char(high, set_special_chars) if high != low else '')
+            for low, high in term[2])
+        return '[%s%s]' % ('^' if term[1] else '', ranges)
+    if kind == 'group':
+        return '(%s)' % ''.join(map(format_term, term[1]))
+    return format_term(term[1]) + quantifier_chars[term[2:]]
+
+
+def format_url_filter(url_filter):
+    # the url-filter text of a parsed UrlFilter
+    return '%s%s%s' % ('^' if url_filter.anchored_start else '',
+                       ''.join(map(format_term, url_filter.terms)),
+                       '$' if url_filter.anchored_end else '')
+
+
+def simplify_term(term):
+    # (terms) replacing term
+    kind = term[0]
+    if kind == 'group':
+        return simplify_sequence(term[1])
+    if kind == 'repeat':
+        inner = term[1]
+        if inner[0] == 'group':
+            terms = simplify_sequence(inner[1])
+            if len(terms) == 1 and terms[0][0] != 'repeat':
+                inner = terms[0]
+            else:
+                inner = ('group', tuple(terms))
+        return [('repeat', inner) + term[2:]]
+    return [term]
+
+
+def simplify_sequence(terms):
+    result = []
+    for term in terms:
+        for term in simplify_term(term):
+            if result and term[0] == 'repeat' and result[-1][0] == 'repeat' and result[-1][1] == term[1]:
+                previous = result[-1]
+                low = previous[2] + term[2]
+                if (previous[3] is None or term[3] is None) and low <= 1:
+                    result[-1] = ('repeat', term[1], low, None)
+                    continue
+            result.append(term)
+    return result
+
+
+def once(term):
+    # the terms matching what a repeated term matches at least once
+    inner = term[1]
+    return list(inner[1]) if inner[0] == 'group' else [inner]
+
+
+def trim(terms, anchored_start, anchored_end):
+    # drop what the ends of an unanchored search make redundant
+    changed = True
+    while changed and terms:
+        changed = False
+        last = terms[-1]
+        if last[0] == 'repeat':
+            if anchored_end and last[1] == ('any',) and last[3] is None:
+                terms[-1:] = [('any',)] * last[2]
+                anchored_end = False
+                changed = True
+            elif not anchored_end:
+                terms[-1:] = once(last) if last[2] else []
+                changed = True
+        if not terms:
+            break
+        first = terms[0]
+        if first[0] == 'repeat':
+            if anchored_start and first[1] == ('any',) and first[3] is None:
+                terms[:1] = [('any',)] * first[2]
+                anchored_start = False
+                changed = True
+            elif not anchored_start:
+                terms[:1] = once(first) if first[2] else []
+                changed = True
+    return UrlFilter(tuple(terms), anchored_start, anchored_end)
+
+
+@functools.lru_cache(maxsize=65536)
+def simplify_url_filter(url_filter):
+    # an equivalent url-filter no longer than url_filter, url_filter itself
+    # if nothing simplifies or it does not parse
+    if url_filter == MATCH_ALL:
+        return url_filter
+    try:
+        parsed = parse(url_filter)
+    except (UrlFilterError, RecursionError):
+        return url_filter
+    simplified = trim(simplify_sequence(parsed.terms), parsed.anchored_start, parsed.anchored_end)
+    if simplified == parsed:
+        return url_filter
+    if not simplified.terms and not (simplified.anchored_start and simplified.anchored_end):
+        return MATCH_ALL
+    result = format_url_filter(simplified)
+    if len(result) >= len(url_filter):
+        return url_filter
+    return result
+
+
+class UrlFilterSimplifier(object):
+    # simplifies the url-filters of rules, writing "characters saved<TAB>
+    # states saved<TAB>url-filter<TAB>simplified" for each one rewritten to
+    # fp if given, then the totals as a ! comment line
+    def __init__(self, fp=None):
+        self.fp = fp
+        self.simplified = 0
+        self.characters = 0
+        self.states = 0
+
+    def states_saved(self, before, after, case_sensitive):
+        before = filter_cost(before, case_sensitive)
+        after = filter_cost(after, case_sensitive)
+        if before is None or after is None:
+            return 0
+        return before[1] - after[1]
+
+    def simplify(self, rules):
+        result = []
+        for rule in rules:
+            url_filter = simplify_url_filter(rule.url_filter)
+            if url_filter != rule.url_filter:
+                characters = len(rule.url_filter) - len(url_filter)
+                states = self.states_saved(rule.url_filter, url_filter, rule.case_sensitive)
+                self.simplified += 1
+                self.characters += characters
+                self.states += states
+                if self.fp:
+                    self.fp.write('%d\t%d\t%s\t%s\n' % (characters, states, rule.url_filter, url_filter))
+                rule = rule.copy(url_filter=url_filter)
+            result.append(rule)
+        return result
+
+    def close(self):
+        if self.fp:
+            self.fp.write('! %s\n' % self.summary())
+            self.fp.close()
+
+    def summary(self):
+        return 'Simplified %d url-filters, %d characters and about %d DFA states shorter' % (
+            self.simplified, self.characters, self.states)
+
+
+def simplify_rules(rules, fp=None):
+    simplifier = UrlFilterSimplifier(fp)
+    return simplifier.simplify(rules), simplifier
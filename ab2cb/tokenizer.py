@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# linear time splitting of filter lines
+#
+# these give the same results as elemhideRegExp.search and
+# optionsRegExp.search but never backtrack across candidate positions, so
+# the time per line is bounded by its length. the small patterns below only
+# match single runs at a fixed position.
+
+import re
+
+# characters that may not appear in the domain part of an element hiding filter
+domain_forbidden = re.compile(r'[/*|@"!]')
+tag_name = re.compile(r'[\w\-]+')
+attr_rules = re.compile(r'(?:\([\w\-]+(?:[$^*]?=[^()"]*)?\))*')
+
+option_name = re.compile(r'~?[\w\-]+')
+later_option = re.compile(r',~?[\w\-]+(?:=[^,\s]+)?')
+
+
+def split_elemhide(text):
+    # returns (domain, isException, tagName, attrRules, selector) like the
+    # groups of elemhideRegExp, or None
+    p = text.find('#')
+    if p < 0:
+        return None
+    forbidden = domain_forbidden.search(text)
+    limit = forbidden.start() if forbidden else len(text)
+    length = len(text)
+    last_brace = max(text.rfind('{'), text.rfind('}'))
+
+    # the domain is lazy: try each # in turn, leftmost first
+    while 0 <= p < limit:
+        q = p + 1
+        exception = None
+        if q < length and text[q] == '@':
+            exception = '@'
+            q += 1
+        if q < length:
+            if text[q] == '#':
+                if q + 1 < length and last_brace < q + 1:
+                    return (text[:p], exception, None, None, text[q + 1:])
+            else:
+                if text[q] == '*':
+                    end = q + 1
+                else:
+                    match = tag_name.match(text, q)
+                    end = match.end() if match else -1
+                if end > 0:
+                    match = attr_rules.match(text, end)
+                    if match.end() == length:
+                        return (text[:p], exception, text[q:end], text[end:], None)
+        p = text.find('#', p + 1)
+    return None
+
+
+def options_tail(text, pos, known):
+    # does text[pos:] consist only of ,option[=value] entries?
+    visited = []
+    length = len(text)
+    result = True
+    while pos < length:
+        if pos in known:
+            result = known[pos]
+            break
+        visited.append(pos)
+        match = later_option.match(text, pos)
+        if not match:
+            result = False
+            break
+        pos = match.end()
+        if pos < length and text[pos] != ',':
+            result = False
+            break
+    for v in visited:
+        known[v] = result
+    return result
+
+
+def split_options(text):
+    # returns the option string after the $ like group 1 of optionsRegExp, or None
+    d = text.find('$')
+    length = len(text)
+    known = {}
+    next_comma = -1
+    while d >= 0:
+        match = option_name.match(text, d + 1)
+        if match:
+            pos = match.end()
+            if pos < length and text[pos] == '=':
+                # the first value may contain anything but a comma
+                if next_comma <= pos:
+                    next_comma = text.find(',', pos + 1)
+                    if next_comma < 0:
+                        next_comma = length
+                pos = next_comma if next_comma > pos + 1 else -1
+            if pos == length or (pos > 0 and text[pos] == ',' and options_tail(text, pos, known)):
+                return text[d + 1:]
+        d = text.find('$', d + 1)
+    return None
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# parser for the regular expression subset WebKit accepts in url-filter
+#
+# supported: literal characters, escaped special characters, ., character
+# sets with ranges and negation, groups, the quantifiers * + ?, ^ at the
+# start and $ at the end. anything else (alternation, {n,m} ranges,
+# backreferences, character class escapes, (?...) groups, lazy
+# quantifiers, non-ascii text) is rejected.
+#
+# a parsed url-filter is a UrlFilter of terms, each one of
+#   ('char', c)
+#   ('any',)
+#   ('set', negated, ((low, high), ...))
+#   ('group', terms)
+#   ('repeat', term, min, max)   max is None for unbounded
+
+import collections
+import functools
+
+UrlFilter = collections.namedtuple('UrlFilter', 'terms anchored_start anchored_end')
+
+quantifiers = {'*': (0, None), '+': (1, None), '?': (0, 1)}
+
+
+class UrlFilterError(ValueError):
+    def __init__(self, message, position):
+        ValueError.__init__(self, '%s at position %d' % (message, position))
+        self.position = position
+
+
+class Parser(object):
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.length = len(pattern)
+        self.pos = 0
+        self.anchored_end = False
+
+    def error(self, message, position=None):
+        raise UrlFilterError(message, self.pos if position is None else position)
+
+    def parse(self):
+        if not self.pattern:
+            self.error('empty url-filter')
+        if not self.pattern.isascii():
+            self.error('non-ascii character', next(i for i, c in enumerate(self.pattern) if ord(c) > 127))
+        anchored_start = self.pattern[0] == '^'
+        if anchored_start:
+            self.pos = 1
+        terms = self.sequence(0)
+        return UrlFilter(tuple(terms), anchored_start, self.anchored_end)
+
+    def sequence(self, depth):
+        terms = []
+        pattern = self.pattern
+        while self.pos < self.length:
+            c = pattern[self.pos]
+            if c == ')':
+                if depth == 0:
+                    self.error('unbalanced )')
+                return terms
+            if c == '(':
+                if pattern.startswith('(?', self.pos):
+                    self.error('(? groups are not supported')
+                start = self.pos
+                self.pos += 1
+                inner = self.sequence(depth + 1)
+                if self.pos >= self.length:
+                    self.error('unclosed group', start)
+                self.pos += 1
+                term = ('group', tuple(inner))
+            elif c == '[':
+                term = self.char_set()
+            elif c == '.':
+                term = ('any',)
+                self.pos += 1
+            elif c == '\\':
+                term = ('char', self.escape())
+            elif c == '|':
+                self.error('alternation is not supported')
+            elif c == '{':
+                self.error('quantifier ranges are not supported')
+            elif c in quantifiers:
+                self.error('quantifier without a term')
+            elif c == '^':
+                self.error('^ is only allowed at the start')
+            elif c == '$':
+                if self.pos == self.length - 1 and depth == 0:
+                    self.anchored_end = True
+                    self.pos += 1
+                    continue
+                self.error('$ is only allowed at the end')
+            else:
+                term = ('char', c)
+                self.pos += 1
+
+            if self.pos < self.length:
+                q = pattern[self.pos]
+                if q in quantifiers:
+                    self.pos += 1
+                    if self.pos < self.length and (pattern[self.pos] in quantifiers or pattern[self.pos] == '{'):
+                        self.error('quantifier after a quantifier')
+                    low, high = quantifiers[q]
+                    term = ('repeat', term, low, high)
+                elif q == '{':
+                    self.error('quantifier ranges are not supported')
+            terms.append(term)
+        return terms
+
+    def escape(self):
+        # the character escaped by the backslash at pos
+        if self.pos + 1 >= self.length:
+            self.error('trailing backslash')
+        c = self.pattern[self.pos + 1]
+        if c.isdigit():
+            self.error('backreferences are not supported')
+        if c.isalpha():
+            self.error('\\%s escapes are not supported' % c)
+        self.pos += 2
+        return c
+
+    def char_set(self):
+        start = self.pos
+        pattern = self.pattern
+        self.pos += 1
+        negated = self.pos < self.length and pattern[self.pos] == '^'
+        if negated:
+            self.pos += 1
+        ranges = []
+        while True:
+            if self.pos >= self.length:
+                self.error('unclosed character set', start)
+            c = pattern[self.pos]
+            if c == ']':
+                self.pos += 1
+                break
+            low = self.escape() if c == '\\' else self.set_char()
+            high = low
+            if self.pos + 1 < self.length and pattern[self.pos] == '-' and pattern[self.pos + 1] != ']':
+                self.pos += 1
+                high = self.escape() if pattern[self.pos] == '\\' else self.set_char()
+                if high < low:
+                    self.error('character range out of order')
+            ranges.append((low, high))
+        if not ranges:
+            self.error('empty character set', start)
+        return ('set', negated, tuple(ranges))
+
+    def set_char(self):
+        c = self.pattern[self.pos]
+        self.pos += 1
+        return c
+
+
+def parse(pattern):
+    return Parser(pattern).parse()
+
+
+@functools.lru_cache(maxsize=65536)
+def check(pattern):
+    # the error message for pattern, or None if WebKit accepts it
+    try:
+        parse(pattern)
+    except UrlFilterError as e:
+        return str(e)
+    except RecursionError:
+        return 'groups nested too deeply'
+    return None
+
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# ab2cb validate: check content blocker json without WebKit
+#
+#   ab2cb validate [-j N] [--max-errors N] File ...
+#
+# each file is streamed rule by rule and checked against the content
+# blocker schema. every distinct url-filter is then checked against the
+# regular expression subset WebKit compiles (see urlfilter.py), on a
+# process pool with -j. a url-filter repeated within a file is checked
+# once, and urlfilter.check remembers its results across files.
+
+from .urlfilter import check as check_url_filter
+
+trigger_lists = {
+    'resource-type': frozenset(['document', 'image', 'style-sheet', 'script', 'font', 'raw', 'svg-document', 'media', 'popup', 'ping', 'fetch', 'websocket', 'other']),
+    'load-type': frozenset(['first-party', 'third-party']),
+    'load-context': frozenset(['top-frame', 'child-frame']),
+}
+domain_lists = ['if-domain', 'unless-domain']
+url_lists = ['if-top-url', 'unless-top-url', 'if-frame-url']
+action_types = frozenset(['block', 'block-cookies', 'css-display-none', 'ignore-previous-rules', 'make-https'])
+
+# url-filters per task sent to the pool
+chunk_size = 1000
+
+
+def check_string_list(trigger, name, errors):
+    values = trigger[name]
+    if not isinstance(values, list) or not values:
+        errors.append('%s must be a non-empty array' % name)
+        return None
+    if not all(isinstance(v, str) and v for v in values):
+        errors.append('%s must only hold non-empty strings' % name)
+        return None
+    return values
+
+
+def check_trigger(trigger, errors):
+    if not isinstance(trigger, dict):
+        errors.append('trigger must be an object')
+        return
+    url_filter = trigger.get('url-filter')
+    if not isinstance(url_filter, str):
+        errors.append('trigger needs a url-filter string')
+    for name in trigger:
+        if name == 'url-filter':
+            continue
+        if name == 'url-filter-is-case-sensitive':
+            if not isinstance(trigger[name], bool):
+                errors.append('%s must be true or false' % name)
+        elif name in trigger_lists:
+            values = check_string_list(trigger, name, errors)
+            if values:
+                unknown = [v for v in values if v not in trigger_lists[name]]
+                if unknown:
+                    errors.append('unknown %s %s' % (name, ', '.join(unknown)))
+        elif name in domain_lists:
+            values = check_string_list(trigger, name, errors)
+            if values:
+                bad = [v for v in values if not v.isascii() or v.lower() != v]
+                if bad:
+                    errors.append('%s entries must be lower case ascii: %s' % (name, ', '.join(bad)))
+        elif name in url_lists:
+            check_string_list(trigger, name, errors)
+        else:
+            errors.append('unknown trigger field %s' % name)
+    present = [name for name in domain_lists + url_lists[:2] if name in trigger]
+    if len(present) > 1:
+        errors.append('only one of %s is allowed' % ', '.join(present))
+
+
+def check_action(action, errors):
+    if not isinstance(action, dict):
+        errors.append('action must be an object')
+        return
+    action_type = action.get('type')
+    if action_type not in action_types:
+        errors.append('unknown action type %r' % (action_type,))
+    selector = action.get('selector')
+    if action_type == 'css-display-none':
+        if not isinstance(selector, str) or not selector:
+            errors.append('css-display-none needs a selector')
+    elif 'selector' in action:
+        errors.append('selector is only allowed with css-display-none')
+    for name in action:
+        if name not in ('type', 'selector'):
+            errors.append('unknown action field %s' % name)
+
+
+def check_rule(rule):
+    # the schema errors of one rule, the url-filter itself is checked separately
+    errors = []
+    if not isinstance(rule, dict):
+        return ['rule must be an object']
+    for name in rule:
+        if name not in ('trigger', 'action'):
+            errors.append('unknown rule field %s' % name)
+    if 'trigger' not in rule or 'action' not in rule:
+        errors.append('rule needs a trigger and an action')
+    if 'trigger' in rule:
+        check_trigger(rule['trigger'], errors)
+    if 'action' in rule:
+        check_action(rule['action'], errors)
+    return errors
+
+
+def check_url_filters(url_filters, pool=None):
+    # {url-filter: error message or None}
+    if pool and len(url_filters) > chunk_size:
+        results = pool.map(check_url_filter, url_filters, chunk_size)
+    else:
+        results = [check_url_filter(u) for u in url_filters]
+    return dict(zip(url_filters, results))
+
+
+def validate_file(path, pool=None):
+    # returns (number of rules, [(rule index, message), ...]) in rule order
+    from .rulefile import iter_rule_dicts
+
+    errors = []
+    url_filters = {}
+    count = 0
+    for index, rule in enumerate(iter_rule_dicts(path)):
+        count += 1
+        errors.extend((index, message) for message in check_rule(rule))
+        trigger = rule.get('trigger') if isinstance(rule, dict) else None
+        url_filter = trigger.get('url-filter') if isinstance(trigger, dict) else None
+        if isinstance(url_filter, str):
+            url_filters.setdefault(url_filter, []).append(index)
+
+    messages = check_url_filters(list(url_filters), pool)
+    for url_filter, indexes in url_filters.items():
+        message = messages[url_filter]
+        if message:
+            errors.extend((index, 'url-filter %s: %s' % (url_filter, message)) for index in indexes)
+    errors.sort(key=lambda e: e[0])
+    return count, errors
+
+
+def main(argv, stdin=None, stdout=None, stderr=None):
+    from .options import parse_validate_opts
+    from .parallel import open_pool
+    from .rulefile import RuleFileError
+
+    options = parse_validate_opts(argv, stdin=stdin, stdout=stdout, stderr=stderr)
+    pool = open_pool(options) if options.jobs != 1 else None
+    status = 0
+    try:
+        for path in options.files:
+            try:
+                count, errors = validate_file(path, pool)
+            except (IOError, OSError, RuleFileError) as e:
+                options.stderr.write('%s: %s\n' % (path, e))
+                status = 2
+                continue
+            for index, message in errors[:options.max_errors]:
+                options.stdout.write('%s: rule %d: %s\n' % (path, index, message))
+            if len(errors) > options.max_errors:
+                options.stdout.write('%s: ... and %d more errors\n' % (path, len(errors) - options.max_errors))
+            invalid = len(set(index for index, message in errors))
+            options.stdout.write('%s: %d rules, %d invalid\n' % (path, count, invalid))
+            if errors and status == 0:
+                status = 1
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return status
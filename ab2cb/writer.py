@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# incremental writer for the content blocker json array
+#
+# block rules are written as soon as they arrive. ignore-previous-rules must
+# come after every block rule, so they are spilled to a temporary file and
+# appended when the writer is closed.
+
+import shutil
+import tempfile
+
+
+class RuleWriter(object):
+    def __init__(self, fp, strip_whitespace):
+        self.fp = fp
+        if strip_whitespace:
+            self.start, self.sep, self.end = '[', ',', ']'
+        else:
+            self.start, self.sep, self.end = '[\n    ', ',\n    ', '\n]'
+        self.spill = None
+        self.blocks = 0
+        self.exceptions = 0
+
+    def add(self, is_exception, fragment):
+        if is_exception:
+            if self.spill is None:
+                self.spill = tempfile.TemporaryFile(mode='w+')
+            elif self.exceptions:
+                self.spill.write(self.sep)
+            self.spill.write(fragment)
+            self.exceptions += 1
+        else:
+            self.fp.write(self.sep if self.blocks else self.start)
+            self.fp.write(fragment)
+            self.blocks += 1
+
+    def close(self):
+        if self.exceptions:
+            self.fp.write(self.sep if self.blocks else self.start)
+            self.spill.seek(0)
+            shutil.copyfileobj(self.spill, self.fp)
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+        if self.blocks or self.exceptions:
+            self.fp.write(self.end)
+        else:
+            self.fp.write('[]')
+
+    @property
+    def total(self):
+        return self.blocks + self.exceptions
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# worst case time per line for the filter line tokenizer
+#
+#   python benchmarks/adversarial.py [--max-length N] [--regex] [--fuzz N]
+#
+# hostile lines of doubling length are split by tokenizer.py (and, with
+# --regex, by the original regexes) and the time per character reported.
+# the run fails if the tokenizer's time per character grows by more than
+# --max-growth between the shortest and longest line, i.e. if it is not
+# linear. --fuzz adds random lines and reports the slowest one.
+
+from __future__ import print_function
+
+import argparse
+import json
+import os.path
+import random
+import sys
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+sys.path.insert(0, here)
+
+from ab2cb.ab2cb import elemhideRegExp, optionsRegExp  # noqa: E402
+from ab2cb.tokenizer import split_elemhide, split_options  # noqa: E402
+from hostile import families  # noqa: E402
+
+
+def tokenize(line):
+    split_elemhide(line)
+    split_options(line)
+
+
+def regex(line):
+    elemhideRegExp.search(line)
+    optionsRegExp.search(line)
+
+
+def best_of(func, line, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(line)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def lengths(shortest, longest):
+    n = shortest
+    while n <= longest:
+        yield n
+        n *= 2
+
+
+def run_families(args):
+    results = []
+    failed = False
+    for name, make in families:
+        rows = []
+        for n in lengths(args.min_length, args.max_length):
+            line = make(n)
+            row = {'length': len(line), 'tokenizer_s': best_of(tokenize, line, args.repeat)}
+            if args.regex and n <= args.regex_max_length:
+                row['regex_s'] = best_of(regex, line, 1)
+            rows.append(row)
+        first = rows[0]['tokenizer_s'] / rows[0]['length']
+        last = rows[-1]['tokenizer_s'] / rows[-1]['length']
+        growth = last / first if first else 0
+        if growth > args.max_growth:
+            failed = True
+        results.append({'family': name, 'growth_per_char': growth, 'runs': rows})
+    return results, failed
+
+
+def run_fuzz(args):
+    rng = random.Random(args.seed)
+    alphabet = '#@ab-_(=)$^*"{}!/|,~ .'
+    worst = (0.0, '')
+    for i in range(args.fuzz):
+        line = ''.join(rng.choice(alphabet) for j in range(rng.randint(1, args.fuzz_length)))
+        elapsed = best_of(tokenize, line, 1) / len(line)
+        if elapsed > worst[0]:
+            worst = (elapsed, line)
+    return {'lines': args.fuzz, 'worst_s_per_char': worst[0], 'worst_line': worst[1]}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='adversarial input benchmark for the filter line tokenizer')
+    parser.add_argument('--min-length', type=int, default=1000)
+    parser.add_argument('--max-length', type=int, default=256000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-growth', type=float, default=4.0, help='allowed growth of time per character')
+    parser.add_argument('--regex', action='store_true', help='also time the original regexes')
+    parser.add_argument('--regex-max-length', type=int, default=8000)
+    parser.add_argument('--fuzz', type=int, default=0, metavar='N', help='also time N random lines')
+    parser.add_argument('--fuzz-length', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    results, failed = run_families(args)
+    report = {'families': results}
+    if args.fuzz:
+        report['fuzz'] = run_fuzz(args)
+    json.dump(report, sys.stdout, indent=4)
+    sys.stdout.write('\n')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
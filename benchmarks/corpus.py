@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# deterministic synthetic filter lists at EasyList scale
+#
+#   python benchmarks/corpus.py --lines 1000000 [--seed N] [-o FILE]
+#
+# the same seed and size always give the same list. the mix of line kinds
+# follows EasyList and EasyPrivacy roughly, and hosts and domains are drawn
+# from a skewed pool so that popular names recur the way they do in real
+# lists.
+
+from __future__ import print_function
+
+import argparse
+import random
+import sys
+
+syllables = ['ad', 'ads', 'track', 'pix', 'cdn', 'stat', 'click', 'serv', 'media', 'net', 'bann', 'er', 'pop', 'up',
+             'sync', 'tag', 'rt', 'bid', 'x', 'zone', 'count', 'metr', 'ic', 'log', 'beac', 'on', 'sp', 'ot', 'mob', 'i']
+tlds = ['com', 'net', 'org', 'de', 'fr', 'co.uk', 'io', 'ru', 'info', 'com.au', 'jp', 'nl']
+unicode_names = [u'münchen', u'bücher', u'español', u'россия', u'日本']
+resource_options = ['script', 'image', 'stylesheet', 'object', 'xmlhttprequest', 'subdocument', 'media', 'font', 'popup', 'other']
+unsupported_options = ['elemhide', 'generichide', 'csp=script-src', 'rewrite=abp-resource:blank-js']
+selector_words = ['ad', 'ads', 'banner', 'sponsor', 'promo', 'box', 'top', 'side', 'wrap', 'leader', 'board', 'slot', 'unit', 'text']
+path_words = ['ads', 'ad', 'banner', 'banners', 'track', 'pixel', 'img', 'js', 'affiliate', 'promo', 'sponsored', 'adserver', 'doubleclick']
+
+# (weight, kind) roughly as in easylist + easyprivacy
+mix = [
+    (30, 'host'),
+    (9, 'host-third-party'),
+    (4, 'host-path'),
+    (11, 'wildcard-path'),
+    (8, 'options'),
+    (3, 'unsupported'),
+    (7, 'exception'),
+    (2, 'exception-domain'),
+    (12, 'elemhide-generic'),
+    (12, 'elemhide-domain'),
+    (1, 'elemhide-exception'),
+    (1, 'comment'),
+]
+
+
+class Corpus(object):
+    def __init__(self, seed=1, hosts=50000):
+        self.rng = random.Random(seed)
+        self.kinds = []
+        for weight, kind in mix:
+            self.kinds.extend([kind] * weight)
+        self.hosts = [self.make_host() for i in range(hosts)]
+
+    def word(self, parts=(1, 3)):
+        return ''.join(self.rng.choice(syllables) for i in range(self.rng.randint(*parts)))
+
+    def make_host(self):
+        labels = [self.word() for i in range(self.rng.choice([1, 1, 1, 2]))]
+        if self.rng.random() < 0.002:
+            labels[-1] = self.rng.choice(unicode_names)
+        return '%s.%s' % ('.'.join(labels), self.rng.choice(tlds))
+
+    def host(self):
+        # skewed towards the start of the pool so popular hosts recur
+        return self.hosts[int(len(self.hosts) * self.rng.random() ** 3)]
+
+    def domains(self, negate=0.0):
+        names = []
+        for i in range(self.rng.choice([1, 1, 2, 3, 5, 8])):
+            name = self.host()
+            if self.rng.random() < negate:
+                name = '~' + name
+            names.append(name)
+        return names
+
+    def path(self):
+        return '/'.join(self.rng.choice(path_words) + (str(self.rng.randint(1, 999)) if self.rng.random() < 0.3 else '') for i in range(self.rng.randint(1, 3)))
+
+    def selector(self):
+        words = '-'.join(self.rng.choice(selector_words) for i in range(self.rng.randint(1, 3)))
+        form = self.rng.random()
+        if form < 0.45:
+            return '.' + words
+        if form < 0.8:
+            return '#' + words
+        if form < 0.95:
+            return 'div[class^="%s"]' % words
+        return 'a[href*="%s"] > img' % self.host()
+
+    def options(self):
+        options = self.rng.sample(resource_options, self.rng.randint(1, 3))
+        if self.rng.random() < 0.5:
+            options.append(self.rng.choice(['third-party', '~third-party']))
+        if self.rng.random() < 0.4:
+            options.append('domain=' + '|'.join(self.domains(negate=0.5 if self.rng.random() < 0.5 else 0.0)))
+        return ','.join(options)
+
+    def line(self):
+        kind = self.rng.choice(self.kinds)
+        if kind == 'host':
+            return '||%s^' % self.host()
+        if kind == 'host-third-party':
+            return '||%s^$third-party' % self.host()
+        if kind == 'host-path':
+            return '||%s/%s' % (self.host(), self.path())
+        if kind == 'wildcard-path':
+            return '/%s/*%s' % (self.path(), self.rng.choice(['.js', '.gif', '_', '/*.php?', '^']))
+        if kind == 'options':
+            return '%s$%s' % (self.rng.choice(['/%s.' % self.path(), '||%s^' % self.host(), '-%s-' % self.word()]), self.options())
+        if kind == 'unsupported':
+            return '||%s^$%s' % (self.host(), self.rng.choice(unsupported_options))
+        if kind == 'exception':
+            return '@@||%s^$%s' % (self.host(), self.options())
+        if kind == 'exception-domain':
+            return '@@/%s/$domain=%s' % (self.path(), '|'.join(self.domains()))
+        if kind == 'elemhide-generic':
+            return '##' + self.selector()
+        if kind == 'elemhide-domain':
+            return '%s##%s' % (','.join(self.domains()), self.selector())
+        if kind == 'elemhide-exception':
+            return '%s#@#%s' % (self.host(), self.selector())
+        return '! %s' % self.word((3, 8))
+
+    def lines(self, count):
+        yield '[Adblock Plus 2.0]'
+        for i in range(count - 1):
+            yield self.line()
+
+
+def write_corpus(fp, count, seed=1):
+    for line in Corpus(seed).lines(count):
+        fp.write(line + '\n')
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='write a synthetic filter list')
+    parser.add_argument('--lines', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('-o', '--output', metavar='FILE')
+    args = parser.parse_args(argv)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fp:
+            write_corpus(fp, args.lines, args.seed)
+    else:
+        write_corpus(sys.stdout, args.lines, args.seed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
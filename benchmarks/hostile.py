@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# families of filter lines that make elemhideRegExp / optionsRegExp backtrack
+#
+# each entry is (name, function of n returning a line roughly n chars long)
+
+families = [
+    # lazy domain group retried at every # and the ## selector rejected at the end
+    ('hash-run-brace', lambda n: '#' * n + '{'),
+    ('hash-at-run-brace', lambda n: '#@' * (n // 2) + '{'),
+    # tag name and attribute rules that fail only on the last character
+    ('attr-rules-tail', lambda n: 'a#div' + '(a=b)' * (n // 5) + '('),
+    ('hash-tag-run', lambda n: '#a' * (n // 2) + '!'),
+    ('values-with-hash', lambda n: '#t' + '(a=#t)' * (n // 6) + '"'),
+    # every $ retried and the first value swallowed up to a bad comma
+    ('dollar-values-comma', lambda n: '$a=' * (n // 3) + ',,'),
+    ('dollar-names', lambda n: '$a' * (n // 2) + ' '),
+    ('options-bad-last', lambda n: 'x$a' + ',a=b' * (n // 4) + ', '),
+    ('options-space-value', lambda n: 'x$a' + ',a=b c' * (n // 6)),
+]
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# check translate_url_filter against the regex_cleaners chain on real lists
+#
+#   python benchmarks/parity.py easylist.txt easyprivacy.txt
+#
+# every line is converted twice, once with each translator, and the rules
+# compared. the time spent in each translator is reported.
+
+from __future__ import print_function
+
+import os.path
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import ab2cb.ab2cb as converter  # noqa: E402
+
+
+def read_lines(paths):
+    lines = []
+    for path in paths:
+        with open(path) as fp:
+            lines.extend(converter.filter_lines(fp))
+    return lines
+
+
+def capture_sources(lines):
+    sources = []
+    translate = converter.translate_url_filter
+
+    def recording(source):
+        sources.append(source)
+        return translate(source)
+
+    converted = [converter.convert_text(line, False, recording) for line in lines]
+    return sources, converted
+
+
+def timed(func, sources):
+    start = time.perf_counter()
+    for s in sources:
+        func(s)
+    return time.perf_counter() - start
+
+
+def main(argv):
+    if not argv:
+        print('usage: parity.py FILE ...', file=sys.stderr)
+        return 2
+
+    lines = read_lines(argv)
+    sources, converted = capture_sources(lines)
+
+    reference = [converter.convert_text(line, False, converter.reference_url_filter) for line in lines]
+
+    mismatches = 0
+    for line, a, b in zip(lines, converted, reference):
+        if a != b:
+            mismatches += 1
+            if mismatches <= 20:
+                print('MISMATCH: %s' % line)
+
+    single = timed(converter.translate_url_filter, sources)
+    chain = timed(converter.reference_url_filter, sources)
+    print('%d lines, %d url filters, %d mismatches' % (len(lines), len(sources), mismatches))
+    print('regex_cleaners chain: %.3fs  single pass: %.3fs  speedup: %.1fx' % (chain, single, chain / single if single else 0))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# lines per second and peak memory of each conversion stage
+#
+#   python benchmarks/throughput.py [--lines N] [--seed N] [FILE]
+#
+# without FILE a synthetic list of --lines lines is generated with
+# corpus.py. each stage runs in a fresh interpreter so its peak RSS is its
+# own:
+#   read       filter_lines over the file
+#   parse      filter_from_text on every line
+#   convert    convert_line on every line, rules plus json fragments
+#   write      write_rules of already converted lines to /dev/null
+#   total      the ab2cb command line, file to /dev/null
+# the seconds of a stage exclude the work done to prepare its input, the
+# peak RSS does not. results are written as json.
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import os.path
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+sys.path.insert(0, here)
+
+import ab2cb.ab2cb as converter  # noqa: E402
+from ab2cb.options import parse_opts  # noqa: E402
+from corpus import write_corpus  # noqa: E402
+
+stages = ['read', 'parse', 'convert', 'write', 'total']
+
+
+def read_lines(path):
+    with open(path, encoding='utf-8') as fp:
+        return list(converter.filter_lines(fp))
+
+
+def quiet_options(argv):
+    devnull = open(os.devnull, 'w')
+    return parse_opts(argv, stdout=devnull, stderr=devnull)
+
+
+def run_stage(stage, path):
+    # returns (lines, seconds, cpu seconds) of the timed part
+    if stage == 'read':
+        start = time.perf_counter(), time.process_time()
+        lines = read_lines(path)
+    elif stage == 'parse':
+        lines = read_lines(path)
+        options = quiet_options([])
+        start = time.perf_counter(), time.process_time()
+        for line in lines:
+            converter.filter_from_text(line, options)
+    elif stage == 'convert':
+        lines = read_lines(path)
+        start = time.perf_counter(), time.process_time()
+        for line in lines:
+            converter.convert_line(line, False, False)
+    elif stage == 'write':
+        lines = read_lines(path)
+        results = list(converter.iter_converted(lines, False, False))
+        options = quiet_options(['-o', os.devnull])
+        start = time.perf_counter(), time.process_time()
+        converter.write_rules(options, results)
+    else:
+        lines = None
+        start = time.perf_counter(), time.process_time()
+        converter.main(['-o', os.devnull, path], stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w'))
+    end = time.perf_counter(), time.process_time()
+    if lines is None:
+        lines = read_lines(path)
+    return len(lines), end[0] - start[0], end[1] - start[1]
+
+
+def stage_main(stage, path):
+    # keep the converter's messages out of the json
+    out = sys.stdout
+    sys.stdout = sys.stderr = open(os.devnull, 'w')
+    lines, seconds, cpu_seconds = run_stage(stage, path)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    json.dump({
+        'lines': lines,
+        'seconds': seconds,
+        'cpu_seconds': cpu_seconds,
+        'lines_per_second': lines / seconds if seconds else None,
+        'peak_rss_kb': peak,
+    }, out)
+    return 0
+
+
+def measure(stage, path):
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--stage', stage, path])
+    return json.loads(output.decode('utf-8'))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='per stage throughput of the converter')
+    parser.add_argument('--lines', type=int, default=100000, help='size of the generated list')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--stages', default=','.join(stages), help='comma separated stages to run')
+    parser.add_argument('--stage', help=argparse.SUPPRESS)
+    parser.add_argument('file', nargs='?', help='filter list to use instead of a generated one')
+    args = parser.parse_args(argv)
+
+    if args.stage:
+        return stage_main(args.stage, args.file)
+
+    path = args.file
+    generated = None
+    if path is None:
+        fd, generated = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+            write_corpus(fp, args.lines, args.seed)
+        path = generated
+
+    try:
+        report = {
+            'corpus': {
+                'file': args.file,
+                'lines': args.lines if generated else None,
+                'seed': args.seed if generated else None,
+                'bytes': os.path.getsize(path),
+            },
+            'python': sys.version.split()[0],
+            'stages': dict((stage, measure(stage, path)) for stage in args.stages.split(',')),
+        }
+    finally:
+        if generated:
+            os.remove(generated)
+
+    json.dump(report, sys.stdout, indent=4, sort_keys=True)
+    sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
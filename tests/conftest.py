@@ -0,0 +1,8 @@
+import os.path
+
+import pytest
+
+
+@pytest.fixture
+def sample():
+    return os.path.join(os.path.dirname(__file__), 'data', 'sample.txt')
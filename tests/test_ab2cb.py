@@ -647,3 +647,30 @@ class TestSplitRules(object):
         assert self.out.cb[0]['trigger']['resource-type'][0] == 'script'
         assert self.out.cb[1]['trigger']['resource-type'][0] == 'document'
         assert self.out.cb[1]['trigger']['load-type'][0] == 'third-party'
+
+
+class TestParseOptions(object):
+    def test_memoized(self):
+        a = ab2cb.ab2cb.parse_options('third-party,script,domain=a.com|~b.com')
+        b = ab2cb.ab2cb.parse_options('third-party,script,domain=a.com|~b.com')
+        assert a is b
+        assert a.thirdParty is True
+        assert a.domains == 'A.COM|~B.COM'
+
+    def test_unsupported(self):
+        assert ab2cb.ab2cb.parse_options('script,webrtc') is None
+
+    def test_resource_type_table(self):
+        typeMap = ab2cb.ab2cb.RegExpFilter_typeMap
+        table = ab2cb.ab2cb.resource_type_table
+        assert table[typeMap['SUBDOCUMENT'] | typeMap['SCRIPT'] | typeMap['XMLHTTPREQUEST']] == ('document', 'script', 'raw')
+        assert table[typeMap['IMAGE'] | typeMap['POPUP']] == ('image', 'popup')
+        assert len(table) == 512
+
+
+def test_file_named_like_a_command(tmpdir):
+    tmpdir.join('match').write('||ads.com^\n')
+    out = StringIO()
+    with tmpdir.as_cwd():
+        ab2cb.ab2cb.main(['match'], stdout=out, stderr=StringIO())
+    assert 'ads' in json.loads(out.getvalue())[0]['trigger']['url-filter']
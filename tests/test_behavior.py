@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import io
+import json
+
+import ab2cb.ab2cb
+from ab2cb.behavior import split_selectors
+
+
+def test_split_selectors():
+    assert split_selectors('.a, #b') == ['.a', '#b']
+    assert split_selectors('a:not(.b, .c), [title="x,y"]') == ['a:not(.b, .c)', '[title="x,y"]']
+
+
+def write_rules(tmpdir, name, rules):
+    path = tmpdir.join(name)
+    path.write(json.dumps(rules))
+    return str(path)
+
+
+def test_main(tmpdir):
+    a = write_rules(tmpdir, 'a.json', [
+        {'trigger': {'url-filter': 'ads'}, 'action': {'type': 'block'}},
+        {'trigger': {'url-filter': 'track'}, 'action': {'type': 'block'}},
+        {'trigger': {'url-filter': '.*'}, 'action': {'type': 'css-display-none', 'selector': '.a'}},
+        {'trigger': {'url-filter': '.*'}, 'action': {'type': 'css-display-none', 'selector': '.b'}},
+        {'trigger': {'url-filter': 'ads/ok'}, 'action': {'type': 'ignore-previous-rules'}},
+    ])
+    b = write_rules(tmpdir, 'b.json', [
+        {'trigger': {'url-filter': 'ads'}, 'action': {'type': 'block'}},
+        {'trigger': {'url-filter': '.*'}, 'action': {'type': 'css-display-none', 'selector': '.a, .b'}},
+    ])
+    lines = '\n'.join([
+        'http://a.com/ads/1.js a.com script',
+        'http://a.com/ads/ok.js a.com script',
+        'http://a.com/track.js a.com script',
+        'http://a.com/x.js a.com script',
+        'http://a.com/',
+    ]) + '\n'
+    out = io.StringIO()
+    err = io.StringIO()
+    assert ab2cb.ab2cb.main(['diff-behavior', a, b], stdin=io.StringIO(lines), stdout=out, stderr=err) == 1
+    assert out.getvalue().splitlines() == [
+        'allow\tblock\thttp://a.com/ads/ok.js\ta.com\tscript\t4\t0',
+        'block\tnone\thttp://a.com/track.js\ta.com\tscript\t1\t',
+    ]
+    assert 'Compared 5 requests' in err.getvalue()
+    assert '2 differ' in err.getvalue()
+
+    parallel = io.StringIO()
+    assert ab2cb.ab2cb.main(['diff-behavior', '-j', '2', a, b], stdin=io.StringIO(lines), stdout=parallel, stderr=io.StringIO()) == 1
+    assert parallel.getvalue() == out.getvalue()
+
+    urls = io.StringIO('http://a.com/x.js a.com script\n')
+    assert ab2cb.ab2cb.main(['diff-behavior', a, a], stdin=urls, stdout=io.StringIO(), stderr=io.StringIO()) == 0
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import ab2cb.ab2cb
+from ab2cb.cache import ConversionCache, cache_path, open_cache
+
+
+lines = [
+    '||ads.example.com^$third-party',
+    '@@||ok.example.com^$image',
+    '###banner',
+    '||bad.example.com^$webrtc',
+]
+
+
+class TestConversionCache(object):
+    def test_cold_and_warm(self, tmpdir):
+        path = cache_path(str(tmpdir))
+        cache = ConversionCache(path)
+        expected = ab2cb.ab2cb.convert_lines(lines, False, False)
+        assert cache.convert_lines(lines, False, False) == expected
+        assert (cache.hits, cache.misses) == (0, 4)
+        assert cache.convert_lines(lines, False, False) == expected
+        assert (cache.hits, cache.misses) == (4, 4)
+        cache.close()
+
+    def test_options_are_part_of_the_key(self, tmpdir):
+        cache = ConversionCache(cache_path(str(tmpdir)))
+        cache.convert_lines(lines, False, False)
+        assert cache.convert_lines(lines, True, False) == ab2cb.ab2cb.convert_lines(lines, True, False)
+        assert cache.convert_lines(lines, False, True) == ab2cb.ab2cb.convert_lines(lines, False, True)
+        assert cache.hits == 0
+        cache.close()
+
+    def test_shared_between_connections(self, tmpdir):
+        path = cache_path(str(tmpdir))
+        first = ConversionCache(path)
+        second = ConversionCache(path)
+        first.convert_lines(lines, False, False)
+        second.convert_lines(lines, False, False)
+        assert second.hits == 4
+        first.close()
+        second.close()
+
+    def test_prune(self, tmpdir):
+        cache = ConversionCache(cache_path(str(tmpdir)))
+        many = ['||ads%d.example.com^' % i for i in range(3000)]
+        cache.convert_lines(many, False, False)
+        size = cache.size()
+        assert cache.prune(size) == 0
+        assert cache.prune(size // 2) > 0
+        assert cache.size() <= size // 2
+        cache.close()
+
+
+class TestCacheOption(object):
+    def test_warm_run_is_identical(self, tmpdir, sample):
+        outputs = []
+        for i in range(2):
+            output = str(tmpdir.join('out%d.json' % i))
+            ab2cb.ab2cb.main(['--cache', str(tmpdir.join('cache')), '-o', output, sample])
+            with open(output) as fp:
+                outputs.append(fp.read())
+        assert outputs[0] == outputs[1]
+        cache = open_cache(cache_path(str(tmpdir.join('cache'))))
+        assert cache.size() > 0
+        cache.close()
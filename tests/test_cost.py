@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import io
+import json
+
+import ab2cb.ab2cb
+from ab2cb.cost import estimate, filter_cost, group_name
+from ab2cb.rules import rule_from_dict
+
+
+def test_filter_cost():
+    assert filter_cost('.*') == (0, 0)
+    assert filter_cost('ab') == (2, 3)
+    assert filter_cost('^ab') == (2, 3)
+    assert filter_cost('^a$') == (1, 3)
+    assert filter_cost('a(bc)*d') == (3, 4)
+    # each .* remembers how far the url got
+    assert filter_cost('a.*b.*c.*d') == (7, 5)
+    assert filter_cost('/ads/.*/banner') == (13, 13)
+    assert filter_cost('[a-z') is None
+
+
+def test_estimate():
+    rules = [rule_from_dict(r) for r in [
+        {'trigger': {'url-filter': '/ads/'}, 'action': {'type': 'block'}},
+        {'trigger': {'url-filter': '/adserver/'}, 'action': {'type': 'block'}},
+        {'trigger': {'url-filter': '.*'}, 'action': {'type': 'css-display-none', 'selector': '.ad'}},
+        {'trigger': {'url-filter': 'a.*b', 'resource-type': ['image']}, 'action': {'type': 'block'}},
+    ]]
+    groups, ranked = estimate(rules)
+    assert [(group_name(g.key), g.rules, g.states) for g in groups] == [
+        # /ads/ and /adserver/ share /ads, .* needs no automaton
+        ('block', 2, 12),
+        ('block resource-type=image', 1, 4),
+        ('css-display-none', 1, 0),
+    ]
+    assert [r[2] for r in ranked] == [1, 0, 3]
+
+
+def test_main(tmpdir):
+    path = tmpdir.join('rules.json')
+    path.write(json.dumps([
+        {'trigger': {'url-filter': 'ads'}, 'action': {'type': 'block'}},
+        {'trigger': {'url-filter': 'a.*d.*s'}, 'action': {'type': 'block'}},
+    ]))
+    report = tmpdir.join('cost.json')
+    out = io.StringIO()
+    assert ab2cb.ab2cb.main(['cost', '--top', '1', '-o', str(report), str(path)], stdout=out) == 0
+    lines = out.getvalue().splitlines()
+    assert lines[0] == '2 rules in 1 groups, about 8 DFA states'
+    assert lines[-1].split() == ['4', '1', 'a.*d.*s']
+    data = json.loads(report.read())
+    assert data['groups'][0]['prefix-tree-nodes'] == 7
+    assert [r['rule'] for r in data['expensive']] == [1]
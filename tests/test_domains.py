@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import ab2cb.ab2cb
+from ab2cb.domains import elemhide_if_domains, elemhide_unless_domains, filter_domains, punycode
+from ab2cb.rejection import rejection
+
+
+class TestDomains(object):
+    def test_punycode(self):
+        assert punycode(u'a.com') == 'a.com'
+        assert punycode(u'münchen.de') == 'xn--mnchen-3ya.de'
+        assert punycode(u'a..b\u0080') is None
+
+    def test_filter_domains(self):
+        assert filter_domains('A.com|b.com') == (('*a.com', '*b.com'), None)
+        assert filter_domains('~a.com||~b.com') == (None, ('*a.com', '*b.com'))
+        assert filter_domains(u'~münchen.de') == (None, ('*xn--mnchen-3ya.de',))
+        assert filter_domains('a.com|~b.com') is rejection('mixed-domains')
+        assert filter_domains('~') is rejection('bad-domain')
+
+    def test_interned(self):
+        assert filter_domains('a.com|b.com')[0] is filter_domains('A.COM|B.COM')[0]
+        assert elemhide_if_domains('X.com,y.com') is elemhide_if_domains('x.com,y.com')
+        assert elemhide_unless_domains('X.com') == ('X.com',)
+
+    def test_shared_between_rules(self):
+        a = ab2cb.ab2cb.convert_text('a.com,b.com##.ad', False)[0]
+        b = ab2cb.ab2cb.convert_text('a.com,b.com##.other', False)[0]
+        assert a.if_domain is b.if_domain
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import json
+
+import ab2cb.ab2cb
+from ab2cb.fold import DROP, fold_exceptions, fold_into, url_covers
+from ab2cb.rules import rule_from_dict
+
+
+def rule(url_filter, action='block', **trigger):
+    trigger = dict((k.replace('_', '-'), v) for k, v in trigger.items())
+    trigger['url-filter'] = url_filter
+    return rule_from_dict({'trigger': trigger, 'action': {'type': action}})
+
+
+def exception(url_filter, **trigger):
+    return rule(url_filter, 'ignore-previous-rules', **trigger)
+
+
+def test_fold_into():
+    block = rule('/ads/', resource_type=['script'])
+    assert fold_into(exception('/ads/'), block) is DROP
+    assert fold_into(exception('.*', resource_type=['script', 'image']), block) is DROP
+    assert fold_into(exception('/ads/', if_domain=['*a.com']), block).unless_domain == ('*a.com',)
+    assert fold_into(exception('/ads/', unless_domain=['*a.com']), block).if_domain == ('*a.com',)
+    # matches fewer urls or types than the rule
+    assert fold_into(exception('/ads/x'), block) is None
+    assert fold_into(exception('/ads/', resource_type=['image']), block) is None
+    assert fold_into(exception('/ads/', load_type=['third-party']), block) is None
+
+    block = rule('/ads/', if_domain=['*a.com', '*b.com'])
+    assert fold_into(exception('/ads/', if_domain=['*a.com']), block) is None
+    assert fold_into(exception('/ads/', if_domain=['*a.com', '*b.com']), block) is DROP
+    assert fold_into(exception('/ads/', unless_domain=['*x.a.com']), block).if_domain == ('*x.a.com',)
+    assert fold_into(exception('/ads/', unless_domain=['*c.com']), block) is DROP
+    assert fold_into(exception('/ads/', unless_domain=['*c.com']), rule('/ads/', unless_domain=['*d.com'])) is None
+
+
+def test_fold_exceptions():
+    host = '^[^:]+:(//)?([^/]+\\.)?%s'
+    rules = [
+        rule(host % 'ads\\.com/x/', resource_type=['script']),
+        rule(host % 'cdn\\.net/lib/', resource_type=['script']),
+        rule('/banner/', resource_type=['image']),
+        exception(host % 'ads\\.com/x/', resource_type=['script'], if_domain=['*good.com']),
+        exception(host % 'cdn\\.net/lib/ok/', resource_type=['script']),
+        exception(host % 'other\\.org/', resource_type=['script']),
+        exception(host % 'ads\\.com/banner/', resource_type=['image']),
+    ]
+    folded, folder = fold_exceptions(rules)
+    assert folded == [
+        rules[0].copy(unless_domain=('*good.com',)),
+        rules[1],
+        rules[2],
+        # may only override part of cdn.net/lib/ and /banner/
+        rules[4],
+        rules[6],
+    ]
+    assert (folder.folded, folder.unused, folder.dropped, folder.restricted) == (1, 1, 0, 1)
+
+
+def test_url_covers():
+    host = '^[^:]+:(//)?([^/]+\\.)?%s'
+    assert url_covers(exception(host % 'ads\\.com'), rule(host % 'ads\\.com/x/'))
+    assert url_covers(exception(host % 'ads\\.com'), rule(host % 'sub\\.ads\\.com'))
+    assert url_covers(exception('/ads/'), rule('/x/ads/y'))
+    assert url_covers(exception('/ads/'), rule(host % 'ads\\.com/ads/'))
+    assert not url_covers(exception(host % 'ads\\.com'), rule(host % 'bads\\.com'))
+    assert not url_covers(exception(host % 'ads\\.com'), rule('ads\\.com/x/'))
+    assert not url_covers(exception(host % 'ads\\.com/x/'), rule(host % 'ads\\.com'))
+    assert not url_covers(exception('^http://a\\.com/'), rule('http://a\\.com/x'))
+    assert not url_covers(exception('/ads/$'), rule('/x/ads/'))
+
+
+def test_kept_exception_drops_what_it_overrides():
+    host = '^[^:]+:(//)?([^/]+\\.)?%s'
+    rules = [
+        rule(host % 'ads\\.example\\.com/x\\.js'),
+        rule(host % 'sub\\.ads\\.example\\.com'),
+        rule(host % 'ads\\.example\\.com', if_domain=['*foo.com']),
+        rule('/banner\\.'),
+        exception(host % 'ads\\.example\\.com', if_domain=['*foo.com']),
+    ]
+    folded, folder = fold_exceptions(rules)
+    # /banner. may be requested from ads.example.com on foo.com too, so the
+    # exception stays, and the rules it always overrides go
+    assert folded == [rules[0], rules[1], rules[3], rules[4]]
+    assert (folder.folded, folder.dropped, folder.restricted) == (0, 1, 0)
+
+    folded, folder = fold_exceptions(rules[:3] + rules[4:])
+    assert folded == [rules[0].copy(unless_domain=('*foo.com',)), rules[1].copy(unless_domain=('*foo.com',))]
+    assert (folder.folded, folder.dropped, folder.restricted) == (1, 1, 2)
+
+
+def test_main(tmpdir):
+    source = tmpdir.join('list.txt')
+    source.write('||ads.com/y/$image\n@@||ads.com/y/$image\n||cdn.net/a/\n')
+    output = tmpdir.join('out.json')
+    ab2cb.ab2cb.main(['--fold-exceptions', '-o', str(output), str(source)])
+    assert [r['action']['type'] for r in json.loads(output.read())] == ['block']
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import pytest
+import ab2cb.ab2cb
+import ab2cb.incremental
+
+
+def convert(tmpdir, name, lines, extra):
+    source = tmpdir.join(name + '.txt')
+    source.write('\n'.join(lines) + '\n')
+    output = str(tmpdir.join(name + '.json'))
+    output_rules = str(tmpdir.join(name + '.rules'))
+    ab2cb.ab2cb.main(['-o', output, '--output-rules', output_rules] + extra + [str(source)])
+    with open(output) as fp:
+        out = fp.read()
+    with open(output_rules) as fp:
+        out_rules = fp.read()
+    return out, out_rules
+
+
+@pytest.mark.parametrize('extra', [[], ['--strip-whitespace']])
+class TestPrevious(object):
+    def test_matches_full_conversion(self, tmpdir, sample, extra):
+        with open(sample) as fp:
+            old = fp.read().splitlines()
+        new = old[:10] + ['||added.example.com^', '@@||added.example.com/ok$image'] + old[14:-3] + ['##.added']
+        previous = ['--previous', str(tmpdir.join('state'))]
+
+        convert(tmpdir, 'first', old, previous + extra)
+        incremental = convert(tmpdir, 'second', new, previous + extra)
+        full = convert(tmpdir, 'full', new, extra)
+        assert incremental == full
+
+        # and again from the state the incremental run saved
+        assert convert(tmpdir, 'third', old, previous + extra) == convert(tmpdir, 'full-old', old, extra)
+
+    def test_only_new_lines_are_converted(self, tmpdir, sample, extra, monkeypatch):
+        with open(sample) as fp:
+            old = fp.read().splitlines()
+        previous = ['--previous', str(tmpdir.join('state'))]
+        convert(tmpdir, 'first', old, previous + extra)
+
+        seen = []
+        convert_line = ab2cb.ab2cb.convert_line
+
+        def recording(line, no_css, strip_whitespace):
+            seen.append(line)
+            return convert_line(line, no_css, strip_whitespace)
+
+        monkeypatch.setattr(ab2cb.ab2cb, 'convert_line', recording)
+        convert(tmpdir, 'second', old + ['||added.example.com^'], previous + extra)
+        assert seen == ['||added.example.com^']
+
+    def test_options_change_invalidates_state(self, tmpdir, sample, extra):
+        with open(sample) as fp:
+            lines = fp.read().splitlines()
+        previous = ['--previous', str(tmpdir.join('state'))]
+        convert(tmpdir, 'first', lines, previous + extra)
+        assert convert(tmpdir, 'second', lines, previous + extra + ['--no-css']) == convert(tmpdir, 'full', lines, extra + ['--no-css'])
+
+    def test_new_lines_go_through_jobs_and_cache(self, tmpdir, sample, extra):
+        with open(sample) as fp:
+            old = fp.read().splitlines()
+        new = old + ['||added.example.com^']
+        previous = ['--previous', str(tmpdir.join('state'))]
+        convert(tmpdir, 'first', old, previous + extra)
+        cache = ['--jobs', '2', '--cache', str(tmpdir.join('cache'))]
+        assert convert(tmpdir, 'second', new, previous + extra + cache) == convert(tmpdir, 'full', new, extra)
+
+        from ab2cb.cache import cache_path, open_cache
+        db = open_cache(cache_path(str(tmpdir.join('cache'))))
+        assert db.db.execute('SELECT COUNT(*) FROM rules').fetchone()[0] == 1
+        db.close()
+
+    def test_summary(self, tmpdir, sample, extra, capsys):
+        with open(sample) as fp:
+            old = fp.read().splitlines()
+        new = old[:-5] + ['||added.example.com^']
+        previous = ['--previous', str(tmpdir.join('state'))]
+        convert(tmpdir, 'first', old, previous + extra)
+        capsys.readouterr()
+        convert(tmpdir, 'second', new, previous + extra)
+        kept = list(ab2cb.ab2cb.filter_lines(new))
+        removed = set(ab2cb.ab2cb.filter_lines(old)) - set(kept)
+        assert 'Reused %d lines, converted 1 new lines, dropped %d removed lines' % (len(kept) - 1, len(removed)) in capsys.readouterr().out
+
+    def test_unfinished_run_keeps_the_state(self, tmpdir, sample, extra, capsys):
+        with open(sample) as fp:
+            old = fp.read().splitlines()
+        previous = ['--previous', str(tmpdir.join('state'))]
+        convert(tmpdir, 'first', old, previous + extra)
+        source = tmpdir.join('second.txt')
+        source.write('||added.example.com^\n')
+        ab2cb.ab2cb.main(['-o', str(tmpdir.join('missing', 'out.json'))] + previous + extra + [str(source)])
+        capsys.readouterr()
+        convert(tmpdir, 'third', old, previous + extra)
+        kept = set(ab2cb.ab2cb.filter_lines(old))
+        assert 'Reused %d lines, converted 0 new lines' % len(kept) in capsys.readouterr().out
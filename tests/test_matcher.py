@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import io
+import json
+
+import pytest
+import ab2cb.ab2cb
+from ab2cb.matcher import Matcher, Request, base_domain, domain_matches, parse_request, rule_grams, url_host
+from ab2cb.rules import rule_from_dict
+
+
+def rules_for(lines):
+    rules = []
+    for line in lines:
+        rules.extend(ab2cb.ab2cb.convert_text(line, False) or [])
+    # exceptions go last, as write_rules orders them
+    return [r for r in rules if not r.is_exception] + [r for r in rules if r.is_exception]
+
+
+def decide(matcher, url, page=None, resource_type='script'):
+    return matcher.match(Request(url, page or url, resource_type)).decision
+
+
+def test_url_host():
+    assert url_host('https://user@Ads.Example.com:8080/a?b') == 'ads.example.com'
+    assert url_host('http://a.com?x=/y') == 'a.com'
+    assert url_host('a.com/x') == 'a.com'
+    assert base_domain('ads.example.co.uk') == 'example.co.uk'
+    assert base_domain('ads.example.com') == 'example.com'
+    assert domain_matches('a.b.com', ('*b.com',))
+    assert not domain_matches('a.b.com', ('b.com',))
+    assert not domain_matches('ab.com', ('*b.com',))
+
+
+def test_rule_grams():
+    assert 'ads.' in rule_grams('^[^:]+:(//)?([^/]+\\.)?ads\\.example\\.com')
+    assert rule_grams('.*') == set()
+    assert rule_grams('a|b') == set()
+    assert rule_grams('ad[0-9]s?') == set()
+
+
+class TestMatcher(object):
+    @pytest.fixture
+    def matcher(self):
+        return Matcher(rules_for([
+            '||ads.example.com^',
+            '||tracker.net^$third-party',
+            '/banner/*$image',
+            '||cdn.com^$script,domain=news.com',
+            '||cdn.net^$domain=~sport.news.com',
+            '##.ad',
+            'shop.com##.promo',
+            '@@||ads.example.com/ok^',
+        ]))
+
+    def test_url_filter(self, matcher):
+        assert decide(matcher, 'http://ads.example.com/x.js', 'http://site.com/') == 'block'
+        assert decide(matcher, 'http://sub.ADS.example.com/x.js', 'http://site.com/') == 'block'
+        assert decide(matcher, 'http://notads.example.com/x.js', 'http://site.com/') == 'none'
+
+    def test_exception(self, matcher):
+        m = matcher.match(Request('http://ads.example.com/ok/1.js', 'http://site.com/', 'script'))
+        assert m.decision == 'allow'
+        assert m.exception == matcher.rule_count - 1
+
+    def test_load_type(self, matcher):
+        assert decide(matcher, 'http://tracker.net/p.gif', 'http://site.com/') == 'block'
+        assert decide(matcher, 'http://tracker.net/p.gif', 'http://www.tracker.net/') == 'none'
+
+    def test_resource_type(self, matcher):
+        assert decide(matcher, 'http://a.com/banner/1.png', 'a.com', 'image') == 'block'
+        assert decide(matcher, 'http://a.com/banner/1.js', 'a.com', 'script') == 'none'
+
+    def test_domains(self, matcher):
+        assert decide(matcher, 'http://cdn.com/a.js', 'http://www.news.com/') == 'block'
+        assert decide(matcher, 'http://cdn.com/a.js', 'http://other.com/') == 'none'
+        assert decide(matcher, 'http://cdn.net/a.js', 'http://sport.news.com/') == 'none'
+        assert decide(matcher, 'http://cdn.net/a.js', 'http://news.com/') == 'block'
+
+    def test_css(self, matcher):
+        m = matcher.match(Request('http://shop.com/', 'http://shop.com/', 'document'))
+        assert m.decision == 'hide'
+        assert len(m.rules) == 2
+        assert decide(matcher, 'http://other.com/x.png', 'http://shop.com/', 'image') == 'none'
+
+    def test_ignore_previous_rules_order(self):
+        rules = [rule_from_dict(r) for r in [
+            {'trigger': {'url-filter': 'ads'}, 'action': {'type': 'block'}},
+            {'trigger': {'url-filter': 'ads/ok'}, 'action': {'type': 'ignore-previous-rules'}},
+            {'trigger': {'url-filter': '\\.js'}, 'action': {'type': 'block'}},
+        ]]
+        matcher = Matcher(rules)
+        assert matcher.match(Request('http://a.com/ads/ok.js', 'a.com', 'script')) == ('block', (2,), 1)
+        assert matcher.match(Request('http://a.com/ads/ok.png', 'a.com', 'image')) == ('allow', (), 1)
+        assert matcher.match(Request('http://a.com/ads/x.png', 'a.com', 'image')) == ('block', (0,), None)
+
+    def test_index_agrees_with_every_rule(self, sample):
+        with open(sample) as fp:
+            matcher = Matcher(rules_for(ab2cb.ab2cb.filter_lines(fp)))
+        requests = [Request(u, p, t) for u in [
+            'http://apis.google.com/js/api.js', 'http://ads.example.com/banner.gif', 'http://www.putlocker.ninja/',
+        ] for p in ['http://putlocker.ninja/', 'example.com'] for t in ['script', 'document', 'image']]
+        for request in requests:
+            page_host = url_host(request.page) if '://' in request.page else request.page
+            third_party = base_domain(url_host(request.url)) != base_domain(page_host)
+
+            def applies(t):
+                if request.resource_type != 'document' and t.action_type == 'css-display-none':
+                    return False
+                return t.matches(request.url, page_host, request.resource_type, third_party)
+
+            expected = set(t for t in matcher.triggers if applies(t))
+            assert set(matcher.matching(request)) == expected
+
+
+def test_parse_request():
+    assert parse_request('http://a.com/x.js http://b.com/ script\n') == ('http://a.com/x.js', 'http://b.com/', 'script')
+    assert parse_request('http://a.com/') == ('http://a.com/', 'http://a.com/', 'document')
+    assert parse_request('# comment') is None
+    assert parse_request('  \n') is None
+
+
+def test_main(tmpdir):
+    rules = [
+        {'trigger': {'url-filter': 'ads'}, 'action': {'type': 'block'}},
+        {'trigger': {'url-filter': 'ads/ok'}, 'action': {'type': 'ignore-previous-rules'}},
+    ]
+    path = tmpdir.join('rules.json')
+    path.write(json.dumps(rules))
+    out = io.StringIO()
+    err = io.StringIO()
+    urls = io.StringIO('http://a.com/ads/1.js b.com script\nhttp://a.com/ads/ok.js b.com script\nhttp://a.com/x.js\n')
+    assert ab2cb.ab2cb.main(['match', str(path)], stdin=urls, stdout=out, stderr=err) == 0
+    assert out.getvalue().splitlines() == [
+        'block\thttp://a.com/ads/1.js\t0',
+        'allow\thttp://a.com/ads/ok.js\t1',
+        'none\thttp://a.com/x.js\t',
+    ]
+    assert 'Matched 3 urls' in err.getvalue()
+    assert 'urls/sec' in err.getvalue()
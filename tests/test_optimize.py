@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import json
+
+import ab2cb.ab2cb
+import ab2cb.optimize
+from ab2cb.optimize import intersect_domains, optimize_rules, reduce_domains
+from ab2cb.rules import BLOCK, FIRST_PARTY, THIRD_PARTY, Rule, css_display_none, rule_from_json
+
+
+def optimize_lines(lines):
+    rules = []
+    for line in lines:
+        rules.extend(ab2cb.ab2cb.convert_text(line, False))
+    return optimize_rules(rules)
+
+
+class TestDomains(object):
+    def test_reduce(self):
+        assert reduce_domains(['*a.com', 'x.a.com', '*y.a.com', '*a.com', 'b.com']) == ['*a.com', 'b.com']
+        assert reduce_domains(['a.com', '*xa.com']) == ['a.com', '*xa.com']
+
+    def test_intersect(self):
+        assert intersect_domains(['*a.com'], ['*x.a.com']) == ['*x.a.com']
+        assert intersect_domains(['a.com', '*b.com'], ['*a.com', 'c.b.com']) == ['c.b.com', 'a.com']
+        assert intersect_domains(['*a.com'], ['*b.com']) == []
+        assert intersect_domains(['x.a.com'], ['*x.a.com']) == ['x.a.com']
+
+
+class TestOptimize(object):
+    def test_duplicates(self):
+        rules, optimizer = optimize_lines(['||a.com^', '||b.com^', '||a.com^', '##.ad', '##.ad'])
+        assert [r.url_filter for r in rules] == [rules[0].url_filter, rules[1].url_filter, '.*']
+        assert optimizer.duplicates == 2
+        assert optimizer.eliminated == 2
+
+    def test_resource_type_union(self):
+        rules, optimizer = optimize_lines(['||a.com^$script', '||a.com^$image', '||a.com^$script,stylesheet'])
+        assert len(rules) == 1
+        assert rules[0].resource_type == ('image', 'style-sheet', 'script')
+        assert optimizer.merged['resource_type'] == 2
+
+    def test_all_resource_types_take_in_the_others(self):
+        rules, optimizer = optimize_lines(['||a.com^$script', '||a.com^'])
+        assert len(rules) == 1
+        assert rules[0].resource_type is None
+
+    def test_load_type_union(self):
+        rules, optimizer = optimize_lines(['||a.com^$third-party', '||a.com^$~third-party'])
+        assert len(rules) == 1
+        assert rules[0].load_type is None
+
+    def test_if_domain_union(self):
+        rules, optimizer = optimize_lines(['x.com##.ad', 'y.com##.ad', 'x.com##.other'])
+        assert [(r.action.selector, r.if_domain) for r in rules] == [('.ad', ('x.com', 'y.com')), ('.other', ('x.com',))]
+
+    def test_unless_domain_intersection(self):
+        rules, optimizer = optimize_lines(['||a.com^$domain=~x.com|~y.com', '||a.com^$domain=~y.com|~z.com'])
+        assert len(rules) == 1
+        assert rules[0].unless_domain == ('*y.com',)
+
+        rules, optimizer = optimize_lines(['||a.com^$domain=~x.com', '||a.com^$domain=~y.com'])
+        assert len(rules) == 1
+        assert rules[0].unless_domain is None
+
+    def test_mixed_domains_are_not_merged(self):
+        rules, optimizer = optimize_lines(['||a.com^$domain=x.com', '||a.com^$domain=~y.com'])
+        assert len(rules) == 2
+        assert optimizer.eliminated == 0
+
+    def test_merges_cascade(self):
+        rules, optimizer = optimize_lines(['||a.com^$script,domain=x.com', '||a.com^$image,domain=x.com', '||a.com^$script,image,domain=y.com'])
+        assert len(rules) == 1
+        assert rules[0].if_domain == ('*x.com', '*y.com')
+        assert rules[0].resource_type == ('image', 'script')
+
+    def test_different_actions_are_kept(self):
+        rules = [Rule('a', BLOCK), Rule('a', css_display_none('.x')), Rule('a', BLOCK, load_type=THIRD_PARTY), Rule('b', BLOCK, load_type=FIRST_PARTY)]
+        optimized, optimizer = optimize_rules(rules)
+        assert optimized == [Rule('a', BLOCK), Rule('a', css_display_none('.x')), Rule('b', BLOCK, load_type=FIRST_PARTY)]
+
+    def test_rule_from_json(self):
+        for line in ['||a.com^$script,subdocument', '@@||a.com^$image,domain=~x.com', 'x.com,y.com##.ad', '||a.com^$match-case,third-party']:
+            for rule in ab2cb.ab2cb.convert_text(line, False):
+                for strip_whitespace in [False, True]:
+                    fragment = rule.to_json(strip_whitespace)
+                    assert rule_from_json(fragment).to_json(strip_whitespace) == fragment
+
+
+class TestOptimizeOption(object):
+    def test_cli(self, tmpdir, sample):
+        with open(sample) as fp:
+            lines = fp.read()
+        source = tmpdir.join('twice.txt')
+        source.write(lines + lines)
+        plain = str(tmpdir.join('plain.json'))
+        optimized = str(tmpdir.join('optimized.json'))
+        ab2cb.ab2cb.main(['-o', plain, str(source)])
+        ab2cb.ab2cb.main(['-o', optimized, '--optimize', str(source)])
+        with open(plain) as fp:
+            plain_rules = json.load(fp)
+        with open(optimized) as fp:
+            optimized_rules = json.load(fp)
+        assert len(optimized_rules) < len(plain_rules) // 2 + 1
+        assert all(r in plain_rules for r in optimized_rules if 'resource-type' not in r['trigger'])
+
+
+class TestBatchSelectors(object):
+    def batch(self, lines, size):
+        rules = []
+        for line in lines:
+            rules.extend(ab2cb.ab2cb.convert_text(line, False))
+        return optimize_rules(rules, merge=False, batch_selectors=size)
+
+    def test_grouped_by_trigger(self):
+        rules, optimizer = self.batch(['##.a', 'x.com##.b', '##.c', '||a.com^', 'x.com##.d', '##.a'], 10)
+        assert [(r.action.selector, r.if_domain) for r in rules if r.action.selector] == [('.a, .c', None), ('.b, .d', ('x.com',))]
+        assert len(rules) == 3
+        assert (optimizer.batched, optimizer.batches) == (5, 2)
+
+    def test_batch_size(self):
+        rules, optimizer = self.batch(['##.s%d' % i for i in range(7)], 3)
+        assert [r.action.selector for r in rules] == ['.s0, .s1, .s2', '.s3, .s4, .s5', '.s6']
+
+    def test_selector_length_limit(self, monkeypatch):
+        monkeypatch.setattr(ab2cb.optimize, 'max_selector_length', 12)
+        rules, optimizer = self.batch(['##.aaaa', '##.bbbb', '##.cccc'], 10)
+        assert [r.action.selector for r in rules] == ['.aaaa, .bbbb', '.cccc']
+
+    def test_unsafe_selectors_kept_alone(self):
+        rules, optimizer = self.batch(['##.a', '##div:-abp-has(.ad)', '##a[href="x"]', '##.b'], 10)
+        assert [r.action.selector for r in rules] == ['.a, a[href="x"], .b', 'div:-abp-has(.ad)']
+
+    def test_cli(self, tmpdir, sample):
+        plain = str(tmpdir.join('plain.json'))
+        batched = str(tmpdir.join('batched.json'))
+        ab2cb.ab2cb.main(['-o', plain, sample])
+        ab2cb.ab2cb.main(['-o', batched, '--batch-selectors', '50', sample])
+        with open(plain) as fp:
+            plain_rules = json.load(fp)
+        with open(batched) as fp:
+            batched_rules = json.load(fp)
+
+        def selectors(rules):
+            return sorted(s for r in rules if 'selector' in r['action'] for s in r['action']['selector'].split(', '))
+
+        assert selectors(batched_rules) == selectors(plain_rules)
+        assert len(batched_rules) < len(plain_rules)
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import pytest
+import ab2cb.ab2cb
+import ab2cb.parallel
+
+
+def convert(tmpdir, sample, name, extra):
+    output = str(tmpdir.join(name + '.json'))
+    output_rules = str(tmpdir.join(name + '.txt'))
+    ab2cb.ab2cb.main(['-o', output, '--output-rules', output_rules] + extra + [sample, sample])
+    with open(output, 'rb') as fp:
+        out = fp.read()
+    with open(output_rules, 'rb') as fp:
+        lines = fp.read()
+    return out, lines
+
+
+@pytest.mark.parametrize('extra', [[], ['--strip-whitespace'], ['--no-css']])
+class TestParallel(object):
+    def test_byte_identical(self, tmpdir, monkeypatch, sample, extra):
+        # small chunks so the ordering across several tasks is exercised
+        monkeypatch.setattr(ab2cb.parallel, 'chunk_size', 3)
+        serial = convert(tmpdir, sample, 'serial', extra)
+        parallel = convert(tmpdir, sample, 'parallel', ['--jobs', '2'] + extra)
+        assert serial == parallel
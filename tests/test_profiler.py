@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import json
+import pstats
+
+import pytest
+import ab2cb.ab2cb
+
+
+@pytest.mark.parametrize('extra', [[], ['--optimize'], ['--jobs', '2'], ['--cache', 'cache']])
+def test_profile(tmpdir, sample, extra):
+    profile = str(tmpdir.join('profile.json'))
+    output = str(tmpdir.join('out.json'))
+    extra = [str(tmpdir.join(e)) if e == 'cache' else e for e in extra]
+    translate = ab2cb.ab2cb.translate_url_filter
+    ab2cb.ab2cb.main(['-o', output, '--profile', profile, '--profile-lines', '5', sample] + extra)
+    assert ab2cb.ab2cb.translate_url_filter is translate
+
+    with open(profile) as fp:
+        report = json.load(fp)
+    with open(output) as fp:
+        rules = json.load(fp)
+    counts = report['counts']
+    with open(sample) as fp:
+        assert counts['lines'] == len(list(ab2cb.ab2cb.filter_lines(fp)))
+    if not extra:
+        assert counts['block'] + counts['exception'] + counts['element_hiding'] == len(rules)
+        assert counts['element_hiding'] == sum(1 for r in rules if r['action']['type'] == 'css-display-none')
+        assert counts['split'] == 1
+        assert set(report['stages']) >= set(['read', 'parse', 'translate', 'serialize', 'write'])
+    assert report['per_line_timing'] == (extra in ([], ['--optimize']))
+    assert len(report['slowest']) == (5 if report['per_line_timing'] else 0)
+    assert sum(s['wall_seconds'] for s in report['stages'].values()) == pytest.approx(report['wall_seconds'])
+    if extra == ['--optimize']:
+        assert 'optimize' in report['stages']
+
+
+def test_cprofile(tmpdir, sample):
+    stats = str(tmpdir.join('stats'))
+    ab2cb.ab2cb.main(['-o', str(tmpdir.join('out.json')), '--cprofile', stats, sample])
+    assert pstats.Stats(stats).total_calls > 0
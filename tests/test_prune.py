@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import collections
+import io
+import json
+
+import ab2cb.ab2cb
+from ab2cb.prune import select_rules
+from ab2cb.rules import rule_from_dict
+
+rule_dicts = [
+    {'trigger': {'url-filter': '^[^:]+:(//)?([^/]+\\.)?ads\\.com', 'resource-type': ['script']}, 'action': {'type': 'block'}},
+    {'trigger': {'url-filter': '^[^:]+:(//)?([^/]+\\.)?track\\.net', 'resource-type': ['image']}, 'action': {'type': 'block'}},
+    {'trigger': {'url-filter': '/banner/'}, 'action': {'type': 'block'}},
+    {'trigger': {'url-filter': '^[^:]+:(//)?([^/]+\\.)?ads\\.com/ok/', 'resource-type': ['script']}, 'action': {'type': 'ignore-previous-rules'}},
+    {'trigger': {'url-filter': '^[^:]+:(//)?([^/]+\\.)?track\\.net/ok/', 'resource-type': ['image']}, 'action': {'type': 'ignore-previous-rules'}},
+]
+
+
+def test_select_rules():
+    rules = [rule_from_dict(r) for r in rule_dicts]
+    hits = collections.Counter({1: 10, 0: 5})
+    # each block rule needs the exception of its resource-type, /banner/ both
+    assert select_rules(rules, hits, 2) == [1, 4]
+    assert select_rules(rules, hits, 4) == [0, 1, 3, 4]
+    assert select_rules(rules, hits, 5) == [0, 1, 2, 3, 4]
+    assert select_rules(rules, collections.Counter(), 1) == []
+
+
+def test_main(tmpdir):
+    path = tmpdir.join('rules.json')
+    path.write(json.dumps(rule_dicts))
+    output = tmpdir.join('pruned.json')
+    report = tmpdir.join('report.json')
+    log = io.StringIO(''.join([
+        'http://track.net/p.gif a.com image\n' * 3,
+        'http://ads.com/x.js a.com script\n' * 2,
+        'http://track.net/ok/p.gif a.com image\n',
+    ]))
+    err = io.StringIO()
+    argv = ['prune', '--max-rules', '2', '-o', str(output), '--report', str(report), str(path)]
+    assert ab2cb.ab2cb.main(argv, stdin=log, stderr=err) == 0
+    assert json.loads(output.read()) == [rule_dicts[1], rule_dicts[4]]
+    lines = err.getvalue().splitlines()
+    assert lines[0].startswith('Replayed 6 requests (3 unique)')
+    assert lines[1] == 'Kept 2 of 5 rules (1 blocks, 1 exceptions)'
+    assert lines[2] == 'Lost coverage: 2 of 6 requests change decision (33.33%), 2 block -> none'
+    data = json.loads(report.read())
+    assert data['decisions'] == {'block': 5, 'allow': 1}
+    assert data['dropped'][0] == {'rule': 0, 'hits': 2}
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import os.path
+import pickle
+
+import pytest
+import ab2cb.ab2cb
+from ab2cb.cache import decode, encode
+from ab2cb.rejection import Rejection, reasons, rejection
+
+
+@pytest.mark.parametrize('line, no_css, reason', [
+    ('##.ad', True, 'no-css'),
+    ('||a.com^$webrtc', False, 'unknown-option'),
+    ('||a.com^$object', False, 'unsupported-type'),
+    ('$script', False, 'empty-filter'),
+    ('/^https?:\\/\\/a\\.com/', False, 'regex-filter'),
+    ('^', False, 'empty-url-filter'),
+    (u'||münchen.de^', False, 'non-ascii'),
+    (u'||a.com^$domain=a\u0080..b', False, 'bad-domain'),
+    ('||a.com^$domain=x.com|~y.com', False, 'mixed-domains'),
+    ('@@||a.com^$document', False, 'document-exception'),
+])
+def test_reasons(line, no_css, reason):
+    rules = ab2cb.ab2cb.convert_text(line, no_css)
+    assert not rules
+    assert rules is rejection(reason)
+    assert ab2cb.ab2cb.convert_line(line, no_css, False) is rules
+    assert ab2cb.ab2cb.filter_from_text(line, None) is None or no_css
+
+
+class TestRejection(object):
+    def test_shared_and_false(self):
+        assert set(reasons) == set(r.reason for r in map(rejection, reasons))
+        assert not rejection('no-css')
+        assert list(rejection('no-css')) == []
+        assert pickle.loads(pickle.dumps(rejection('non-ascii'))) is rejection('non-ascii')
+        assert isinstance(rejection('regex-filter'), Rejection)
+
+    def test_cache_encoding(self):
+        assert decode(encode(rejection('mixed-domains'))) is rejection('mixed-domains')
+        converted = ab2cb.ab2cb.convert_line('||a.com^', False, False)
+        assert decode(encode(converted)) == converted
+
+
+class TestRejectedOption(object):
+    def test_ledger(self, tmpdir, sample):
+        rejected = str(tmpdir.join('rejected.txt'))
+        ab2cb.ab2cb.main(['-o', str(tmpdir.join('out.json')), '--rejected', rejected, sample])
+        with open(rejected) as fp:
+            lines = fp.read().splitlines()
+        entries = [line.split('\t', 1) for line in lines if not line.startswith('!')]
+        assert ['unknown-option', '||unknown-option.example^$webrtc'] in entries
+        assert all(reason in reasons for reason, line in entries)
+        assert lines[len(entries)] == '! rejected %d lines' % len(entries)
+        assert '! 1 regex-filter' in lines
+
+    def test_all_rejected(self, tmpdir):
+        source = tmpdir.join('source.txt')
+        source.write('/regex/\n||a.com^$webrtc\n')
+        output = str(tmpdir.join('out.json'))
+        rejected = str(tmpdir.join('rejected.txt'))
+        ab2cb.ab2cb.main(['-o', output, '--rejected', rejected, str(source)])
+        assert not os.path.exists(output)
+        with open(rejected) as fp:
+            assert fp.read().splitlines()[:2] == ['regex-filter\t/regex/', 'unknown-option\t||a.com^$webrtc']
+
+    def test_no_lines(self, tmpdir):
+        source = tmpdir.join('source.txt')
+        source.write('! only a comment\n')
+        rejected = tmpdir.join('rejected.txt')
+        ab2cb.ab2cb.main(['-o', str(tmpdir.join('out.json')), '--rejected', str(rejected), str(source)])
+        assert rejected.read().splitlines() == ['! rejected 0 lines']
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import random
+
+import pytest
+import ab2cb.ab2cb
+import ab2cb.rules
+from ab2cb.ab2cb import rule_fragment
+from ab2cb.rules import BLOCK, FIRST_PARTY, IGNORE_PREVIOUS_RULES, THIRD_PARTY, Rule, css_display_none, intern_tuple
+
+
+def random_rule(rng):
+    action = rng.choice([BLOCK, IGNORE_PREVIOUS_RULES, css_display_none(rng.choice(['#ad', 'a[href^="x"]', u'.pé'])),])
+    rule = Rule(rng.choice(['.*', '^[^:]+:(//)?([^/]+\\.)?ads\\.com', 'a"b\\c']), action)
+    rule.case_sensitive = rng.random() < 0.3
+    rule.load_type = rng.choice([None, THIRD_PARTY, FIRST_PARTY])
+    rule.if_domain = rng.choice([None, ('*a.com',), ('*a.com', '*b.org')])
+    if not rule.if_domain:
+        rule.unless_domain = rng.choice([None, ('*c.com', '*d.net')])
+    rule.resource_type = rng.choice([None, ('image',), ('document', 'script', 'raw')])
+    rule.load_type_last = bool(rule.load_type and rule.resource_type and rng.random() < 0.5)
+    return rule
+
+
+@pytest.mark.parametrize('strip_whitespace', [False, True])
+class TestRuleJson(object):
+    def test_matches_json_dumps(self, strip_whitespace):
+        rng = random.Random(42)
+        for i in range(2000):
+            rule = random_rule(rng)
+            assert rule.to_json(strip_whitespace) == rule_fragment(rule.to_dict(), strip_whitespace)
+
+
+class TestRuleModel(object):
+    def test_slots(self):
+        rule = Rule('.*', BLOCK)
+        with pytest.raises(AttributeError):
+            rule.extra = 1
+
+    def test_shared_actions(self):
+        block = ab2cb.ab2cb.convert_text('||a.com^', False)[0]
+        white = ab2cb.ab2cb.convert_text('@@||a.com^', False)[0]
+        assert block.action is BLOCK
+        assert white.action is IGNORE_PREVIOUS_RULES
+
+    def test_interned_domains(self):
+        a = ab2cb.ab2cb.convert_text('||a.com^$domain=x.com|y.com', False)[0]
+        b = ab2cb.ab2cb.convert_text('||b.com^$domain=x.com|y.com', False)[0]
+        assert a.if_domain is b.if_domain
+        assert intern_tuple(['*x.com', '*y.com']) is a.if_domain
+
+    def test_interned_is_bounded(self, monkeypatch):
+        monkeypatch.setattr(ab2cb.rules, 'interned', {})
+        monkeypatch.setattr(ab2cb.rules, 'interned_size', 8)
+        kept = intern_tuple(['*kept.com'])
+        for i in range(100):
+            intern_tuple(['*%d.com' % i])
+        assert len(ab2cb.rules.interned) <= 8
+        assert intern_tuple(['*99.com']) is ab2cb.rules.interned[('*99.com',)]
+        assert intern_tuple(['*kept.com']) == kept
+
+    def test_split_rule_key_order(self):
+        rules = ab2cb.ab2cb.convert_text('||a.com^$script,subdocument', False)
+        assert list(rules[1].to_dict()['trigger']) == ['url-filter', 'resource-type', 'load-type']
+        assert rules[0].resource_type == ('script',)
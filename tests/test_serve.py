@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+import ab2cb.ab2cb
+from ab2cb.send import default_socket, request
+from ab2cb.serve import MemoryCache, Server
+
+
+@pytest.fixture
+def server(tmpdir):
+    server = Server(str(tmpdir.join('ab2cb.sock')), poll=0.05, log=io.StringIO())
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_job(server, tmpdir):
+    tmpdir.join('list.txt').write('||ads.com^\n##.ad\n')
+    job = {'argv': ['--strip-whitespace', 'list.txt'], 'cwd': str(tmpdir)}
+    answer = request(server.path, job)
+    out = io.StringIO()
+    status = ab2cb.ab2cb.main(['--strip-whitespace', str(tmpdir.join('list.txt'))], stdout=out, stderr=io.StringIO())
+    assert answer['exit'] == status
+    assert answer['stdout'] == out.getvalue()
+    assert 'Generated a total of 2 rules' in answer['stderr']
+
+    assert request(server.path, job)['stdout'] == out.getvalue()
+    status = request(server.path, {'status': True})
+    assert status['jobs'] == 2
+    assert status['cache-hits'] == 2
+
+
+def test_jobs_and_cache(server, tmpdir):
+    lines = ['||ads%d.com^' % i for i in range(50)]
+    tmpdir.join('list.txt').write('\n'.join(lines) + '\n')
+    argv = ['--strip-whitespace', '--jobs', '2', '--cache', 'cache', 'list.txt']
+    answer = request(server.path, {'argv': argv, 'cwd': str(tmpdir)})
+    with tmpdir.as_cwd():
+        out = io.StringIO()
+        ab2cb.ab2cb.main(argv, stdout=out, stderr=io.StringIO())
+    assert answer['stdout'] == out.getvalue()
+    assert tmpdir.join('cache', 'ab2cb-cache.sqlite3').check()
+
+    # only lines the server has not seen go through the pool and cache
+    tmpdir.join('list.txt').write('\n'.join(lines + ['||new.com^']) + '\n')
+    request(server.path, {'argv': argv, 'cwd': str(tmpdir)})
+    status = request(server.path, {'status': True})
+    assert status['cache-hits'] == 50
+    assert status['cache-misses'] == 51
+
+
+def test_messages_go_to_the_job(server, tmpdir, capsys):
+    tmpdir.join('list.txt').write('||doc.com^$document,script\n')
+    answer = request(server.path, {'argv': ['--jobs', '2', '--cache', 'cache', 'list.txt'], 'cwd': str(tmpdir)})
+    assert 'Split ||doc.com^$document,script into 2 rules' in answer['stderr']
+    captured = capsys.readouterr()
+    assert 'Split' not in captured.out + captured.err
+
+
+def test_profile(server, tmpdir):
+    tmpdir.join('list.txt').write('||ads.com^\n||b.com/x^\n')
+    translate = ab2cb.ab2cb.translate_url_filter
+    answer = request(server.path, {'argv': ['--profile', 'p.json', 'list.txt'], 'cwd': str(tmpdir)})
+    assert len(json.loads(answer['stdout'])) == 2
+    assert json.loads(tmpdir.join('p.json').read())['counts']['block'] == 2
+    assert ab2cb.ab2cb.translate_url_filter is translate
+
+
+def test_slow_job_does_not_block(server, tmpdir, monkeypatch):
+    release = threading.Event()
+    convert = ab2cb.ab2cb.convert
+
+    def slow(options):
+        if any(path.endswith('slow.txt') for path in options.files):
+            release.wait(10)
+        return convert(options)
+
+    monkeypatch.setattr(ab2cb.ab2cb, 'convert', slow)
+    tmpdir.join('slow.txt').write('||slow.com^\n')
+    tmpdir.join('fast.txt').write('||fast.com^\n')
+    answers = []
+    client = threading.Thread(target=lambda: answers.append(request(server.path, {'argv': ['slow.txt'], 'cwd': str(tmpdir)})))
+    client.start()
+    try:
+        answer = request(server.path, {'argv': ['fast.txt'], 'cwd': str(tmpdir)})
+        assert 'fast' in answer['stdout']
+        assert not answers
+    finally:
+        release.set()
+        client.join(10)
+    assert 'slow' in answers[0]['stdout']
+
+
+def test_memory_evicts_the_oldest_lines():
+    memory = MemoryCache(size=8)
+    convert = ab2cb.ab2cb.iter_converted
+    lines = ['||ads%d.com^' % i for i in range(9)]
+    list(memory.convert(lines, False, True, lambda misses: convert(misses, False, True)))
+    assert len(memory.lines) == 7
+    assert (False, True, lines[8]) in memory.lines
+    assert (False, True, lines[0]) not in memory.lines
+    assert (False, True, lines[2]) in memory.lines
+
+
+def test_memory_counts_concurrent_jobs():
+    memory = MemoryCache()
+    convert = ab2cb.ab2cb.iter_converted
+    lines = ['||ads%d.com^' % i for i in range(2000)]
+
+    def job():
+        list(memory.convert(lines, False, True, lambda misses: convert(misses, False, True)))
+
+    threads = [threading.Thread(target=job) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert memory.hits + memory.misses == 8 * len(lines)
+    assert len(memory.lines) == len(lines)
+
+
+def test_default_socket(tmpdir, monkeypatch):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmpdir))
+    assert default_socket() == str(tmpdir.join('ab2cb.sock'))
+    monkeypatch.delenv('XDG_RUNTIME_DIR')
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmpdir))
+    path = default_socket()
+    assert os.stat(os.path.dirname(path)).st_mode & 0o777 == 0o700
+    os.chmod(os.path.dirname(path), 0o777)
+    with pytest.raises(OSError):
+        default_socket()
+
+
+def test_stdin_and_errors(server, tmpdir):
+    answer = request(server.path, {'argv': ['--strip-whitespace'], 'cwd': str(tmpdir), 'stdin': '||a.com^\n'})
+    assert json.loads(answer['stdout'])[0]['action']['type'] == 'block'
+    answer = request(server.path, {'argv': ['--cprofile', 'p.pstats'], 'cwd': str(tmpdir)})
+    assert answer['exit'] == 2
+    assert '--cprofile' in answer['stderr']
+    answer = request(server.path, {'argv': ['--watch-me'], 'cwd': str(tmpdir)})
+    assert answer['exit'] == 2
+    answer = request(server.path, {'watch': True, 'argv': ['list.txt'], 'cwd': str(tmpdir)})
+    assert answer['stderr'] == 'watched jobs need --output\n'
+
+
+def test_watch(server, tmpdir):
+    source = tmpdir.join('list.txt')
+    source.write('||ads.com^\n')
+    output = tmpdir.join('out.json')
+    answer = request(server.path, {'watch': True, 'argv': ['-o', 'out.json', 'list.txt'], 'cwd': str(tmpdir)})
+    assert 'Generated a total of 1 rules' in answer['stdout']
+    assert len(json.loads(output.read())) == 1
+
+    source.write('||ads.com^\n||tracker.net^\n')
+    os.utime(str(source), (time.time() + 10, time.time() + 10))
+    for i in range(100):
+        time.sleep(0.05)
+        # the log is written once the output is
+        if 'exit' in server.log.getvalue():
+            break
+    assert len(json.loads(output.read())) == 2
+    assert 'exit' in server.log.getvalue()
+
+
+def test_send(server, tmpdir):
+    tmpdir.join('list.txt').write('||ads.com^\n')
+    out = io.StringIO()
+    err = io.StringIO()
+    with tmpdir.as_cwd():
+        status = ab2cb.ab2cb.main(['send', '--socket', server.path, '--', '--strip-whitespace', 'list.txt'], stdout=out, stderr=err)
+        assert status == ab2cb.ab2cb.main(['--strip-whitespace', 'list.txt'], stdout=io.StringIO(), stderr=io.StringIO())
+    assert json.loads(out.getvalue())[0]['trigger']['url-filter'].endswith('ads\\.com')
+    assert ab2cb.ab2cb.main(['send', '--socket', str(tmpdir.join('none.sock')), 'list.txt'], stderr=err) == 2
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import json
+
+import pytest
+import ab2cb.ab2cb
+from ab2cb.shard import Trigger, plan_shards, url_prefix
+
+
+def rules_for(lines):
+    rules = []
+    for line in lines:
+        rules.extend(ab2cb.ab2cb.convert_text(line, False) or [])
+    return rules
+
+
+def trigger(line):
+    return Trigger(ab2cb.ab2cb.convert_text(line, False)[0])
+
+
+class TestOverlap(object):
+    def test_url_prefix(self):
+        assert url_prefix(ab2cb.ab2cb.convert_text('||a.com/ads/', False)[0].url_filter) == ('host', 'a.com', '/ads/')
+        assert url_prefix(ab2cb.ab2cb.convert_text('||a.com^', False)[0].url_filter) is None
+        assert url_prefix(ab2cb.ab2cb.convert_text('|http://a.com/x*y', False)[0].url_filter) == ('start', 'http://a.com/x')
+        assert url_prefix(ab2cb.ab2cb.convert_text('ads/', False)[0].url_filter) is None
+
+    @pytest.mark.parametrize('block, exception', [
+        ('||a.com^', '@@||a.com^'),
+        ('||a.com^', '@@||b.com^'),
+        ('||a.com/x/', '@@||b.a.com/'),
+        ('||a.com^$image', '@@||a.com^$image,script'),
+        ('||a.com^$domain=x.com', '@@||a.com^$domain=y.x.com'),
+        ('||a.com^$domain=~x.com', '@@||a.com^$domain=y.com'),
+        ('||a.com^$third-party', '@@||a.com^'),
+        ('##.ad', '@@||a.com^$script'),
+    ])
+    def test_may_overlap(self, block, exception):
+        assert trigger(exception).may_overlap(trigger(block))
+
+    @pytest.mark.parametrize('block, exception', [
+        ('||a.com/x/', '@@||b.com/'),
+        ('||a.com/x/', '@@||a.com/y/'),
+        ('|http://a.com/', '@@|https://a.com/'),
+        ('||a.com^$image', '@@||a.com^$script'),
+        ('||a.com^$domain=x.com', '@@||a.com^$domain=y.com'),
+        ('||a.com^$domain=~x.com', '@@||a.com^$domain=x.com'),
+        ('||a.com^$third-party', '@@||a.com^$~third-party'),
+    ])
+    def test_disjoint(self, block, exception):
+        assert not trigger(exception).may_overlap(trigger(block))
+
+
+class TestPlan(object):
+    def test_exceptions_follow_blocks(self):
+        rules = rules_for(['||a.com/%d/' % i for i in range(10)] + ['@@||a.com/5/', '@@||a.com/x/', '@@||b.com^$image'])
+        shards, exceptions, unused = plan_shards(rules, 4)
+        # @@||b.com^ may match inside any url, @@||a.com/5/ only the fifth rule
+        assert [len(s.blocks) for s in shards] == [3, 2, 2, 3]
+        assert [len(s.needed) for s in shards] == [1, 1, 2, 1]
+        assert unused == 1
+
+    def test_every_overlapping_exception_is_kept(self, sample):
+        with open(sample) as fp:
+            rules = rules_for(ab2cb.ab2cb.filter_lines(fp))
+        for strategy in ['sequential', 'category', 'specificity']:
+            shards, exceptions, unused = plan_shards(rules, 12, strategy)
+            assert sum(len(s.blocks) for s in shards) == sum(1 for r in rules if not r.is_exception)
+            for shard in shards:
+                for key, group in exceptions:
+                    overlap = any(Trigger(group[0]).may_overlap(Trigger(b)) for b in shard.blocks)
+                    assert overlap == (key in shard.needed)
+
+    def test_strategies_keep_kinds_apart(self, sample):
+        with open(sample) as fp:
+            rules = rules_for(ab2cb.ab2cb.filter_lines(fp))
+        shards, exceptions, unused = plan_shards(rules, 1000, 'category')
+        assert [s.kind for s in shards] == ['network', 'css']
+        assert all(b.action.type == 'css-display-none' for b in shards[1].blocks)
+        shards, exceptions, unused = plan_shards(rules, 1000, 'specificity')
+        assert [s.kind for s in shards] == ['generic', 'specific']
+
+
+class TestShardOption(object):
+    def test_cli(self, tmpdir, sample):
+        output = str(tmpdir.join('blockList.json'))
+        ab2cb.ab2cb.main(['-o', output, '--max-rules-per-file', '15', sample])
+        with open(str(tmpdir.join('blockList-manifest.json'))) as fp:
+            manifest = json.load(fp)
+        assert manifest['max-rules-per-file'] == 15
+        assert len(manifest['shards']) > 1
+        blocks = 0
+        for entry in manifest['shards']:
+            with open(str(tmpdir.join(entry['file']))) as fp:
+                rules = json.load(fp)
+            assert len(rules) == entry['rules'] <= 15
+            blocks += entry['blocks']
+        with open(sample) as fp:
+            assert blocks == sum(1 for r in rules_for(ab2cb.ab2cb.filter_lines(fp)) if not r.is_exception)
+
+    def test_needs_output(self):
+        with pytest.raises(SystemExit):
+            ab2cb.ab2cb.main(['--max-rules-per-file', '15'])
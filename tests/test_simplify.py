@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import json
+import random
+import re
+
+import pytest
+import ab2cb.ab2cb
+from ab2cb.simplify import format_url_filter, simplify_rules, simplify_url_filter
+from ab2cb.rules import rule_from_dict
+from ab2cb.urlfilter import parse
+
+examples = [
+    ('/promo/.*', '/promo/'),
+    ('.*ab', 'ab'),
+    ('^.*ab', 'ab'),
+    ('ab.*$', 'ab'),
+    ('a.*.*b', 'a.*b'),
+    ('a.*.+b', 'a.+b'),
+    ('(ab)c', 'abc'),
+    ('x(ab)+', 'xab'),
+    ('a+b+', 'ab'),
+    ('^(a)+$', '^a+$'),
+    ('x.+$', 'x.'),
+    ('a?', '.*'),
+    ('^https?://a\\.com/.*', '^https?://a\\.com/'),
+    # nothing to simplify
+    ('^a?$', '^a?$'),
+    ('^$', '^$'),
+    ('.*', '.*'),
+    ('^[^:]+:(//)?([^/]+\\.)?ads\\.com', '^[^:]+:(//)?([^/]+\\.)?ads\\.com'),
+    ('[a-z', '[a-z'),
+]
+
+
+@pytest.mark.parametrize('url_filter,expected', examples)
+def test_simplify_url_filter(url_filter, expected):
+    assert simplify_url_filter(url_filter) == expected
+
+
+def test_same_urls_match():
+    rng = random.Random(0)
+    for url_filter, simplified in examples[:-1]:
+        for i in range(500):
+            url = ''.join(rng.choice('abx./:') for n in range(rng.randint(0, 8)))
+            assert bool(re.search(url_filter, url)) == bool(re.search(simplified, url)), (url_filter, url)
+
+
+def test_format_url_filter():
+    assert format_url_filter(parse('^a\\.b(cd)?x*$')) == '^a\\.b(cd)?x*$'
+    for url_filter in ['[^/\\]-]+', '[\\^a-c]\\$', '[-a]']:
+        parsed = parse(url_filter)
+        assert parse(format_url_filter(parsed)) == parsed
+
+
+def test_simplify_rules():
+    rules = [rule_from_dict(r) for r in [
+        {'trigger': {'url-filter': '/ads/.*'}, 'action': {'type': 'block'}},
+        {'trigger': {'url-filter': 'a.*.*b'}, 'action': {'type': 'block'}},
+        {'trigger': {'url-filter': '/ads/'}, 'action': {'type': 'block'}},
+    ]]
+    simplified, simplifier = simplify_rules(rules)
+    assert [r.url_filter for r in simplified] == ['/ads/', 'a.*b', '/ads/']
+    assert simplifier.simplified == 2
+    assert simplifier.characters == 4
+    assert simplifier.summary().startswith('Simplified 2 url-filters, 4 characters')
+
+
+def test_main(tmpdir):
+    source = tmpdir.join('list.txt')
+    source.write('/promo/*\n||ads.com^\n')
+    output = tmpdir.join('out.json')
+    simplified = tmpdir.join('simplified.txt')
+    ab2cb.ab2cb.main(['--simplified', str(simplified), '-o', str(output), str(source)])
+    assert [r['trigger']['url-filter'] for r in json.loads(output.read())] == [
+        '/promo/', '^[^:]+:(//)?([^/]+\\.)?ads\\.com']
+    lines = simplified.read().splitlines()
+    assert lines[0] == '2\t0\t/promo/.*\t/promo/'
+    assert lines[1].startswith('! Simplified 1 url-filters')
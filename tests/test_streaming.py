@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import io
+
+import ab2cb.ab2cb
+from ab2cb.options import parse_opts
+
+
+class LazyInput(object):
+    def __init__(self, lines):
+        self.lines = lines
+        self.served = 0
+
+    def __iter__(self):
+        for line in self.lines:
+            self.served += 1
+            yield line + '\n'
+
+    def readlines(self):
+        raise AssertionError('input must not be read in one go')
+
+
+class TestStreaming(object):
+    lines = ['||ads%d.example.com^' % i for i in range(50)]
+
+    def test_lines_are_pulled_lazily(self):
+        stdin = LazyInput(self.lines)
+        options = parse_opts([], stdin=stdin)
+        results = ab2cb.ab2cb.ab2cb_fp(options, stdin)
+        for i, (line, fragments) in enumerate(results):
+            assert line == self.lines[i]
+            assert stdin.served == i + 1
+
+    def test_output_rules(self, tmpdir):
+        rules_path = str(tmpdir.join('rules.txt'))
+        ab2cb.ab2cb.main(['-o', str(tmpdir.join('out.json')), '--output-rules', rules_path], stdin=LazyInput(self.lines))
+        with open(rules_path) as fp:
+            assert fp.read().splitlines() == self.lines
+
+
+class TestMappedInput(object):
+    def mapped_lines(self, tmpdir, data):
+        path = tmpdir.join('filters.txt')
+        path.write_binary(data)
+        with open(str(path), 'rb') as fp:
+            mapped = ab2cb.ab2cb.map_file(fp)
+            if mapped is None:
+                return None
+            try:
+                return list(ab2cb.ab2cb.filter_mapped(mapped))
+            finally:
+                mapped.close()
+
+    def text_lines(self, data):
+        return list(ab2cb.ab2cb.filter_lines(io.StringIO(data.decode('utf-8'), newline=None)))
+
+    def test_same_lines_as_text(self, tmpdir, monkeypatch):
+        data = (u'[Adblock Plus 2.0]\r\n! Title: x\r\n||a.com^\r\n  ! indented\n\t[x]\n'
+                u'\u3000! wide space\n ||b.com^ \n\r\n##.ad\r! after lone cr\r||c.com^\n!last').encode('utf-8')
+        cases = [
+            (data, ['||a.com^', '||b.com^', '##.ad', '||c.com^']),
+            # comments ending in a lone \r
+            (b'x\n[hdr]\r||d.com^\n', ['x', '||d.com^']),
+            (b'||a.com^\n! c\r||c.com^\n', ['||a.com^', '||c.com^']),
+            (b'! c\r\n||e.com^\r\n', ['||e.com^']),
+        ]
+        for data, expected in cases:
+            assert self.text_lines(data) == expected
+            for size in (1, 7, 1 << 20):
+                monkeypatch.setattr(ab2cb.ab2cb, 'map_chunk_size', size)
+                assert self.mapped_lines(tmpdir, data) == expected
+
+    def test_comments_are_not_decoded(self, tmpdir):
+        assert self.mapped_lines(tmpdir, b'! caf\xe9\n||a.com^\n[\xff]\n') == ['||a.com^']
+
+    def test_empty_file(self, tmpdir):
+        assert self.mapped_lines(tmpdir, b'') is None
+        path = tmpdir.join('empty.txt')
+        path.write_binary(b'')
+        options = parse_opts([str(path)])
+        assert list(ab2cb.ab2cb.ab2cb_file(options, str(path))) == []
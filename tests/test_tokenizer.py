@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import random
+import time
+
+import pytest
+from ab2cb.ab2cb import elemhideRegExp, optionsRegExp
+from ab2cb.tokenizer import split_elemhide, split_options
+
+
+lines = [
+    '###A9AdsMiddleBoxTop',
+    'thedailygreen.com#@##AD_banner',
+    'santander.co.uk#@#a[href^="http://ad-emea.doubleclick.net/"]',
+    'example.com#div(id=ad)(class^=banner)',
+    'example.com#@#*(title$=x)',
+    'a#b#c##.d',
+    '||example.com/#anchor',
+    '||example.com^$third-party,domain=a.com|~b.com',
+    '||example.com^$domain=a.com$b,image',
+    '@@||example.com^$~third-party,xmlhttprequest',
+    '/ads$/$script',
+    'ads$=x',
+    'ads$image, script',
+]
+
+
+def regex_groups(text):
+    match = elemhideRegExp.search(text)
+    return match.groups() if match else None
+
+
+def regex_options(text):
+    match = optionsRegExp.search(text)
+    return match.group(1) if match else None
+
+
+@pytest.mark.parametrize('line', lines)
+class TestTokenizer(object):
+    def test_elemhide(self, line):
+        assert split_elemhide(line) == regex_groups(line)
+
+    def test_options(self, line):
+        assert split_options(line) == regex_options(line)
+
+
+@pytest.mark.parametrize('alphabet', [
+    '#@ab-_(=)$^*"{}!/|,~ \té.',
+    'a$=,~ ',
+    'a#@(=)*$^"',
+    'a#{}@',
+])
+class TestTokenizerFuzz(object):
+    def test_parity(self, alphabet):
+        rng = random.Random(alphabet)
+        for i in range(20000):
+            text = ''.join(rng.choice(alphabet) for j in range(rng.randint(0, 14)))
+            assert split_elemhide(text) == regex_groups(text), text
+            assert split_options(text) == regex_options(text), text
+
+
+class TestHostileLines(object):
+    # these take minutes with the regexes
+    @pytest.mark.parametrize('line', [
+        '#' * 100000 + '{',
+        '$a=' * 30000 + ',,',
+        '#a' * 50000 + '!',
+    ])
+    def test_bounded(self, line):
+        start = time.perf_counter()
+        split_elemhide(line)
+        split_options(line)
+        assert time.perf_counter() - start < 2.0
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import random
+
+import pytest
+from ab2cb.ab2cb import reference_url_filter, translate_url_filter
+
+
+sources = [
+    '',
+    '|',
+    '||',
+    '^|',
+    '|^|',
+    '*',
+    '***',
+    'ad_box_',
+    'doubleclick.net',
+    'anet*.tradedoubler.com',
+    'bet365.com^*affiliate=',
+    'ad4.liverail.com/?compressed|',
+    'http://ad.example.com/|',
+    '|http://ad.example.com/',
+    '/banner/*/img',
+    '*/ads/*',
+    '.*',
+    'a\\*b',
+    '\\|',
+    '$[x](y){z}+?',
+]
+
+
+@pytest.mark.parametrize('source', sources)
+class TestTranslate(object):
+    def test_parity(self, source):
+        assert translate_url_filter(source) == reference_url_filter(source)
+
+
+class TestTranslateFuzz(object):
+    def test_parity(self):
+        rng = random.Random(1234)
+        alphabet = 'ab.*|^$\\+?{}()[]/:-='
+        for i in range(20000):
+            source = ''.join(rng.choice(alphabet) for j in range(rng.randint(0, 10)))
+            assert translate_url_filter(source) == reference_url_filter(source), source
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import io
+import json
+
+import pytest
+import ab2cb.ab2cb
+import ab2cb.rulefile
+import ab2cb.validate
+from ab2cb.rulefile import RuleFileError, iter_json_array
+from ab2cb.urlfilter import UrlFilterError, check, parse
+from ab2cb.validate import check_rule, validate_file
+
+
+@pytest.mark.parametrize('pattern', [
+    '.*',
+    '^https?://([^/]+\\.)?a\\.com[/:?]',
+    '^[^:]+:(//)?([^/]+\\.)?a\\.com[^a-z0-9_.%-]',
+    'ads[-_]?banner$',
+    '[a-z0-9]+\\.js',
+    '\\^',
+])
+def test_accepted(pattern):
+    assert check(pattern) is None
+
+
+@pytest.mark.parametrize('pattern, message', [
+    ('', 'empty url-filter'),
+    ('a|b', 'alternation'),
+    ('a{2}', 'quantifier ranges'),
+    ('(a)\\1', 'backreferences'),
+    ('\\d+', '\\d escapes'),
+    ('(?:a)', '(? groups'),
+    ('a*?', 'quantifier after a quantifier'),
+    ('a^b', '^ is only allowed'),
+    ('a$b', '$ is only allowed'),
+    (u'münchen', 'non-ascii'),
+    ('(ab', 'unclosed group'),
+    ('ab)', 'unbalanced'),
+    ('[ab', 'unclosed character set'),
+    ('[z-a]', 'out of order'),
+])
+def test_rejected(pattern, message):
+    assert message in check(pattern)
+    with pytest.raises(UrlFilterError):
+        parse(pattern)
+
+
+def test_parse():
+    f = parse('^a.[^b-c]?$')
+    assert f.anchored_start and f.anchored_end
+    assert f.terms == (('char', 'a'), ('any',), ('repeat', ('set', True, (('b', 'c'),)), 0, 1))
+
+
+def test_iter_json_array(monkeypatch):
+    rules = [{'trigger': {'url-filter': 'a%d' % i}, 'action': {'type': 'block'}} for i in range(50)] + [1234567, True, 'x']
+    text = json.dumps(rules, indent=2)
+    monkeypatch.setattr(ab2cb.rulefile, 'read_size', 7)
+    assert list(iter_json_array(io.StringIO(text))) == rules
+    assert list(iter_json_array(io.StringIO(' [ ] '))) == []
+    for bad in ['{}', '[1 2]', '[1,', '[{"a": }]']:
+        with pytest.raises(RuleFileError):
+            list(iter_json_array(io.StringIO(bad)))
+
+
+@pytest.mark.parametrize('rule, message', [
+    ([], 'rule must be an object'),
+    ({'trigger': {'url-filter': 'a'}}, 'needs a trigger and an action'),
+    ({'trigger': {}, 'action': {'type': 'block'}}, 'needs a url-filter'),
+    ({'trigger': {'url-filter': 'a', 'if-domain': []}, 'action': {'type': 'block'}}, 'if-domain must be a non-empty array'),
+    ({'trigger': {'url-filter': 'a', 'if-domain': ['A.com']}, 'action': {'type': 'block'}}, 'lower case ascii: A.com'),
+    ({'trigger': {'url-filter': 'a', 'if-domain': ['a'], 'unless-domain': ['b']}, 'action': {'type': 'block'}}, 'only one of if-domain, unless-domain'),
+    ({'trigger': {'url-filter': 'a', 'resource-type': ['object']}, 'action': {'type': 'block'}}, 'unknown resource-type object'),
+    ({'trigger': {'url-filter': 'a', 'url-filter-is-case-sensitive': 1}, 'action': {'type': 'block'}}, 'true or false'),
+    ({'trigger': {'url-filter': 'a', 'domain': ['a']}, 'action': {'type': 'block'}}, 'unknown trigger field domain'),
+    ({'trigger': {'url-filter': 'a'}, 'action': {'type': 'hide'}}, "unknown action type 'hide'"),
+    ({'trigger': {'url-filter': 'a'}, 'action': {'type': 'css-display-none'}}, 'needs a selector'),
+    ({'trigger': {'url-filter': 'a'}, 'action': {'type': 'block', 'selector': '.a'}}, 'only allowed with css-display-none'),
+])
+def test_check_rule(rule, message):
+    assert any(message in error for error in check_rule(rule))
+
+
+def test_converted_sample_is_valid(sample, tmpdir):
+    output = str(tmpdir.join('rules.json'))
+    ab2cb.ab2cb.main(['-o', output, sample])
+    count, errors = validate_file(output)
+    assert count == 38
+    assert errors == []
+
+
+def test_main(tmpdir):
+    rules = [
+        {'trigger': {'url-filter': 'a|b'}, 'action': {'type': 'block'}},
+        {'trigger': {'url-filter': '.*'}, 'action': {'type': 'block'}},
+        {'trigger': {'url-filter': 'a|b'}, 'action': {'type': 'hide'}},
+    ]
+    path = tmpdir.join('rules.json')
+    path.write(json.dumps(rules))
+    out = io.StringIO()
+    assert ab2cb.ab2cb.main(['validate', str(path)], stdout=out) == 1
+    lines = out.getvalue().splitlines()
+    assert lines[0] == '%s: rule 0: url-filter a|b: alternation is not supported at position 1' % path
+    assert lines[-1] == '%s: 3 rules, 2 invalid' % path
+    assert len(lines) == 4
+
+    out = io.StringIO()
+    assert ab2cb.ab2cb.main(['validate', '--max-errors', '1', str(path)], stdout=out) == 1
+    assert '... and 2 more errors' in out.getvalue()
+
+    path.write('[{"trigger": ')
+    err = io.StringIO()
+    assert ab2cb.ab2cb.main(['validate', str(path)], stdout=io.StringIO(), stderr=err) == 2
+    assert 'invalid json' in err.getvalue() or 'unterminated' in err.getvalue()
+
+
+def test_main_jobs(tmpdir, monkeypatch):
+    monkeypatch.setattr(ab2cb.validate, 'chunk_size', 2)
+    rules = [{'trigger': {'url-filter': 'a%d|b' % i if i % 2 else 'x%d' % i}, 'action': {'type': 'block'}} for i in range(10)]
+    path = tmpdir.join('rules.json')
+    path.write(json.dumps(rules))
+    out = io.StringIO()
+    assert ab2cb.ab2cb.main(['validate', '-j', '2', str(path)], stdout=out) == 1
+    assert out.getvalue().splitlines()[-1] == '%s: 10 rules, 5 invalid' % path
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import json
+import pytest
+from io import StringIO
+
+from ab2cb.ab2cb import rule_fragment
+from ab2cb.writer import RuleWriter
+
+
+block = {'trigger': {'url-filter': 'ads'}, 'action': {'type': 'block'}}
+hide = {'trigger': {'url-filter': '.*', 'if-domain': ['a.com']}, 'action': {'type': 'css-display-none', 'selector': '.ad'}}
+white = {'trigger': {'url-filter': 'ok'}, 'action': {'type': 'ignore-previous-rules'}}
+
+
+@pytest.mark.parametrize('rules', [
+    [],
+    [block],
+    [white],
+    [block, hide],
+    [white, block, white, hide],
+    [white, white],
+])
+@pytest.mark.parametrize('strip_whitespace', [False, True])
+class TestRuleWriter(object):
+    def test_matches_json_dump(self, rules, strip_whitespace):
+        fp = StringIO()
+        writer = RuleWriter(fp, strip_whitespace)
+        for r in rules:
+            writer.add(r['action']['type'] == 'ignore-previous-rules', rule_fragment(r, strip_whitespace))
+        writer.close()
+
+        ordered = [r for r in rules if r is not white] + [r for r in rules if r is white]
+        if strip_whitespace:
+            expected = json.dumps(ordered, separators=(',', ':'))
+        else:
+            expected = json.dumps(ordered, indent=4)
+        assert fp.getvalue() == expected
+        assert writer.total == len(rules)